@@ -0,0 +1,22 @@
+"""
+Admin URLs, included lazily by backend/urls.py.
+
+The admin app is installed with SimpleAdminConfig, so `admin.py` modules are
+only discovered here, the first time an /admin/ URL is resolved.
+"""
+from django.contrib import admin
+from django.urls import path
+
+from backend import profiling_admin
+
+admin.autodiscover()
+
+urlpatterns = [
+    # Request profiles (backend/profiling.py), staff only
+    path("profiles/", admin.site.admin_view(profiling_admin.report_list), name="profiling_reports"),
+    path("profiles/<str:name>/", admin.site.admin_view(profiling_admin.report_detail), name="profiling_report"),
+    path(
+        "profiles/<str:name>/<str:kind>", admin.site.admin_view(profiling_admin.report_file),
+        name="profiling_report_file",
+    ),
+] + admin.site.get_urls()
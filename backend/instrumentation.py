@@ -0,0 +1,214 @@
+"""
+Per-request and per-GraphQL-operation performance instrumentation.
+
+SQL is measured by an execute wrapper installed on every database connection.
+The wrapper records into the collectors active in the current context (a
+ContextVar, which `sync_to_async` copies into its worker thread), so queries
+are attributed correctly under both WSGI and ASGI.
+
+- `instrumentation_middleware` covers every Django view (DRF, HTML, GraphQL):
+  it logs one structured line per request and adds a `Server-Timing` header.
+- `QueryInstrumentationExtension` covers GraphQL operations: it logs one line
+  per operation with resolver timings, and optionally returns them in the
+  response under `extensions.tracing`. Only fields with a resolver of their
+  own are timed; wrapping every scalar of a large list would cost more than
+  the attribute reads it measures.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from inspect import isawaitable
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils.decorators import sync_and_async_middleware
+from strawberry.extensions import SchemaExtension
+from strawberry.extensions.tracing.utils import should_skip_tracing
+
+logger = logging.getLogger(__name__)
+
+_active_stats = ContextVar("active_stats", default=())
+
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_ms = 0.0
+
+    def record(self, sql, duration_ms, many):
+        self.sql_count += 1
+        self.sql_ms += duration_ms
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def as_dict(self):
+        return {
+            "duration_ms": round(self.elapsed_ms(), 2),
+            "sql_count": self.sql_count,
+            "sql_ms": round(self.sql_ms, 2),
+        }
+
+
+def _record_sql(execute, sql, params, many, context):
+    active = _active_stats.get()
+    if not active:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = (time.perf_counter() - start) * 1000
+        for stats in active:
+            stats.record(sql, duration, many)
+
+
+def _install_wrapper(connection, **kwargs):
+    if _record_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_sql)
+
+
+connection_created.connect(_install_wrapper)
+for _connection in connections.all(initialized_only=True):
+    _install_wrapper(_connection)
+
+
+def _start(stats):
+    return _active_stats.set(_active_stats.get() + (stats,))
+
+
+@contextmanager
+def collecting(stats):
+    """Also records the SQL run in this context into `stats` (a RequestStats)."""
+    token = _start(stats)
+    try:
+        yield stats
+    finally:
+        _active_stats.reset(token)
+
+
+@sync_and_async_middleware
+def instrumentation_middleware(get_response):
+    if not getattr(settings, "INSTRUMENTATION_ENABLED", True):
+        return get_response
+
+    def finish(request, response, stats):
+        match = getattr(request, "resolver_match", None)
+        data = {
+            "method": request.method,
+            "path": request.path,
+            "route": match.view_name if match else None,
+            "status": response.status_code,
+            **stats.as_dict(),
+        }
+        logger.info("request %s", json.dumps(data))
+        response["Server-Timing"] = (
+            f'db;dur={data["sql_ms"]};desc="{data["sql_count"]} queries", '
+            f'total;dur={data["duration_ms"]}'
+        )
+        return response
+
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            stats = RequestStats()
+            token = _start(stats)
+            try:
+                response = await get_response(request)
+            finally:
+                _active_stats.reset(token)
+            return finish(request, response, stats)
+    else:
+        def middleware(request):
+            stats = RequestStats()
+            token = _start(stats)
+            try:
+                response = get_response(request)
+            finally:
+                _active_stats.reset(token)
+            return finish(request, response, stats)
+
+    return middleware
+
+
+class QueryInstrumentationExtension(SchemaExtension):
+    """
+    Records duration, SQL count/time and per-field resolver timings for each
+    GraphQL operation. Fields resolved by reading an attribute (and
+    introspection) aren't timed. Resolver timings are aggregated by
+    `Type.field`; async resolvers overlap, so `max_ms` is usually more telling
+    than `total_ms`. Set `INSTRUMENTATION_TRACING_IN_RESPONSE = True` to return
+    them in `extensions.tracing`.
+    """
+
+    def __init__(self, *, execution_context=None):
+        self.stats = None
+        self.resolvers = defaultdict(lambda: [0, 0.0, 0.0])
+        self._timed_fields = {}
+
+    def on_operation(self):
+        self.stats = RequestStats()
+        token = _start(self.stats)
+        try:
+            yield
+        finally:
+            _active_stats.reset(token)
+        data = {
+            "operation": self.execution_context.operation_name or "anonymous",
+            **self.stats.as_dict(),
+            "slowest_resolvers": self._slowest_resolvers(5),
+        }
+        logger.info("graphql %s", json.dumps(data))
+
+    def _record(self, info, start):
+        duration = (time.perf_counter() - start) * 1000
+        timing = self.resolvers[f"{info.parent_type.name}.{info.field_name}"]
+        timing[0] += 1
+        timing[1] += duration
+        timing[2] = max(timing[2], duration)
+
+    def _timed(self, info):
+        key = (info.parent_type.name, info.field_name)
+        timed = self._timed_fields.get(key)
+        if timed is None:
+            timed = self._timed_fields[key] = not should_skip_tracing(None, info)
+        return timed
+
+    def resolve(self, _next, root, info, *args, **kwargs):
+        if not self._timed(info):
+            return _next(root, info, *args, **kwargs)
+        start = time.perf_counter()
+        result = _next(root, info, *args, **kwargs)
+        if isawaitable(result):
+            async def await_result():
+                try:
+                    return await result
+                finally:
+                    self._record(info, start)
+            return await_result()
+        self._record(info, start)
+        return result
+
+    def _slowest_resolvers(self, limit=None):
+        timings = sorted(self.resolvers.items(), key=lambda item: item[1][2], reverse=True)
+        return [
+            {"field": field, "count": count, "total_ms": round(total_ms, 2), "max_ms": round(max_ms, 2)}
+            for field, (count, total_ms, max_ms) in timings[:limit]
+        ]
+
+    def get_results(self):
+        # stats is None when an earlier extension rejected the operation before it started
+        if self.stats is None or not getattr(settings, "INSTRUMENTATION_TRACING_IN_RESPONSE", False):
+            return {}
+        return {
+            "tracing": {
+                "operation": self.execution_context.operation_name,
+                **self.stats.as_dict(),
+                "resolvers": self._slowest_resolvers(),
+            }
+        }
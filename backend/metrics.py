@@ -0,0 +1,417 @@
+"""
+Prometheus metrics, served in the text exposition format at /metrics.
+
+- `http_requests_total`, `http_request_duration_seconds` and
+  `http_request_db_queries` (SQL statements per request), labeled by route:
+  the URL name (the view name for unnamed URLs, "unmatched" for 404s).
+- `graphql_operations_total`, `graphql_operation_duration_seconds` and
+  `graphql_operation_db_queries`, labeled by operation name ("anonymous"
+  without one; names past `METRICS_MAX_OPERATIONS` are counted as "other").
+- `http_requests_in_flight`.
+- `cache_requests_total{cache, result}` for the catalog, JWT, price,
+  persisted query and GraphQL document caches. The hit ratio is
+  `rate(...{result="hit"}) / rate(...)` in PromQL.
+- `db_connections_created_total`, `db_connections_open`, and the psycopg
+  pool's size, idle connections and waiting requests when it is enabled.
+
+Recording never takes a lock: every thread increments its own dict, and the
+dicts are only summed when scraped. Coroutines of one event loop share their
+thread's dict, which is safe as no update awaits halfway through. A thread's
+dict is added to the retired totals when the thread exits.
+
+/metrics is served to scrapers sending `Authorization: Bearer <METRICS_TOKEN>`
+when that's set, otherwise only to staff users, or to anyone with DEBUG on.
+
+Each process keeps its own numbers. With several worker processes on a host,
+set `METRICS_MULTIPROCESS_DIR` (wiped on every deploy): each process then
+writes its numbers to `<pid>.json` in it at most every
+`METRICS_FLUSH_INTERVAL` seconds (and on exit), and /metrics sums the files,
+skipping the gauges of processes that are gone. Counters of exited processes
+are kept, as Prometheus expects. Gauges lag by up to the flush interval.
+"""
+import asyncio
+import atexit
+import json
+import math
+import os
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+from django.utils.decorators import sync_and_async_middleware
+from strawberry.extensions import SchemaExtension
+
+from backend.instrumentation import RequestStats, collecting
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+_local = threading.local()
+_shards = {}  # Live threads' dicts by id
+_retired = defaultdict(float)  # Sum of the dicts of threads that exited
+_shards_lock = threading.Lock()  # Taken when a thread starts or stops recording, and on scrape
+_registry = []
+
+
+class _Owner:
+    """Kept in the thread's locals: collected when the thread exits."""
+
+
+def _retire(values):
+    with _shards_lock:
+        del _shards[id(values)]
+        for key, value in values.items():
+            _retired[key] += value
+
+
+def _shard():
+    try:
+        return _local.values
+    except AttributeError:
+        values = _local.values = {}
+        _local.owner = _Owner()
+        # Thread-per-request servers start threads all the time, fold each
+        # thread's numbers into `_retired` when it exits
+        weakref.finalize(_local.owner, _retire, values)
+        with _shards_lock:
+            _shards[id(values)] = values
+        return values
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _registry.append(self)
+
+    def _add(self, labels, field, amount):
+        values = _shard()
+        key = (self.name, labels, field)
+        values[key] = values.get(key, 0) + amount
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount=1):
+        self._add(labels, "", amount)
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def inc(self, *labels, amount=1):
+        self._add(labels, "", amount)
+
+    def dec(self, *labels, amount=1):
+        self._add(labels, "", -amount)
+
+
+class CallbackGauge(_Metric):
+    """A gauge read when scraped: `callback()` returns `{labels tuple: value}`."""
+
+    type = "gauge"
+
+    def __init__(self, name, documentation, labelnames, callback):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        values = _shard()
+        # Stored per bucket, made cumulative when rendered
+        for field, amount in ((bisect_left(self.buckets, value), 1), ("sum", value), ("count", 1)):
+            key = (self.name, labels, field)
+            values[key] = values.get(key, 0) + amount
+
+
+REQUESTS = Counter("http_requests_total", "HTTP requests.", ("route", "method", "status"))
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency.", ("route", "method"), LATENCY_BUCKETS
+)
+REQUEST_QUERIES = Histogram(
+    "http_request_db_queries", "SQL statements per HTTP request.", ("route",), QUERY_COUNT_BUCKETS
+)
+IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests being served.")
+OPERATIONS = Counter("graphql_operations_total", "GraphQL operations.", ("operation", "type", "result"))
+OPERATION_DURATION = Histogram(
+    "graphql_operation_duration_seconds", "GraphQL operation latency.", ("operation", "type"), LATENCY_BUCKETS
+)
+OPERATION_QUERIES = Histogram(
+    "graphql_operation_db_queries", "SQL statements per GraphQL operation.", ("operation",), QUERY_COUNT_BUCKETS
+)
+CACHE_REQUESTS = Counter("cache_requests_total", "Cache lookups by result (hit or miss).", ("cache", "result"))
+CONNECTIONS_CREATED = Counter("db_connections_created_total", "Database connections opened.", ("alias",))
+
+
+def cache_lookup(cache, hits=0, misses=0):
+    """Counts lookups of the cache named `cache`."""
+    if hits:
+        CACHE_REQUESTS.inc(cache, "hit", amount=hits)
+    if misses:
+        CACHE_REQUESTS.inc(cache, "miss", amount=misses)
+
+
+_connections = weakref.WeakSet()
+_connections_lock = threading.Lock()  # Connections are opened rarely, this isn't on the hot path
+
+
+def _connection_created(sender, connection, **kwargs):
+    CONNECTIONS_CREATED.inc(connection.alias)
+    with _connections_lock:
+        _connections.add(connection)
+
+
+connection_created.connect(_connection_created)
+
+
+def _open_connections():
+    with _connections_lock:
+        wrappers = list(_connections)
+    counts = defaultdict(int)
+    for wrapper in wrappers:
+        if wrapper.connection is not None:
+            counts[(wrapper.alias,)] += 1
+    return counts
+
+
+def _pool_stats(stat):
+    def callback():
+        values = {}
+        for alias in connections:
+            # Only psycopg 3 pools (the "asgi" connection profile) have stats
+            pool = getattr(type(connections[alias]), "_connection_pools", {}).get(alias)
+            if pool is not None:
+                values[(alias,)] = pool.get_stats().get(stat, 0)
+        return values
+    return callback
+
+
+CallbackGauge("db_connections_open", "Open database connections in this process.", ("alias",), _open_connections)
+CallbackGauge("db_pool_size", "Connections in the pool.", ("alias",), _pool_stats("pool_size"))
+CallbackGauge("db_pool_available", "Idle connections in the pool.", ("alias",), _pool_stats("pool_available"))
+CallbackGauge("db_pool_requests_waiting", "Requests waiting for a pool connection.", ("alias",), _pool_stats("requests_waiting"))
+
+
+_operations = set()
+
+
+def _operation_label(name):
+    if not name:
+        return "anonymous"
+    # Clients pick operation names, bound the number of label values
+    if name not in _operations:
+        if len(_operations) >= getattr(settings, "METRICS_MAX_OPERATIONS", 100):
+            return "other"
+        _operations.add(name)
+    return name
+
+
+def snapshot():
+    """This process's values, `{(name, labels, field): value}`."""
+    with _shards_lock:
+        shards = list(_shards.values())
+        total = defaultdict(float, _retired)
+    for values in shards:
+        # dict() copies in one step, while the owning thread may be writing
+        for key, value in dict(values).items():
+            total[key] += value
+    for metric in _registry:
+        if isinstance(metric, CallbackGauge):
+            for labels, value in metric.callback().items():
+                total[(metric.name, labels, "")] += value
+    return total
+
+
+def _multiprocess_dir():
+    directory = getattr(settings, "METRICS_MULTIPROCESS_DIR", None)
+    return Path(directory) if directory else None
+
+
+def flush():
+    """Writes this process's values to the multiprocess directory."""
+    directory = _multiprocess_dir()
+    if directory is None:
+        return
+    directory.mkdir(parents=True, exist_ok=True)
+    pid = os.getpid()
+    temporary = directory / f"{pid}.{threading.get_ident()}.tmp"
+    temporary.write_text(json.dumps({
+        "pid": pid,
+        "values": [[name, list(labels), field, value] for (name, labels, field), value in snapshot().items()],
+    }))
+    os.replace(temporary, directory / f"{pid}.json")
+
+
+_last_flush = 0.0
+
+
+def _maybe_flush():
+    global _last_flush
+    now = time.monotonic()
+    if now - _last_flush >= getattr(settings, "METRICS_FLUSH_INTERVAL", 5):
+        # Two threads may both flush, the file is replaced atomically
+        _last_flush = now
+        flush()
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _collect():
+    directory = _multiprocess_dir()
+    if directory is None:
+        return snapshot()
+    flush()
+    gauges = {metric.name for metric in _registry if metric.type == "gauge"}
+    total = defaultdict(float)
+    for path in directory.glob("*.json"):
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        alive = _alive(data["pid"])
+        for name, labels, field, value in data["values"]:
+            if alive or name not in gauges:
+                total[(name, tuple(labels), field)] += value
+    return total
+
+
+def _escape(value):
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render():
+    """All metrics in the Prometheus text format."""
+    values = _collect()
+    by_metric = defaultdict(lambda: defaultdict(dict))
+    for (name, labels, field), value in values.items():
+        by_metric[name][labels][field] = value
+
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        series = by_metric.get(metric.name, {})
+        if not series and not metric.labelnames and metric.type != "histogram":
+            series = {(): {"": 0}}
+        for labels, fields in sorted(series.items()):
+            if metric.type != "histogram":
+                lines.append(f"{metric.name}{_format_labels(metric.labelnames, labels)} {_format_value(fields.get('', 0))}")
+                continue
+            cumulative = 0
+            for index, bound in enumerate((*metric.buckets, math.inf)):
+                cumulative += fields.get(index, 0)
+                bucket_labels = _format_labels((*metric.labelnames, "le"), (*labels, _format_value(bound)))
+                lines.append(f"{metric.name}_bucket{bucket_labels} {_format_value(cumulative)}")
+            label_text = _format_labels(metric.labelnames, labels)
+            lines.append(f"{metric.name}_sum{label_text} {_format_value(fields.get('sum', 0))}")
+            lines.append(f"{metric.name}_count{label_text} {_format_value(fields.get('count', 0))}")
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view(request):
+    token = getattr(settings, "METRICS_TOKEN", None)
+    if token:
+        if not constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}"):
+            return HttpResponse("Unauthorized\n", status=401, content_type="text/plain")
+    elif not settings.DEBUG and not (request.user.is_active and request.user.is_staff):
+        # Route, operation and pool details aren't for everyone
+        raise Http404
+    return HttpResponse(render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    if not getattr(settings, "METRICS_ENABLED", True):
+        return get_response
+    if _multiprocess_dir() is not None:
+        atexit.register(flush)
+
+    def finish(request, response, stats):
+        match = getattr(request, "resolver_match", None)
+        route = (match.url_name or match.view_name) if match else "unmatched"
+        REQUESTS.inc(route, request.method, str(response.status_code))
+        REQUEST_DURATION.observe(stats.elapsed_ms() / 1000, route, request.method)
+        REQUEST_QUERIES.observe(stats.sql_count, route)
+        if _multiprocess_dir() is not None:
+            _maybe_flush()
+        return response
+
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            IN_FLIGHT.inc()
+            try:
+                with collecting(RequestStats()) as stats:
+                    response = await get_response(request)
+            finally:
+                IN_FLIGHT.dec()
+            return finish(request, response, stats)
+    else:
+        def middleware(request):
+            IN_FLIGHT.inc()
+            try:
+                with collecting(RequestStats()) as stats:
+                    response = get_response(request)
+            finally:
+                IN_FLIGHT.dec()
+            return finish(request, response, stats)
+
+    return middleware
+
+
+class MetricsExtension(SchemaExtension):
+    """Records each GraphQL operation's latency, SQL statements and result."""
+
+    def on_operation(self):
+        with collecting(RequestStats()) as stats:
+            yield
+        execution_context = self.execution_context
+        operation = _operation_label(execution_context.operation_name)
+        try:
+            operation_type = execution_context.operation_type.value
+        except RuntimeError:
+            # No document (it didn't parse) or no such operation in it
+            operation_type = "unknown"
+        result = execution_context.result
+        failed = execution_context.pre_execution_errors or (result is not None and result.errors)
+        OPERATIONS.inc(operation, operation_type, "error" if failed else "success")
+        OPERATION_DURATION.observe(stats.elapsed_ms() / 1000, operation, operation_type)
+        OPERATION_QUERIES.observe(stats.sql_count, operation)
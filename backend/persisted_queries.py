@@ -0,0 +1,117 @@
+"""
+Automatic persisted queries (APQ) and a parsed/validated document cache.
+
+Clients following the Apollo APQ protocol send only
+`extensions.persistedQuery.sha256Hash`. If the server doesn't know the hash it
+answers `PersistedQueryNotFound`, and the client retries once with the full
+query, which is then stored under that hash. Query texts are kept in the
+Django cache named by `PERSISTED_QUERIES_CACHE`, so every instance can share
+them when that cache is shared, for `PERSISTED_QUERIES_TIMEOUT` seconds: any
+client can store queries, so entries must expire (a client whose query
+expired just sends it again). The cache's own size limit, such as
+LocMemCache's MAX_ENTRIES, bounds the store further.
+
+Every operation, persisted or not, is keyed by the sha256 of its text. The
+parsed AST and its validation result are kept in an in-process LRU, so a
+repeated query is parsed and validated once per process.
+"""
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import caches
+from graphql import GraphQLError
+from strawberry.extensions import SchemaExtension
+
+from backend import metrics
+
+
+class _LRU:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+_documents = _LRU(getattr(settings, "GRAPHQL_DOCUMENT_CACHE_SIZE", 256))
+_validation_errors = _LRU(getattr(settings, "GRAPHQL_DOCUMENT_CACHE_SIZE", 256))
+
+
+def _query_store():
+    return caches[getattr(settings, "PERSISTED_QUERIES_CACHE", "default")]
+
+
+def _sha256(query):
+    return hashlib.sha256(query.encode()).hexdigest()
+
+
+class PersistedQueryExtension(SchemaExtension):
+    def __init__(self, *, execution_context=None):
+        self.document_hash = None
+
+    def on_operation(self):
+        execution_context = self.execution_context
+        persisted = (execution_context.operation_extensions or {}).get("persistedQuery")
+
+        if persisted:
+            document_hash = persisted.get("sha256Hash")
+            if execution_context.query:
+                if _sha256(execution_context.query) != document_hash:
+                    raise GraphQLError(
+                        "provided sha does not match query",
+                        extensions={"code": "PERSISTED_QUERY_HASH_MISMATCH"},
+                    )
+                _query_store().set(
+                    f"apq:{document_hash}", execution_context.query,
+                    timeout=getattr(settings, "PERSISTED_QUERIES_TIMEOUT", 86400),
+                )
+            else:
+                query = _query_store().get(f"apq:{document_hash}")
+                metrics.cache_lookup("persisted_query", hits=query is not None, misses=query is None)
+                if query is None:
+                    raise GraphQLError(
+                        "PersistedQueryNotFound",
+                        extensions={"code": "PERSISTED_QUERY_NOT_FOUND"},
+                    )
+                execution_context.query = query
+            self.document_hash = document_hash
+        elif execution_context.query:
+            self.document_hash = _sha256(execution_context.query)
+
+        yield
+
+    def on_parse(self):
+        execution_context = self.execution_context
+        cached = _documents.get(self.document_hash) if self.document_hash else None
+        if self.document_hash:
+            metrics.cache_lookup("graphql_document", hits=cached is not None, misses=cached is None)
+        if cached is not None:
+            execution_context.graphql_document = cached
+        yield
+        if cached is None and self.document_hash and execution_context.graphql_document is not None:
+            _documents.set(self.document_hash, execution_context.graphql_document)
+
+    def on_validate(self):
+        execution_context = self.execution_context
+        key = (self.document_hash, execution_context.validation_rules)
+        cached = _validation_errors.get(key) if self.document_hash else None
+        if cached is not None:
+            execution_context.pre_execution_errors = cached
+        yield
+        if cached is None and self.document_hash and execution_context.pre_execution_errors is not None:
+            _validation_errors.set(key, execution_context.pre_execution_errors)
@@ -0,0 +1,364 @@
+"""
+On-demand profiling of single requests (Django views, DRF and GraphQL).
+
+A request is profiled when it carries a signed `X-Profile` header (see
+`make_token()` and `manage.py profile_token`, valid for
+`PROFILING_TOKEN_MAX_AGE` seconds) or, for a logged in staff user, the
+`?__profile` query flag. The value picks the profiler:
+
+- `cprofile` (the default): deterministic, every call is counted. Saved as a
+  `.prof` pstats file, plus collapsed stacks approximated from its call graph.
+  It only sees the thread handling the request.
+- `sampling`: samples the stacks of every thread every
+  `PROFILING_SAMPLE_INTERVAL_MS`. Cheaper than `cprofile` on call-heavy code,
+  but not free: the sampler is Python code holding the GIL while it walks the
+  stacks, so shorter intervals slow the request down more. Saved as collapsed
+  stacks, one root per thread.
+
+Collapsed stacks (`frame;frame;frame count` lines) are what flamegraph.pl,
+speedscope and inferno read. Every report also has a `.json` file with the
+request, the response status, the duration and each SQL statement with its
+timing. Reports are written to `PROFILING_DIR` (not served, unlike
+MEDIA_ROOT), keeping the newest `PROFILING_MAX_REPORTS`, and listed on the
+staff-only admin page at /admin/profiles/ (backend/profiling_admin.py). When
+they can't be written (e.g. a read-only filesystem) the error is logged and
+the response is returned without its `X-Profile-Report` header.
+
+Requests that aren't profiled only pay for a header lookup and a substring
+check of the query string; with `PROFILING_ENABLED = False` the middleware
+isn't even in the chain. One request per process is profiled at a time,
+others asking meanwhile are served normally.
+
+Async views served under WSGI (the GraphQL endpoint) and sync code served
+under ASGI run in another thread than the middleware, so profile those with
+`sampling`. The sampler also shows whatever other requests' threads (and,
+under ASGI, coroutines on the event loop) were doing meanwhile.
+"""
+import asyncio
+import cProfile
+import json
+import logging
+import os
+import pstats
+import re
+import sys
+import sysconfig
+import threading
+import uuid
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.http.request import RawPostDataException
+from django.utils import timezone
+from django.utils.decorators import sync_and_async_middleware
+
+from backend.instrumentation import RequestStats, collecting
+
+logger = logging.getLogger(__name__)
+
+MODES = ("cprofile", "sampling")
+# Collapsed stack counts under this many microseconds are dropped (cProfile)
+MIN_STACK_US = 10
+REPORT_NAME = re.compile(r"^\d{8}-\d{6}-[0-9a-f]{16}$")
+REPORT_FILES = {"prof": "application/octet-stream", "collapsed.txt": "text/plain", "json": "application/json"}
+
+_SALT = "backend.profiling"
+_busy = threading.Lock()
+
+
+def make_token(mode="cprofile"):
+    """A signed `X-Profile` header value for `mode`."""
+    if mode not in MODES:
+        raise ValueError(f"Unknown profiling mode {mode!r}, expected one of {', '.join(MODES)}.")
+    return signing.TimestampSigner(salt=_SALT).sign(mode)
+
+
+def report_dir():
+    return Path(getattr(settings, "PROFILING_DIR", Path(settings.BASE_DIR) / "profiles"))
+
+
+def _signed_mode(request):
+    token = request.META.get("HTTP_X_PROFILE")
+    if not token:
+        return None
+    try:
+        mode = signing.TimestampSigner(salt=_SALT).unsign(
+            token, max_age=getattr(settings, "PROFILING_TOKEN_MAX_AGE", 3600)
+        )
+    except signing.BadSignature:
+        logger.warning("Ignoring an X-Profile header with a bad or expired signature")
+        return None
+    return mode if mode in MODES else None
+
+
+def _flag_mode(request, user):
+    if "__profile" not in request.GET or not (user and user.is_active and user.is_staff):
+        return None
+    mode = request.GET["__profile"] or "cprofile"
+    return mode if mode in MODES else None
+
+
+def _user(request):
+    # GraphQL requests authenticate with the JWT (cotizador.jwt_cache), the rest with the session
+    user_or_error = getattr(request, "UserOrError", None)
+    if user_or_error is not None:
+        return user_or_error.user
+    return getattr(request, "user", None)
+
+
+async def _auser(request):
+    user_or_error = getattr(request, "UserOrError", None)
+    if user_or_error is not None:
+        return user_or_error.user
+    return await request.auser() if hasattr(request, "auser") else None
+
+
+def _short_path(filename):
+    filename = filename.rpartition("site-packages" + os.sep)[2]
+    for base in (str(settings.BASE_DIR), sysconfig.get_path("stdlib")):
+        if filename.startswith(base + os.sep):
+            return filename[len(base) + 1:]
+    return filename
+
+
+def _label(filename, lineno, name):
+    # Builtins have no file in pstats
+    label = name if filename == "~" else f"{name} ({_short_path(filename)}:{lineno})"
+    return label.replace(";", ":")
+
+
+class ProfileStats(RequestStats):
+    """RequestStats keeping each statement and its duration."""
+
+    MAX_QUERIES = 1000
+
+    def __init__(self):
+        super().__init__()
+        self.queries = []
+
+    def record(self, sql, duration_ms, many):
+        super().record(sql, duration_ms, many)
+        if len(self.queries) < self.MAX_QUERIES:
+            self.queries.append({"sql": sql, "ms": round(duration_ms, 3), "many": many})
+
+
+class CProfiler:
+    unit = "us"
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def __enter__(self):
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profile.disable()
+
+    def collapsed(self):
+        """
+        Collapsed stacks in microseconds. cProfile only keeps caller/callee
+        pairs, so a function's time is split between its callers in proportion
+        to the time spent under each: exact for trees, an estimate for
+        functions called from several places.
+        """
+        stats = pstats.Stats(self.profile).stats
+        children = defaultdict(list)
+        for func, (cc, nc, tt, ct, callers) in stats.items():
+            for caller, edge in callers.items():
+                children[caller].append((func, edge[3]))
+        stacks = Counter()
+
+        def walk(func, seconds, path, seen):
+            tt, ct = stats[func][2], stats[func][3]
+            if ct <= 0 or seconds * 1e6 < MIN_STACK_US:
+                return
+            path = f"{path};{_label(*func)}" if path else _label(*func)
+            scale = seconds / ct
+            own = round(tt * scale * 1e6)
+            if own >= MIN_STACK_US:
+                stacks[path] += own
+            for child, child_seconds in children[func]:
+                # Recursion is folded into the first call
+                if child not in seen:
+                    walk(child, child_seconds * scale, path, seen | {child})
+
+        # Functions called from frames entered before `enable()` have no
+        # callers, `_call` makes sure the request is one of them. The other
+        # one is `__exit__` stopping the profiler, which isn't the request's.
+        for func, (cc, nc, tt, ct, callers) in stats.items():
+            if not callers and func != _EXIT:
+                walk(func, ct, "", {func})
+        return stacks
+
+    def save(self, path):
+        self.profile.dump_stats(f"{path}.prof")
+
+
+_EXIT = (CProfiler.__exit__.__code__.co_filename, CProfiler.__exit__.__code__.co_firstlineno, "__exit__")
+
+
+class Sampler:
+    """Samples the stacks of every thread from a background thread."""
+
+    unit = "samples"
+
+    def __init__(self):
+        self.interval = getattr(settings, "PROFILING_SAMPLE_INTERVAL_MS", 10) / 1000
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiling-sampler", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                labels = []
+                while frame is not None:
+                    code = frame.f_code
+                    labels.append(_label(code.co_filename, code.co_firstlineno, code.co_qualname))
+                    # Frames above the request (the server) are the same in every sample
+                    frame = None if code in _ROOT_CODES else frame.f_back
+                labels.append(f"thread {names.get(ident, ident)}")
+                self.stacks[";".join(reversed(labels))] += 1
+
+    def collapsed(self):
+        return self.stacks
+
+    def save(self, path):
+        pass
+
+
+def _call(get_response, request):
+    # Never called from inside a profile, so it roots the request's stacks
+    # (get_response itself recurses through the middleware chain)
+    return get_response(request)
+
+
+async def _acall(get_response, request):
+    return await get_response(request)
+
+
+_ROOT_CODES = {_call.__code__, _acall.__code__}
+
+
+def _profiler(mode):
+    return CProfiler() if mode == "cprofile" else Sampler()
+
+
+def _operation_name(request):
+    if request.method == "GET":
+        return request.GET.get("operationName")
+    if request.content_type != "application/json":
+        return None
+    try:
+        body = json.loads(request.body)
+    except (ValueError, RawPostDataException):
+        return None
+    return body.get("operationName") if isinstance(body, dict) else None
+
+
+def _save(request, response, mode, profiler, stats):
+    """Writes the report files and returns the report's name."""
+    timings = stats.as_dict()
+    directory = report_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    name = f"{timezone.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:16]}"
+    profiler.save(directory / name)
+    stacks = profiler.collapsed()
+    (directory / f"{name}.collapsed.txt").write_text(
+        "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items())), encoding="utf-8"
+    )
+    match = getattr(request, "resolver_match", None)
+    user = _user(request)
+    meta = {
+        "name": name,
+        "created_at": timezone.now().isoformat(),
+        "mode": mode,
+        "unit": profiler.unit,
+        "method": request.method,
+        "path": request.get_full_path(),
+        "route": match.view_name if match else None,
+        "operation": _operation_name(request),
+        "user": user.get_username() if user and user.is_authenticated else None,
+        "status": response.status_code,
+        **timings,
+        "sql": stats.queries,
+        "sql_truncated": stats.sql_count > len(stats.queries),
+    }
+    (directory / f"{name}.json").write_text(json.dumps(meta, indent=1), encoding="utf-8")
+    _prune(directory)
+    logger.info("profile %s", json.dumps({key: meta[key] for key in ("name", "mode", "path", "duration_ms")}))
+    return name
+
+
+def _try_save(request, response, mode, profiler, stats):
+    """Like `_save`, but sets the response's `X-Profile-Report` header and logs write errors."""
+    try:
+        response["X-Profile-Report"] = _save(request, response, mode, profiler, stats)
+    except OSError:
+        logger.exception("Could not write the profile of %s to %s", request.get_full_path(), report_dir())
+
+
+def _prune(directory):
+    keep = getattr(settings, "PROFILING_MAX_REPORTS", 100)
+    for meta in sorted(directory.glob("*.json"), reverse=True)[keep:]:
+        name = meta.name[:-len(".json")]
+        for suffix in REPORT_FILES:
+            (directory / f"{name}.{suffix}").unlink(missing_ok=True)
+
+
+@sync_and_async_middleware
+def profiling_middleware(get_response):
+    if not getattr(settings, "PROFILING_ENABLED", True):
+        return get_response
+
+    def requested(request):
+        return "HTTP_X_PROFILE" in request.META or "__profile" in request.META.get("QUERY_STRING", "")
+
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            if not requested(request):
+                return await get_response(request)
+            mode = _signed_mode(request) or _flag_mode(request, await _auser(request))
+            if mode is None or not _busy.acquire(blocking=False):
+                return await get_response(request)
+            try:
+                profiler = _profiler(mode)
+                with collecting(ProfileStats()) as stats, profiler:
+                    response = await _acall(get_response, request)
+                await sync_to_async(_try_save)(request, response, mode, profiler, stats)
+            finally:
+                _busy.release()
+            return response
+    else:
+        def middleware(request):
+            if not requested(request):
+                return get_response(request)
+            mode = _signed_mode(request) or _flag_mode(request, _user(request))
+            if mode is None or not _busy.acquire(blocking=False):
+                return get_response(request)
+            try:
+                profiler = _profiler(mode)
+                with collecting(ProfileStats()) as stats, profiler:
+                    response = _call(get_response, request)
+                _try_save(request, response, mode, profiler, stats)
+            finally:
+                _busy.release()
+            return response
+
+    return middleware
@@ -0,0 +1,77 @@
+"""
+Staff pages browsing the reports of backend/profiling.py, routed by
+backend/admin_urls.py behind `admin.site.admin_view`.
+"""
+import io
+import json
+import pstats
+from collections import Counter
+
+from django.contrib import admin
+from django.http import FileResponse, Http404
+from django.shortcuts import render
+
+from backend.profiling import REPORT_FILES, REPORT_NAME, report_dir
+
+
+def _load(name):
+    if not REPORT_NAME.match(name):
+        raise Http404
+    try:
+        return json.loads((report_dir() / f"{name}.json").read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        raise Http404
+
+
+def report_list(request):
+    directory = report_dir()
+    names = sorted((path.name[:-len(".json")] for path in directory.glob("*.json")), reverse=True)
+    reports = []
+    for name in names:
+        try:
+            reports.append(_load(name))
+        except (Http404, ValueError):
+            continue
+    return render(request, "admin/profiling/report_list.html", {
+        **admin.site.each_context(request),
+        "title": "Request profiles",
+        "reports": reports,
+    })
+
+
+def report_detail(request, name):
+    report = _load(name)
+    directory = report_dir()
+    top_functions = None
+    if (directory / f"{name}.prof").exists():
+        output = io.StringIO()
+        pstats.Stats(str(directory / f"{name}.prof"), stream=output).sort_stats("cumulative").print_stats(40)
+        top_functions = output.getvalue()
+    try:
+        lines = (directory / f"{name}.collapsed.txt").read_text(encoding="utf-8").splitlines()
+    except FileNotFoundError:
+        lines = []
+    # Self time per function, from the leaf of each stack
+    hottest = Counter()
+    for line in lines:
+        stack, _, count = line.rpartition(" ")
+        hottest[stack.rpartition(";")[2]] += int(count)
+    return render(request, "admin/profiling/report_detail.html", {
+        **admin.site.each_context(request),
+        "title": f"Profile {name}",
+        "report": report,
+        "files": [suffix for suffix in REPORT_FILES if (directory / f"{name}.{suffix}").exists()],
+        "top_functions": top_functions,
+        "hottest": hottest.most_common(30),
+        "slowest_sql": sorted(report["sql"], key=lambda query: query["ms"], reverse=True)[:50],
+    })
+
+
+def report_file(request, name, kind):
+    _load(name)
+    if kind not in REPORT_FILES:
+        raise Http404
+    path = report_dir() / f"{name}.{kind}"
+    if not path.exists():
+        raise Http404
+    return FileResponse(path.open("rb"), as_attachment=True, filename=path.name, content_type=REPORT_FILES[kind])
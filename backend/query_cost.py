@@ -0,0 +1,182 @@
+"""
+Static cost analysis and depth limiting for GraphQL operations.
+
+The object types are mutually recursive (companies -> customers -> orders ->
+customer -> ...), so a short query can ask for millions of rows. Before an
+operation runs, `QueryCostExtension` walks its selection set and estimates the
+rows it would load:
+
+- every field returning an object costs one per object, times the number of
+  parent objects it is resolved for;
+- a list field multiplies its subtree by its `first` argument when it has one
+  (connections), otherwise by `GRAPHQL_LIST_SIZES["Type.field"]`, falling back
+  to `GRAPHQL_DEFAULT_LIST_SIZE`. The edges of a connection are already
+  counted by its `first`;
+- scalars and introspection fields are free.
+
+Operations nested deeper than `GRAPHQL_MAX_QUERY_DEPTH` or costing more than
+`GRAPHQL_MAX_QUERY_COST` are rejected without executing. With
+`GRAPHQL_QUERY_COST_RATE = (cost, seconds)` each client (user, or IP address
+when anonymous) may also spend at most that much cost per window; operations
+over it are rejected until the window ends. Behind a proxy the IP address is
+read from `GRAPHQL_QUERY_COST_CLIENT_IP_HEADER`. The estimate is returned in
+`extensions.cost` so clients can tune their queries.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from graphql import (
+    FieldNode, FragmentDefinitionNode, FragmentSpreadNode, GraphQLError, GraphQLInt, GraphQLList,
+    get_named_type, get_nullable_type, is_composite_type,
+)
+from graphql.execution import ExecutionResult as GraphQLExecutionResult
+from graphql.utilities import get_operation_ast, value_from_ast
+from strawberry.extensions import SchemaExtension
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class _CostEstimator:
+    def __init__(self, schema, document, variables):
+        self.schema = schema
+        self.variables = variables or {}
+        self.fragments = {
+            definition.name.value: definition
+            for definition in document.definitions if isinstance(definition, FragmentDefinitionNode)
+        }
+        self.list_sizes = _setting("GRAPHQL_LIST_SIZES", {})
+        self.default_list_size = _setting("GRAPHQL_DEFAULT_LIST_SIZE", 50)
+
+    def _first(self, node, field):
+        argument = field.args.get("first")
+        if argument is None:
+            return None
+        for argument_node in node.arguments:
+            if argument_node.name.value == "first":
+                value = value_from_ast(argument_node.value, GraphQLInt, self.variables)
+                if value is not None:
+                    return value
+        return argument.default_value
+
+    def estimate(self, selection_set, parent_type, multiplier=1, paged=False):
+        """Returns `(cost, depth)` of `selection_set` resolved `multiplier` times on `parent_type`."""
+        cost = depth = 0
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                name = selection.name.value
+                if name.startswith("__"):
+                    continue
+                field = parent_type.fields[name]
+                return_type = get_nullable_type(field.type)
+                if not is_composite_type(get_named_type(return_type)):
+                    depth = max(depth, 1)
+                    continue
+
+                first = self._first(selection, field)
+                if first is not None:
+                    size = first
+                elif isinstance(return_type, GraphQLList) and not paged:
+                    size = self.list_sizes.get(f"{parent_type.name}.{name}", self.default_list_size)
+                else:
+                    size = 1
+                count = multiplier * max(size, 0)
+                child_cost, child_depth = self.estimate(
+                    selection.selection_set, get_named_type(return_type), count, paged=first is not None
+                )
+                cost += count + child_cost
+                depth = max(depth, child_depth + 1)
+            else:
+                if isinstance(selection, FragmentSpreadNode):
+                    fragment = self.fragments[selection.name.value]
+                else:
+                    fragment = selection
+                fragment_type = parent_type
+                if fragment.type_condition is not None:
+                    fragment_type = self.schema.get_type(fragment.type_condition.name.value)
+                child_cost, child_depth = self.estimate(fragment.selection_set, fragment_type, multiplier, paged)
+                cost += child_cost
+                depth = max(depth, child_depth)
+        return cost, depth
+
+
+def _client_ip(request):
+    # Behind a proxy REMOTE_ADDR is the proxy's, the same for every client
+    header = _setting("GRAPHQL_QUERY_COST_CLIENT_IP_HEADER", None)
+    forwarded = request.META.get(header) if header else None
+    if forwarded:
+        # The proxy appends the address it saw to whatever the client sent
+        return forwarded.rsplit(",", 1)[-1].strip()
+    return request.META.get("REMOTE_ADDR")
+
+
+def _client_key(request):
+    user_or_error = getattr(request, "UserOrError", None)
+    user = getattr(user_or_error, "user", None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    return f"ip:{_client_ip(request)}"
+
+
+class QueryCostExtension(SchemaExtension):
+    def __init__(self, *, execution_context=None):
+        self.report = None
+
+    def _reject(self, message, code):
+        self.execution_context.result = GraphQLExecutionResult(
+            data=None, errors=[GraphQLError(message, extensions={"code": code, "cost": self.report})]
+        )
+
+    def _throttle(self, cost):
+        rate = _setting("GRAPHQL_QUERY_COST_RATE", None)
+        request = getattr(self.execution_context.context, "request", None)
+        if not rate or request is None:
+            return True
+        limit, window = rate
+        now = time.time()
+        key = f"gqlcost:{_client_key(request)}:{int(now // window)}"
+        cache = caches[_setting("GRAPHQL_QUERY_COST_CACHE", "default")]
+        # Spent with one atomic incr, so concurrent operations can't both
+        # pass on the same remaining budget; add() starts the window
+        try:
+            used = cache.incr(key, cost)
+        except ValueError:
+            used = cost if cache.add(key, cost, timeout=window) else cache.incr(key, cost)
+        allowed = used <= limit
+        if not allowed:
+            # Rejected operations don't spend
+            used = cache.decr(key, cost)
+        self.report["throttle"] = {
+            "limit": limit,
+            "remaining": max(limit - used, 0),
+            "reset_in_seconds": round(window - now % window),
+        }
+        return allowed
+
+    def on_execute(self):
+        execution_context = self.execution_context
+        operation = get_operation_ast(execution_context.graphql_document, execution_context.operation_name)
+        if operation is not None:
+            schema = execution_context.schema._schema
+            cost, depth = _CostEstimator(
+                schema, execution_context.graphql_document, execution_context.variables
+            ).estimate(operation.selection_set, schema.get_root_type(operation.operation))
+            max_cost = _setting("GRAPHQL_MAX_QUERY_COST", None)
+            max_depth = _setting("GRAPHQL_MAX_QUERY_DEPTH", None)
+            self.report = {"estimated": cost, "max": max_cost, "depth": depth, "max_depth": max_depth}
+
+            if max_depth is not None and depth > max_depth:
+                self._reject(f"Query depth {depth} is over the limit of {max_depth}.", "QUERY_TOO_DEEP")
+            elif max_cost is not None and cost > max_cost:
+                self._reject(f"Query cost {cost} is over the limit of {max_cost}.", "QUERY_TOO_COMPLEX")
+            elif not self._throttle(cost):
+                self._reject(
+                    f"Query cost budget exhausted, retry in {self.report['throttle']['reset_in_seconds']} seconds.",
+                    "QUERY_COST_THROTTLED",
+                )
+        yield
+
+    def get_results(self):
+        return {"cost": self.report} if self.report is not None else {}
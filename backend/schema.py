@@ -4,6 +4,10 @@ from gqlauth.core.middlewares import JwtSchema
 from gqlauth.user import arg_mutations
 from django.contrib.auth import get_user_model
 
+from backend.instrumentation import QueryInstrumentationExtension
+from backend.metrics import MetricsExtension
+from backend.persisted_queries import PersistedQueryExtension
+from backend.query_cost import QueryCostExtension
 from cotizador.graphql.queries import Query as CotizadorQuery
 from cotizador.graphql.mutations import Mutation as CotizadorMutation
 
@@ -41,4 +45,9 @@ class Mutation(CotizadorMutation, AuthMutation):
     pass
 
 # Create schema with JWT authentication middleware
-schema = JwtSchema(query=Query, mutation=Mutation)
+# Persisted queries go first so the other extensions see the resolved query text
+schema = JwtSchema(
+    query=Query,
+    mutation=Mutation,
+    extensions=[PersistedQueryExtension, QueryCostExtension, QueryInstrumentationExtension, MetricsExtension],
+)
@@ -38,7 +38,7 @@ ALLOWED_HOSTS = ['*']
 
 INSTALLED_APPS = [
     # Django deps
-    'django.contrib.admin',
+    'django.contrib.admin.apps.SimpleAdminConfig',  # admin.py modules are discovered lazily, see backend/admin_urls.py
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
@@ -57,13 +57,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'backend.metrics.metrics_middleware',  # First, so it times the whole request
+    'backend.instrumentation.instrumentation_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # To interact with Next.js
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'gqlauth.core.middlewares.django_jwt_middleware',
+    'cotizador.jwt_cache.jwt_middleware',  # Cached gqlauth JWT auth, only on the GraphQL endpoints
+    'backend.profiling.profiling_middleware',  # After authentication, the ?__profile flag is for staff
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -110,16 +113,46 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Connection handling depends on how the app is served, pick it with DB_CONNECTION_PROFILE:
+# - "serverless": Vercel functions (backend/wsgi.py). One request at a time per
+#   instance, so the connection is kept open between warm invocations. Every
+#   warm instance holds one, so DB_HOST must be a transaction-mode pooler
+#   (e.g. Supabase or Neon on port 6543), not Postgres itself, or scaling out
+#   uses up the database's connection slots. Server-side cursors don't work
+#   through such a pooler and are off: QuerySet.iterator() (the exports) then
+#   reads each query's rows at once, run large exports on the other profiles.
+# - "wsgi": long-running threaded servers (gunicorn, runserver). One persistent
+#   connection per thread, checked before reuse.
+# - "asgi": uvicorn/daphne. Persistent connections aren't safe across async
+#   requests, so connections come from a psycopg 3 pool instead.
+# The wsgi profile behind a transaction-mode pooler also needs
+# DB_DISABLE_SERVER_SIDE_CURSORS=1, or QuerySet.iterator() breaks.
+DB_CONNECTION_PROFILES = {
+    "serverless": {"CONN_MAX_AGE": 300, "CONN_HEALTH_CHECKS": True, "DISABLE_SERVER_SIDE_CURSORS": True},
+    "wsgi": {"CONN_MAX_AGE": 60, "CONN_HEALTH_CHECKS": True},
+    "asgi": {
+        "CONN_MAX_AGE": 0,  # Required with pooling
+        "OPTIONS": {"pool": {"min_size": 2, "max_size": 10, "timeout": 10}},
+    },
+}
+DB_CONNECTION_PROFILE = os.environ.get("DB_CONNECTION_PROFILE", "serverless")
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql_psycopg2',
+        # Uses psycopg 3 when installed (required by the "asgi" pool), otherwise psycopg2
+        'ENGINE': 'django.db.backends.postgresql',
         'NAME': os.environ.get("DB_NAME"),
         'USER': os.environ.get("DB_USER"),
         'PASSWORD': os.environ.get("DB_PASSWORD"),
         'HOST': os.environ.get("DB_HOST"),
         'PORT': os.environ.get("DB_PORT"),
+        **DB_CONNECTION_PROFILES[DB_CONNECTION_PROFILE],
     }
 }
+if "DB_CONN_MAX_AGE" in os.environ:
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.environ["DB_CONN_MAX_AGE"])
+if "DB_DISABLE_SERVER_SIDE_CURSORS" in os.environ:
+    DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = os.environ["DB_DISABLE_SERVER_SIDE_CURSORS"] == "1"
 
 AUTHENTICATION_BACKENDS = [
     "django.contrib.auth.backends.ModelBackend",
@@ -176,6 +209,109 @@ MEDIA_ROOT = BASE_DIR / 'media'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
+# Performance instrumentation (see backend/instrumentation.py)
+INSTRUMENTATION_ENABLED = True
+# Return resolver timings and SQL stats under `extensions.tracing` in GraphQL responses
+INSTRUMENTATION_TRACING_IN_RESPONSE = DEBUG
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'backend.instrumentation': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+        'backend.profiling': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
+
+
+# Prometheus metrics at /metrics (see backend/metrics.py)
+METRICS_ENABLED = True
+# When set, scrapers must send "Authorization: Bearer <token>"; without it only
+# staff users (or anyone with DEBUG on) can read /metrics
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+# Several worker processes per host: a directory (wiped on deploy) where each writes its numbers
+METRICS_MULTIPROCESS_DIR = os.environ.get("METRICS_MULTIPROCESS_DIR")
+METRICS_FLUSH_INTERVAL = 5  # Seconds between writes to METRICS_MULTIPROCESS_DIR
+METRICS_MAX_OPERATIONS = 100  # Distinct GraphQL operation names labeled, the rest count as "other"
+
+
+# On-demand request profiling (see backend/profiling.py)
+PROFILING_ENABLED = True
+# Reports directory, outside MEDIA_ROOT (served publicly); on Vercel only /tmp is writable
+PROFILING_DIR = Path(os.environ.get("PROFILING_DIR", BASE_DIR / "profiles"))
+PROFILING_TOKEN_MAX_AGE = 3600  # Seconds a signed X-Profile header stays valid
+PROFILING_SAMPLE_INTERVAL_MS = 10  # Interval of the sampling profiler, shorter ones add overhead
+PROFILING_MAX_REPORTS = 100  # Older reports are deleted
+
+
+# JWT authentication (cotizador/jwt_cache.py)
+JWT_PATHS = ("/graphql", "/gql")  # Only these endpoints read the token
+JWT_CACHE = "default"  # Cache holding verified tokens until they expire
+
+
+# Median time for a fresh process to load backend.wsgi and serve its first
+# request, checked by `manage.py profile_startup` (Vercel cold starts)
+COLD_START_BUDGET_MS = 1500
+
+
+# Caches
+# Local memory by default. A shared backend lets every process reuse (and
+# invalidate) the same entries, e.g. FileBasedCache, DatabaseCache or Redis:
+# {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": "redis://127.0.0.1:6379"}
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+}
+CATALOG_CACHE = "default"  # Cache holding catalog responses (see cotizador/catalog_cache.py)
+CATALOG_CACHE_TIMEOUT = 300  # Seconds; entries are also invalidated by model signals
+
+
+# GraphQL persisted queries and document cache (see backend/persisted_queries.py)
+PERSISTED_QUERIES_CACHE = "default"  # Django cache holding the hash -> query text store
+PERSISTED_QUERIES_TIMEOUT = 60 * 60 * 24  # Seconds a stored query is kept
+GRAPHQL_DOCUMENT_CACHE_SIZE = 256  # Parsed and validated documents kept per process
+GRAPHQL_GET_MAX_AGE = 60  # Cache-Control max-age for successful GET queries, 0 to disable
+
+
+# GraphQL query cost limits (see backend/query_cost.py), None disables a limit
+GRAPHQL_MAX_QUERY_DEPTH = 8
+GRAPHQL_MAX_QUERY_COST = 50_000  # Estimated objects loaded by one operation
+GRAPHQL_QUERY_COST_RATE = (500_000, 60)  # Cost each client may spend per window of seconds
+GRAPHQL_QUERY_COST_CACHE = "default"  # Cache holding the per-client spent cost
+# Header the proxy in front sets to the client's address, for anonymous clients (REMOTE_ADDR
+# is the proxy's). Only one the proxy always sets can be trusted; Vercel sets X-Real-IP.
+GRAPHQL_QUERY_COST_CLIENT_IP_HEADER = "HTTP_X_REAL_IP" if os.environ.get("VERCEL") else None
+GRAPHQL_DEFAULT_LIST_SIZE = 50  # Estimated length of list fields without `first`
+# Estimated lengths of specific list fields, e.g. unpaginated root lists. Keep
+# them near what the lists really hold: with GRAPHQL_MAX_QUERY_COST they decide
+# which of the existing unpaginated client queries still run. The root lists
+# return at most 500 rows (MAX_PAGE_SIZE in cotizador/graphql/pagination.py).
+GRAPHQL_LIST_SIZES = {
+    "Query.companies": 100,
+    "Query.products": 500,
+    "Query.customers": 200,
+    "Query.customerTiers": 10,
+    "Query.customerSpecificPrices": 500,
+    "Query.orders": 500,
+    "Query.orderItems": 500,
+    "Query.salesSummary": 500,
+    "CompanyType.customers": 20,
+    "CustomerType.orders": 10,
+    "CustomerType.resolveOrders": 10,
+    "OrderType.items": 10,
+}
+
+
 # Strawberry Configuration
 # This is the updated configuration for Strawberry GraphQL
 STRAWBERRY_SCHEMA = "backend.schema.schema"  # Point to your Strawberry schema
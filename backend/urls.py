@@ -14,18 +14,46 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
-from strawberry.django.views import AsyncGraphQLView
 from django.views.decorators.csrf import csrf_exempt
-from django.urls import path, include
+from django.urls import path, include, URLResolver
+from django.urls.resolvers import RoutePattern
 from django.conf import settings
 from django.conf.urls.static import static
-from backend.schema import schema  # Import your Strawberry schema
+
+from backend.metrics import metrics_view
+
+
+# Cold start: the admin, DRF and the GraphQL schema are only imported when a
+# URL that needs them is first hit, so a fresh lambda answering one kind of
+# request doesn't pay for the others. (reverse() loads everything, as it has to.)
+
+def lazy_include(route, urlconf, namespace=None):
+    """Like `path(route, include(urlconf))` but imports `urlconf` on first use."""
+    return URLResolver(RoutePattern(route), urlconf, app_name=namespace, namespace=namespace)
+
+
+def lazy_graphql_view(**view_kwargs):
+    """The GraphQL view, with the schema built on the first request instead of at import."""
+    view = None
+
+    @csrf_exempt
+    async def graphql_view(request, *args, **kwargs):
+        nonlocal view
+        if view is None:
+            from backend.schema import schema
+            from cotizador.graphql.views import CotizadorGraphQLView
+            view = CotizadorGraphQLView.as_view(schema=schema, **view_kwargs)
+        return await view(request, *args, **kwargs)
+
+    return graphql_view
+
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
-    path("graphql", csrf_exempt(AsyncGraphQLView.as_view(schema=schema, graphql_ide="graphiql"))),
-    path("gql", csrf_exempt(AsyncGraphQLView.as_view(schema=schema, graphql_ide=None))),
+    lazy_include('admin/', 'backend.admin_urls', namespace='admin'),
+    path("graphql", lazy_graphql_view(graphql_ide="graphiql"), name="graphql"),
+    path("gql", lazy_graphql_view(graphql_ide=None), name="gql"),
+    path("metrics", metrics_view, name="metrics"),
+    lazy_include('api/', 'cotizador.api_urls'),
     path("", include("cotizador.urls")),
 ]
 
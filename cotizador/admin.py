@@ -22,9 +22,9 @@ class ProductAdmin(admin.ModelAdmin):
 # Customer Admin
 @admin.register(Customer)
 class CustomerAdmin(admin.ModelAdmin):
-    list_display = ('name', 'email', 'phone', 'created_at', 'updated_at')
+    list_display = ('name', 'email', 'phone', 'tier', 'created_at', 'updated_at')
     search_fields = ('name', 'email', 'phone')
-    list_filter = ('created_at', 'updated_at')
+    list_filter = ('tier', 'created_at', 'updated_at')
     ordering = ('name',)
 
 
@@ -0,0 +1,117 @@
+"""
+DRF viewsets behind /api/ (routed in `api_urls.py`).
+
+Kept apart from `views.py` so the HTML views and the GraphQL endpoint don't
+import DRF: it's only loaded when an /api/ URL is first resolved.
+"""
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from rest_framework.decorators import api_view
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.response import Response
+from rest_framework.viewsets import ModelViewSet
+
+from . import catalog_cache, search as catalog_search
+from .filters import filter_queryset
+from .models import Product, Customer, Order
+from .pagination import CreatedAtCursorPagination
+from .serializers import ProductSerializer, CompanySerializer, CustomerSerializer, OrderSerializer
+
+
+class FilteredListMixin:
+    """
+    Applies the query params named in `filter_params` (see `filters.py`) to the
+    list action, e.g. `/api/orders/?customer=1&created_after=2025-01-01`.
+    """
+    filter_params = ()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action != 'list':
+            return queryset
+        filters = {name: self.request.query_params.get(name) for name in self.filter_params}
+        try:
+            return filter_queryset(queryset, **filters)
+        except DjangoValidationError as e:
+            raise ValidationError(e.messages)
+        except ValueError as e:
+            raise ValidationError(str(e))
+
+
+# Product API ViewSet
+
+class ProductViewSet(FilteredListMixin, ModelViewSet):
+    """
+    A ViewSet for viewing and editing product instances.
+    """
+    queryset = Product.objects.all()
+    serializer_class = ProductSerializer
+    pagination_class = CreatedAtCursorPagination
+    filter_params = ('created_after', 'created_before')
+    lookup_field = 'sku'  # Use SKU instead of the default ID for lookups
+
+    @method_decorator(condition(etag_func=lambda request, *args, **kwargs: catalog_cache.etag(request, Product)))
+    def list(self, request, *args, **kwargs):
+        # Cached per absolute URL (filters, cursor and page size), since the
+        # next/previous links include the host. Invalid filters or cursors
+        # raise before anything is cached.
+        def compute():
+            return super(ProductViewSet, self).list(request, *args, **kwargs).data
+
+        return Response(catalog_cache.get_or_set("api:products", [Product], compute, request.build_absolute_uri()))
+
+    @method_decorator(condition(etag_func=lambda request, *args, **kwargs: catalog_cache.etag(request, Product)))
+    def retrieve(self, request, *args, **kwargs):
+        # Override to fetch by SKU
+        sku = kwargs.get(self.lookup_field)  # DRF uses `lookup_field` here
+        # print(f"Retrieve called with SKU: {sku}")
+        try:
+            product = Product.objects.get(sku=sku)
+        except Product.DoesNotExist:
+            raise NotFound(f"Product with SKU '{sku}' not found.")
+        serializer = self.get_serializer(product)
+        # print(f"Retrieved Product Data: {serializer.data}")
+        return Response(serializer.data)
+
+# Customer API ViewSet
+class CustomerViewSet(FilteredListMixin, ModelViewSet):
+    queryset = Customer.objects.all()
+    serializer_class = CustomerSerializer
+    pagination_class = CreatedAtCursorPagination
+    filter_params = ('company', 'created_after', 'created_before')
+
+# Order API ViewSet
+class OrderViewSet(FilteredListMixin, ModelViewSet):
+    queryset = Order.objects.with_total_price().prefetch_related('items')  # Optimize queries
+    serializer_class = OrderSerializer
+    pagination_class = CreatedAtCursorPagination
+    filter_params = ('customer', 'company', 'created_after', 'created_before')
+
+
+SEARCH_SERIALIZERS = {
+    'product': ProductSerializer,
+    'customer': CustomerSerializer,
+    'company': CompanySerializer,
+}
+
+
+@api_view(['GET'])
+def search(request):
+    """
+    Full-text and SKU prefix search (see `search.py`), e.g.
+    `/api/search/?q=blue wid&types=product,company&first=10`.
+    """
+    term = request.query_params.get('q', '')
+    types = [name for name in request.query_params.get('types', '').split(',') if name]
+    try:
+        first = int(request.query_params.get('first', catalog_search.DEFAULT_FIRST))
+        hits = catalog_search.search(term, types=types, first=first)
+    except ValueError as e:
+        raise ValidationError(str(e))
+    return Response({
+        'results': [
+            {'type': hit.type, 'rank': hit.rank, 'object': SEARCH_SERIALIZERS[hit.type](hit.object).data}
+            for hit in hits
+        ]
+    })
@@ -0,0 +1,16 @@
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
+from . import api, views
+
+# DRF Router for ViewSets
+router = DefaultRouter()
+router.register(r'products', api.ProductViewSet, basename='product')
+router.register(r'customers', api.CustomerViewSet, basename='customer')
+router.register(r'orders', api.OrderViewSet, basename='order')
+
+urlpatterns = [
+    # Must come before the router, which would otherwise treat "create" as an order pk
+    path('orders/create/', views.create_order, name='create_order'),
+    path('search/', api.search, name='search'),
+    path('', include(router.urls)),
+]
@@ -0,0 +1,78 @@
+"""
+Response cache for read-heavy catalog data (products, companies, tiers).
+
+Entries live in the Django cache named by `CATALOG_CACHE` (local memory by
+default; point it at a file, database or Redis cache to share it between
+processes). Every entry is tagged with the models it was built from: the key
+embeds the current version of each tag, and `invalidate()` (wired to model
+signals in `signals.py`) replaces that version, so stale entries are never
+read again and simply expire. `bulk_create`/`update()` don't send signals,
+so code writing catalog rows that way must call `invalidate()` itself.
+
+The same tag versions back `etag()`, which lets views answer
+`If-None-Match` with a 304 without touching the database.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from backend import metrics
+
+_MISSING = object()
+
+
+def _cache():
+    return caches[getattr(settings, "CATALOG_CACHE", "default")]
+
+
+def _tag_key(model):
+    return f"catalog:tag:{model._meta.label_lower}"
+
+
+def tag_versions(*models):
+    """The current version of each model's tag, joined into one string."""
+    cache = _cache()
+    keys = [_tag_key(model) for model in models]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # add() so concurrent processes agree on the first version
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return ".".join(str(versions[key]) for key in keys)
+
+
+def invalidate(*models):
+    """Drops every entry tagged with any of `models`."""
+    _cache().set_many({_tag_key(model): time.time_ns() for model in models}, timeout=None)
+
+
+def _key(name, models, args):
+    digest = hashlib.sha256(repr(args).encode()).hexdigest()
+    return f"catalog:{name}:{digest}:{tag_versions(*models)}"
+
+
+def get_or_set(name, models, compute, *args):
+    """
+    Returns the cached value for `name` and `args`, calling `compute()` and
+    caching its result on a miss. `models` are the tags for the entry.
+    """
+    cache = _cache()
+    key = _key(name, models, args)
+    value = cache.get(key, _MISSING)
+    metrics.cache_lookup("catalog", hits=value is not _MISSING, misses=value is _MISSING)
+    if value is _MISSING:
+        value = compute()
+        cache.set(key, value, getattr(settings, "CATALOG_CACHE_TIMEOUT", 300))
+    return value
+
+
+def etag(request, *models):
+    """
+    ETag for a response that only depends on the request (URL and `Accept`)
+    and on the rows of `models`.
+    """
+    source = f"{request.build_absolute_uri()}:{request.headers.get('accept', '')}:{tag_versions(*models)}"
+    return f'"{hashlib.md5(source.encode()).hexdigest()}"'
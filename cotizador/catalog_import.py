@@ -0,0 +1,188 @@
+"""
+Bulk upserts of products and customer specific prices, e.g. from supplier CSVs.
+
+Rows are written in chunks with `bulk_create(update_conflicts=True)`, one
+statement per chunk. On PostgreSQL they are instead `COPY`ed into a temporary
+table and merged with a single `INSERT ... ON CONFLICT DO UPDATE`, which is
+several times faster for large files. Either way the import runs in one
+transaction, and a SKU (or customer/product pair) appearing more than once
+keeps its last row.
+
+None of this sends model signals, so the price and catalog caches are
+invalidated explicitly at the end.
+"""
+import csv
+import io
+from itertools import islice
+
+from django.db import connection, transaction
+
+from . import catalog_cache, pricing
+from .models import Customer, CustomerSpecificPrice, Product
+
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def _last_by(rows, key):
+    """Drops all but the last row for each key (ON CONFLICT can't touch a row twice)."""
+    return list({key(row): row for row in rows}.values())
+
+
+def _use_copy(use_copy):
+    return connection.vendor == "postgresql" if use_copy is None else use_copy
+
+
+def _invalidate_caches():
+    pricing.invalidate()
+    catalog_cache.invalidate(Product)
+
+
+def _copy(cursor, table, columns, rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    raw = cursor.cursor
+    if hasattr(raw, "copy_expert"):  # psycopg2
+        raw.copy_expert(sql, buffer)
+    else:  # psycopg 3
+        with raw.copy(sql) as copy:
+            copy.write(buffer.read())
+
+
+def upsert_products(rows, chunk_size=DEFAULT_CHUNK_SIZE, use_copy=None):
+    """
+    Inserts or updates products by `sku`. Each row is a dict with `sku`,
+    `name`, `base_price` and optionally `description`. `use_copy` defaults
+    to True on PostgreSQL. Returns the number of products written.
+    """
+    with transaction.atomic():
+        if _use_copy(use_copy):
+            count = _copy_products(rows, chunk_size)
+        else:
+            count = 0
+            for chunk in _chunks(rows, chunk_size):
+                products = Product.objects.bulk_create(
+                    [
+                        Product(
+                            sku=row["sku"],
+                            name=row["name"],
+                            description=row.get("description") or None,
+                            base_price=row["base_price"],
+                        )
+                        for row in _last_by(chunk, lambda row: row["sku"])
+                    ],
+                    update_conflicts=True,
+                    unique_fields=["sku"],
+                    update_fields=["name", "description", "base_price", "updated_at"],
+                )
+                count += len(products)
+    _invalidate_caches()
+    return count
+
+
+def _copy_products(rows, chunk_size):
+    table = connection.ops.quote_name(Product._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE TEMP TABLE import_product "
+            "(line bigserial, sku text, name text, description text, base_price numeric) ON COMMIT DROP"
+        )
+        for chunk in _chunks(rows, chunk_size):
+            _copy(cursor, "import_product", ("sku", "name", "description", "base_price"), [
+                (row["sku"], row["name"], row.get("description") or None, row["base_price"])
+                for row in chunk
+            ])
+        cursor.execute(f"""
+            INSERT INTO {table} (sku, name, description, base_price, created_at, updated_at)
+            SELECT DISTINCT ON (sku) sku, name, description, base_price, now(), now()
+            FROM import_product ORDER BY sku, line DESC
+            ON CONFLICT (sku) DO UPDATE SET
+                name = EXCLUDED.name,
+                description = EXCLUDED.description,
+                base_price = EXCLUDED.base_price,
+                updated_at = EXCLUDED.updated_at
+        """)
+        return cursor.rowcount
+
+
+def _with_customer_ids(rows):
+    # Converted before they reach a query, where "abc" would raise a bare ValueError
+    to_python = Customer._meta.pk.to_python
+    for row in rows:
+        yield {**row, "customer": to_python(row["customer"])}
+
+
+def upsert_customer_prices(rows, chunk_size=DEFAULT_CHUNK_SIZE, use_copy=None):
+    """
+    Inserts or updates customer specific prices by (customer, product). Each
+    row is a dict with `customer` (id), `sku` and `custom_price`. Rows for
+    unknown customers or SKUs are skipped. Returns the number of prices written.
+    Raises ValidationError for a customer id that isn't one.
+    """
+    rows = _with_customer_ids(rows)
+    with transaction.atomic():
+        if _use_copy(use_copy):
+            count = _copy_customer_prices(rows, chunk_size)
+        else:
+            count = 0
+            for chunk in _chunks(rows, chunk_size):
+                product_ids = dict(
+                    Product.objects.filter(sku__in={row["sku"] for row in chunk}).values_list("sku", "id")
+                )
+                customer_ids = set(
+                    Customer.objects.filter(pk__in={row["customer"] for row in chunk}).values_list("pk", flat=True)
+                )
+                known = [
+                    row for row in chunk
+                    if row["sku"] in product_ids and row["customer"] in customer_ids
+                ]
+                prices = CustomerSpecificPrice.objects.bulk_create(
+                    [
+                        CustomerSpecificPrice(
+                            customer_id=row["customer"],
+                            product_id=product_ids[row["sku"]],
+                            custom_price=row["custom_price"],
+                        )
+                        for row in _last_by(known, lambda row: (row["customer"], row["sku"]))
+                    ],
+                    update_conflicts=True,
+                    unique_fields=["customer", "product"],
+                    update_fields=["custom_price", "updated_at"],
+                )
+                count += len(prices)
+    _invalidate_caches()
+    return count
+
+
+def _copy_customer_prices(rows, chunk_size):
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE TEMP TABLE import_price "
+            "(line bigserial, customer_id bigint, sku text, custom_price numeric) ON COMMIT DROP"
+        )
+        for chunk in _chunks(rows, chunk_size):
+            _copy(cursor, "import_price", ("customer_id", "sku", "custom_price"), [
+                (row["customer"], row["sku"], row["custom_price"]) for row in chunk
+            ])
+        # The joins drop rows for unknown customers or SKUs
+        cursor.execute(f"""
+            INSERT INTO {quote(CustomerSpecificPrice._meta.db_table)}
+                (customer_id, product_id, custom_price, created_at, updated_at)
+            SELECT DISTINCT ON (i.customer_id, p.id) i.customer_id, p.id, i.custom_price, now(), now()
+            FROM import_price i
+            JOIN {quote(Product._meta.db_table)} p ON p.sku = i.sku
+            JOIN {quote(Customer._meta.db_table)} c ON c.id = i.customer_id
+            ORDER BY i.customer_id, p.id, i.line DESC
+            ON CONFLICT (customer_id, product_id) DO UPDATE SET
+                custom_price = EXCLUDED.custom_price,
+                updated_at = EXCLUDED.updated_at
+        """)
+        return cursor.rowcount
@@ -0,0 +1,261 @@
+"""
+Synthetic companies, customers, products and orders for benchmarks and for
+reproducing production-sized data locally.
+
+`generate()` adds rows next to whatever the database already holds (ids
+continue after the current highest primary key, so runs can be repeated) and
+is deterministic for a given `seed` and starting state. The data is skewed
+the way real sales are:
+
+- product popularity follows a Zipf law (`product_skew`), so a few products
+  appear in most orders and most products in almost none;
+- customers order with Pareto distributed frequency (`customer_skew`), a heavy
+  tail of big accounts and many occasional buyers;
+- items per order follow `items_per_order` (see `parse_distribution`);
+- orders are spread over the last `days` days, ids increasing with time.
+
+Rows are written with explicit ids in chunks, with multi-row `INSERT`s
+(`executemany`), or `COPY` on PostgreSQL, all in one transaction. Nothing
+goes through the ORM's save or `bulk_create`, so no model signals are sent:
+the rollups are rebuilt and the catalog and price caches invalidated at the
+end.
+"""
+import math
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import catalog_cache, pricing, rollups
+from .catalog_import import _copy
+from .models import Company, Customer, Order, OrderItem, Product
+
+DEFAULT_CHUNK_SIZE = 10_000
+DEFAULT_ITEMS_PER_ORDER = "poisson:3"
+# Zipf exponent of product popularity, ~1 for retail catalogs
+DEFAULT_PRODUCT_SKEW = 1.07
+# Pareto shape of customer order frequency, 1.16 is the 80/20 rule
+DEFAULT_CUSTOMER_SKEW = 1.16
+DEFAULT_DAYS = 365
+
+BUSINESS_LINES = ("Retail", "Wholesale", "Veterinary", "Grooming", "Pet hotel", "Online store")
+STATES = ("CDMX", "Jalisco", "Nuevo León", "Puebla", "Yucatán", "Querétaro", "Sonora", "Veracruz")
+PRODUCT_WORDS = ("Premium", "Dog", "Cat", "Food", "Toy", "Collar", "Leash", "Bed", "Shampoo", "Treats", "Bowl", "Litter")
+
+
+def parse_distribution(spec):
+    """
+    Returns a `sample(rng)` function for an items per order spec, one of
+    "N" (always N), "uniform:A-B", "poisson:MEAN" or "geometric:MEAN" (a
+    heavier tail). Samples are at least 1. Raises ValueError for bad specs.
+    """
+    kind, _, value = str(spec).partition(":")
+    try:
+        if not value:
+            count = int(kind)
+            if count < 1:
+                raise ValueError
+            return lambda rng: count
+        if kind == "uniform":
+            low, high = (int(part) for part in value.split("-"))
+            if not 1 <= low <= high:
+                raise ValueError
+            return lambda rng: rng.randint(low, high)
+        mean = float(value)
+        if mean < 1:
+            raise ValueError
+        if kind == "poisson":
+            # 1 + Poisson(mean - 1), Knuth's method (small means)
+            limit = math.exp(-(mean - 1))
+
+            def sample(rng):
+                count, product = 0, rng.random()
+                while product > limit:
+                    count += 1
+                    product *= rng.random()
+                return count + 1
+            return sample
+        if kind == "geometric":
+            if mean == 1:
+                return lambda rng: 1
+            log_q = math.log(1 - 1 / mean)
+            return lambda rng: 1 + int(math.log(1 - rng.random()) / log_q)
+    except ValueError:
+        pass
+    raise ValueError(
+        f"Invalid distribution {spec!r}, expected N, uniform:A-B, poisson:MEAN or geometric:MEAN."
+    )
+
+
+def _next_id(model):
+    return (model.objects.aggregate(last=Max("pk"))["last"] or 0) + 1
+
+
+def _insert(cursor, model, columns, rows, use_copy):
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    if use_copy:
+        _copy(cursor, table, [quote(column) for column in columns], rows)
+    else:
+        cursor.executemany(
+            f"INSERT INTO {table} ({', '.join(quote(column) for column in columns)}) "
+            f"VALUES ({', '.join(['%s'] * len(columns))})",
+            rows,
+        )
+    return len(rows)
+
+
+def _write(cursor, model, columns, rows, chunk_size, use_copy, progress):
+    """Writes the `rows` iterable in chunks, returns the number written."""
+    written = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            written += _insert(cursor, model, columns, chunk, use_copy)
+            chunk = []
+            if progress:
+                progress(model._meta.model_name, written)
+    if chunk:
+        written += _insert(cursor, model, columns, chunk, use_copy)
+    if progress:
+        progress(model._meta.model_name, written)
+    return written
+
+
+def _weights(count, rng, weight):
+    """Cumulative weights for `rng.choices`, `weight(rank)` assigned to a random permutation."""
+    weights = [weight(rank) for rank in range(1, count + 1)]
+    rng.shuffle(weights)
+    return list(accumulate(weights))
+
+
+@contextmanager
+def _sqlite_page_cache(size):
+    """Sets SQLite's page cache to `size` (PRAGMA cache_size) for the block, restoring it after."""
+    if connection.vendor != "sqlite":
+        yield
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA cache_size")
+        previous = cursor.fetchone()[0]
+        cursor.execute(f"PRAGMA cache_size = {int(size)}")
+    try:
+        yield
+    finally:
+        # Outside the block's transaction, which may have been broken by the error
+        with connection.cursor() as cursor:
+            cursor.execute(f"PRAGMA cache_size = {int(previous)}")
+
+
+def generate(companies=0, customers=0, products=0, orders=0, items_per_order=DEFAULT_ITEMS_PER_ORDER,
+             seed=0, product_skew=DEFAULT_PRODUCT_SKEW, customer_skew=DEFAULT_CUSTOMER_SKEW,
+             days=DEFAULT_DAYS, chunk_size=DEFAULT_CHUNK_SIZE, use_copy=None, rebuild_rollups=True,
+             progress=None):
+    """
+    Adds the given number of rows of each kind and returns the number written
+    per model. Customers are spread over all companies and orders over all
+    customers and products, existing ones included. `use_copy` defaults to
+    True on PostgreSQL. `progress(model_name, written)` is called after each
+    chunk. Raises ValueError for bad arguments.
+    """
+    sample_items = parse_distribution(items_per_order)
+    if product_skew < 0 or customer_skew <= 0 or days < 1 or chunk_size < 1:
+        raise ValueError("Skews, days and chunk size must be positive.")
+    use_copy = connection.vendor == "postgresql" if use_copy is None else use_copy
+    rng = random.Random(seed)
+    now = timezone.now()
+    adapt_datetime = connection.ops.adapt_datetimefield_value
+    timestamp = adapt_datetime(now)
+    written = {}
+
+    # The index pages of big tables don't fit in SQLite's default 2 MB page
+    # cache, and inserts in random key order keep missing it
+    with _sqlite_page_cache(-262144), transaction.atomic(), connection.cursor() as cursor:
+        first = _next_id(Company)
+        written["companies"] = _write(cursor, Company, ("id", "name", "business_line", "state", "created_at", "updated_at"), (
+            (n, f"Bench Company {n:07d}", rng.choice(BUSINESS_LINES), rng.choice(STATES), timestamp, timestamp)
+            for n in range(first, first + companies)
+        ), chunk_size, use_copy, progress)
+
+        written["customers"] = 0
+        if customers:
+            company_ids = list(Company.objects.values_list("pk", flat=True))
+            if not company_ids:
+                raise ValueError("Customers need at least one company.")
+            first = _next_id(Customer)
+            written["customers"] = _write(cursor, Customer, (
+                "id", "name", "email", "phone", "company_id", "created_at", "updated_at",
+            ), (
+                (n, f"Bench Customer {n:07d}", f"customer{n}@bench.example.com",
+                 f"55{rng.randrange(10 ** 8):08d}", rng.choice(company_ids), timestamp, timestamp)
+                for n in range(first, first + customers)
+            ), chunk_size, use_copy, progress)
+
+        first = _next_id(Product)
+        written["products"] = _write(cursor, Product, (
+            "id", "name", "sku", "description", "base_price", "created_at", "updated_at",
+        ), (
+            (n, f"{' '.join(rng.sample(PRODUCT_WORDS, 3))} {n:07d}", f"BENCH-{n:07d}",
+             " ".join(rng.choices(PRODUCT_WORDS, k=12)), Decimal(rng.randrange(500, 500_000)) / 100,
+             timestamp, timestamp)
+            for n in range(first, first + products)
+        ), chunk_size, use_copy, progress)
+
+        written["orders"] = written["order_items"] = 0
+        if orders:
+            customer_ids = list(Customer.objects.order_by("pk").values_list("pk", flat=True))
+            prices = dict(Product.objects.order_by("pk").values_list("pk", "base_price"))
+            product_ids = list(prices)
+            if not customer_ids or not product_ids:
+                raise ValueError("Orders need at least one customer and one product.")
+            customer_weights = _weights(len(customer_ids), rng, lambda rank: rng.paretovariate(customer_skew))
+            product_weights = _weights(len(product_ids), rng, lambda rank: rank ** -product_skew)
+
+            first = _next_id(Order)
+            first_item = _next_id(OrderItem)
+            start, span = now - timedelta(days=days), timedelta(days=days)
+            for offset in range(0, orders, chunk_size):
+                count = min(chunk_size, orders - offset)
+                buyers = rng.choices(customer_ids, cum_weights=customer_weights, k=count)
+                sizes = [sample_items(rng) for _ in range(count)]
+                picks = iter(rng.choices(product_ids, cum_weights=product_weights, k=sum(sizes)))
+                order_rows, item_rows = [], []
+                for index, (customer_id, size) in enumerate(zip(buyers, sizes)):
+                    order_id = first + offset + index
+                    created = adapt_datetime(start + span * ((offset + index + rng.random()) / orders))
+                    order_rows.append((order_id, customer_id, created, created))
+                    # Popular products get picked twice, add up the quantities
+                    lines = {}
+                    for product_id in (next(picks) for _ in range(size)):
+                        lines[product_id] = lines.get(product_id, 0) + min(1 + int(rng.expovariate(0.4)), 100)
+                    for product_id, quantity in lines.items():
+                        item_rows.append((first_item, order_id, product_id, quantity, prices[product_id]))
+                        first_item += 1
+                written["orders"] += _insert(
+                    cursor, Order, ("id", "customer_id", "created_at", "updated_at"), order_rows, use_copy
+                )
+                written["order_items"] += _write(
+                    cursor, OrderItem, ("id", "order_id", "product_id", "quantity", "price"), item_rows,
+                    chunk_size, use_copy, None,
+                )
+                if progress:
+                    progress("order", written["orders"])
+                    progress("orderitem", written["order_items"])
+
+        # Ids were given explicitly, move the sequences past them
+        for sql in connection.ops.sequence_reset_sql(no_style(), [Company, Customer, Product, Order, OrderItem]):
+            cursor.execute(sql)
+
+        if orders and rebuild_rollups:
+            rollups.rebuild()
+
+    catalog_cache.invalidate(Company, Product)
+    pricing.invalidate()
+    return written
@@ -0,0 +1,54 @@
+from .models import Product, Customer, Order, OrderItem, CustomerSpecificPrice
+
+
+# Maps the filter names accepted by the list endpoints (GraphQL connections and
+# DRF viewsets) to ORM lookups for each model. Every lookup targets either a
+# foreign key or `created_at`, so filters stay on indexed columns.
+FILTER_LOOKUPS = {
+    Product: {
+        "created_after": "created_at__gte",
+        "created_before": "created_at__lt",
+    },
+    Customer: {
+        "company": "company_id",
+        "created_after": "created_at__gte",
+        "created_before": "created_at__lt",
+    },
+    Order: {
+        "customer": "customer_id",
+        "company": "customer__company_id",
+        "created_after": "created_at__gte",
+        "created_before": "created_at__lt",
+    },
+    OrderItem: {
+        "order": "order_id",
+        "product": "product_id",
+        "customer": "order__customer_id",
+        "company": "order__customer__company_id",
+        "created_after": "order__created_at__gte",
+        "created_before": "order__created_at__lt",
+    },
+    CustomerSpecificPrice: {
+        "customer": "customer_id",
+        "product": "product_id",
+        "company": "customer__company_id",
+        "created_after": "created_at__gte",
+        "created_before": "created_at__lt",
+    },
+}
+
+
+def filter_queryset(queryset, **filters):
+    """
+    Applies the given filters to `queryset`, ignoring the ones set to None.
+    Raises ValueError for filters that are not supported for the model.
+    """
+    lookups = FILTER_LOOKUPS.get(queryset.model, {})
+    conditions = {}
+    for name, value in filters.items():
+        if value is None:
+            continue
+        if name not in lookups:
+            raise ValueError(f"Unsupported filter '{name}' for {queryset.model.__name__}.")
+        conditions[lookups[name]] = value
+    return queryset.filter(**conditions)
@@ -4,13 +4,14 @@ from .models import Customer, Product, Order, OrderItem, Company
 class CustomerForm(forms.ModelForm):
     class Meta:
         model = Customer
-        fields = ['id', 'name', 'email', 'phone', 'company']  # Include the company field
+        fields = ['id', 'name', 'email', 'phone', 'company', 'tier']  # Include the company field
         widgets = {
             'id': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Enter customer ID'}),
             'name': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Enter customer name'}),
             'email': forms.EmailInput(attrs={'class': 'form-control', 'placeholder': 'Enter email address'}),
             'phone': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Enter phone number'}),
             'company': forms.Select(attrs={'class': 'form-control'}),  
+            'tier': forms.Select(attrs={'class': 'form-control'}),
         }
         labels = {
             'id': 'Customer ID',
@@ -18,6 +19,7 @@ class CustomerForm(forms.ModelForm):
             'email': 'Email Address',
             'phone': 'Phone Number',
             'company': 'Company',
+            'tier': 'Pricing Tier',
         }
         
 class ProductForm(forms.ModelForm):
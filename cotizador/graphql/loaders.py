@@ -0,0 +1,48 @@
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from strawberry.dataloader import DataLoader
+from cotizador.models import Company, Product, Customer, CustomerTier, Order, OrderItem
+
+
+# Batch functions: each one turns a list of keys into a single `IN (...)` query
+# and returns the results in the same order as the keys, as DataLoader expects.
+
+def _load_by_id(queryset):
+    async def load(keys):
+        objects = await queryset.ain_bulk(keys)
+        return [objects.get(key) for key in keys]
+    return load
+
+
+def _load_many_by_fk(queryset, fk_name):
+    async def load(keys):
+        grouped = defaultdict(list)
+        async for row in queryset.filter(**{f"{fk_name}__in": keys}).order_by("pk"):
+            grouped[getattr(row, fk_name)].append(row)
+        return [grouped[key] for key in keys]
+    return load
+
+
+@dataclass
+class Loaders:
+    """
+    Per-request DataLoaders used by the relation resolvers in `types.py`.
+
+    A new instance is created for every GraphQL request (see `views.py`), so
+    cached rows never leak between requests or users.
+    """
+    company_by_id: DataLoader = field(default_factory=lambda: DataLoader(_load_by_id(Company.objects.all())))
+    customer_by_id: DataLoader = field(default_factory=lambda: DataLoader(_load_by_id(Customer.objects.all())))
+    product_by_id: DataLoader = field(default_factory=lambda: DataLoader(_load_by_id(Product.objects.all())))
+    tier_by_id: DataLoader = field(default_factory=lambda: DataLoader(_load_by_id(CustomerTier.objects.all())))
+    order_by_id: DataLoader = field(default_factory=lambda: DataLoader(_load_by_id(Order.objects.with_total_price())))
+    customers_by_company_id: DataLoader = field(
+        default_factory=lambda: DataLoader(_load_many_by_fk(Customer.objects.all(), "company_id"))
+    )
+    orders_by_customer_id: DataLoader = field(
+        default_factory=lambda: DataLoader(_load_many_by_fk(Order.objects.with_total_price(), "customer_id"))
+    )
+    items_by_order_id: DataLoader = field(
+        default_factory=lambda: DataLoader(_load_many_by_fk(OrderItem.objects.all(), "order_id"))
+    )
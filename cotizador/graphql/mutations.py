@@ -3,6 +3,7 @@ from strawberry.types import Info
 from asgiref.sync import sync_to_async
 from cotizador.models import Product, Order, OrderItem, Customer, Company
 from django.db import IntegrityError
+from cotizador import catalog_import, services
 from .types import ProductType, OrderType, OrderItemType, CustomerType, CompanyType
 
 
@@ -10,7 +11,31 @@ from .types import ProductType, OrderType, OrderItemType, CustomerType, CompanyT
 class OrderItemInput:
     product: strawberry.ID
     quantity: int
-    price: float
+    # When omitted, the customer's effective price is used (see cotizador/pricing.py)
+    price: float | None = None
+    # Existing item to change in updateOrder; when omitted items are matched by product
+    id: strawberry.ID | None = None
+
+
+@strawberry.input
+class OrderInput:
+    customer_id: strawberry.ID
+    items: list[OrderItemInput]
+
+
+@strawberry.input
+class ProductUpsertInput:
+    sku: str
+    name: str
+    base_price: float
+    description: str | None = None
+
+
+def _items_data(items: list[OrderItemInput]) -> list[dict]:
+    return [
+        {"id": item.id, "product": item.product, "quantity": item.quantity, "price": item.price}
+        for item in items
+    ]
 
 
 @strawberry.type
@@ -26,6 +51,13 @@ class CreateProductResponse:
     message: str | None = None
 
 
+@strawberry.type
+class BulkUpsertResponse:
+    success: bool
+    count: int = 0
+    message: str | None = None
+
+
 @strawberry.type
 class CreateCustomerResponse:
     success: bool
@@ -40,6 +72,13 @@ class CreateOrderResponse:
     message: str | None = None
     order_items: list[OrderItemType] | None = None
 
+
+@strawberry.type
+class CreateOrdersResponse:
+    success: bool
+    orders: list[OrderType] | None = None
+    message: str | None = None
+
     
 @strawberry.type
 class CreateCompanyResponse:
@@ -55,7 +94,7 @@ class Mutation:
         self, info: Info, name: str, sku: str, base_price: float, description: str | None = None
     ) -> CreateProductResponse:
         try:
-            product = await sync_to_async(Product.objects.create)(
+            product = await Product.objects.acreate(
                 name=name, description=description, sku=sku, base_price=base_price
             )
             return CreateProductResponse(success=True, product=product)
@@ -68,7 +107,7 @@ class Mutation:
         description: str | None = None, sku: str | None = None, base_price: float | None = None
     ) -> CreateProductResponse:
         try:
-            product = await sync_to_async(Product.objects.get)(pk=id)
+            product = await Product.objects.aget(pk=id)
             if name is not None:
                 product.name = name
             if description is not None:
@@ -77,7 +116,7 @@ class Mutation:
                 product.sku = sku
             if base_price is not None:
                 product.base_price = base_price
-            await sync_to_async(product.save)()
+            await product.asave()
             return CreateProductResponse(success=True, product=product, message="Product updated successfully.")
         except Product.DoesNotExist:
             return CreateProductResponse(success=False, product=None, message="Product not found.")
@@ -87,11 +126,28 @@ class Mutation:
             return CreateProductResponse(success=False, product=None, message=f"Error: {str(e)}")
 
 
+    @strawberry.mutation
+    async def bulk_upsert_products(self, info: Info, products: list[ProductUpsertInput]) -> BulkUpsertResponse:
+        # Creates or updates by SKU in bulk statements (see cotizador/catalog_import.py)
+        try:
+            count = await sync_to_async(catalog_import.upsert_products)([
+                {
+                    "sku": product.sku,
+                    "name": product.name,
+                    "description": product.description,
+                    "base_price": product.base_price,
+                }
+                for product in products
+            ])
+            return BulkUpsertResponse(success=True, count=count, message=f"{count} products upserted.")
+        except Exception as e:
+            return BulkUpsertResponse(success=False, message=f"Error: {str(e)}")
+
     @strawberry.mutation
     async def delete_product(self, info: Info, id: strawberry.ID) -> GenericResponse:
         try:
-            product = await sync_to_async(Product.objects.get)(pk=id)
-            await sync_to_async(product.delete)()
+            product = await Product.objects.aget(pk=id)
+            await product.adelete()
             return GenericResponse(success=True, message="Product deleted successfully.")
         except Product.DoesNotExist:
             return GenericResponse(success=False, message="Product not found.")
@@ -104,36 +160,14 @@ class Mutation:
         self, info: Info, customer_id: strawberry.ID, items: list[OrderItemInput]
     ) -> CreateOrderResponse:
         try:
-            # Fetch customer
-            customer = await sync_to_async(Customer.objects.get)(pk=customer_id)
-
-            # Create the order
-            order = await sync_to_async(Order.objects.create)(customer=customer)
-
-            # Create order items
-            order_items = []
-            for item in items:
-                product = await sync_to_async(Product.objects.get)(pk=item.product)
-                order_item = OrderItem(
-                    order=order,
-                    product=product,
-                    quantity=item.quantity,
-                    price=item.price,
-                )
-                order_items.append(order_item)
-
-            # Bulk create the order items
-            await sync_to_async(OrderItem.objects.bulk_create)(order_items)
-
-            # Retrieve the created items
-            created_order_items = await sync_to_async(list)(
-                OrderItem.objects.filter(order=order)
+            order, order_items = await sync_to_async(services.create_order)(
+                customer_id, _items_data(items)
             )
 
             return CreateOrderResponse(
                 success=True,
                 order=order,
-                order_items=created_order_items,
+                order_items=order_items,
                 message="Order created successfully."
             )
         except Customer.DoesNotExist:
@@ -159,11 +193,31 @@ class Mutation:
             )
 
 
+    @strawberry.mutation
+    async def create_orders(self, info: Info, orders: list[OrderInput]) -> CreateOrdersResponse:
+        try:
+            created = await sync_to_async(services.create_orders)([
+                {"customer": order.customer_id, "items": _items_data(order.items)}
+                for order in orders
+            ])
+            return CreateOrdersResponse(
+                success=True,
+                orders=[order for order, _ in created],
+                message=f"{len(created)} orders created successfully."
+            )
+        except Customer.DoesNotExist as e:
+            return CreateOrdersResponse(success=False, message=f"Customer not found: {str(e)}")
+        except Product.DoesNotExist as e:
+            return CreateOrdersResponse(success=False, message=f"Product not found: {str(e)}")
+        except Exception as e:
+            return CreateOrdersResponse(success=False, message=f"An error occurred: {str(e)}")
+
+
     @strawberry.mutation
     async def delete_order(self, info: Info, id: strawberry.ID) -> GenericResponse:
         try:
-            order = await sync_to_async(Order.objects.get)(pk=id)
-            await sync_to_async(order.delete)()
+            order = await Order.objects.aget(pk=id)
+            await order.adelete()
             return GenericResponse(success=True, message="Order deleted successfully.")
         except Order.DoesNotExist:
             return GenericResponse(success=False, message="Order not found.")
@@ -176,25 +230,12 @@ class Mutation:
         self, info: Info, id: strawberry.ID
     ) -> CreateOrderResponse:
         try:
-            original_order = await sync_to_async(Order.objects.get)(pk=id)
-
-            # Create a new order
-            new_order = await sync_to_async(Order.objects.create)(customer=original_order.customer)
-
-            # Duplicate the items
-            order_items = [
-                OrderItem(
-                    order=new_order,
-                    product=item.product,
-                    quantity=item.quantity,
-                    price=item.price,
-                )
-                for item in await sync_to_async(list)(original_order.items.all())
-            ]
-            await sync_to_async(OrderItem.objects.bulk_create)(order_items)
-
-            # Retrieve the duplicated items
-            duplicated_order_items = await sync_to_async(list)(OrderItem.objects.filter(order=new_order))
+            original_order = await Order.objects.aget(pk=id)
+
+            # Create the new order and copy the items in a single thread hop
+            new_order, duplicated_order_items = await sync_to_async(services.duplicate_order)(
+                original_order
+            )
 
             return CreateOrderResponse(
                 success=True,
@@ -224,31 +265,16 @@ class Mutation:
         items: list[OrderItemInput] | None = None
     ) -> CreateOrderResponse:
         try:
-            order = await sync_to_async(Order.objects.get)(pk=id)
-
-            # Update the customer if provided
-            if customer_id:
-                customer = await sync_to_async(Customer.objects.get)(pk=customer_id)
-                order.customer = customer
-
-            # Update order items if provided
-            if items:
-                await sync_to_async(order.items.all().delete)()  # Delete existing items
-                order_items = [
-                    OrderItem(
-                        order=order,
-                        product=await sync_to_async(Product.objects.get)(pk=item.product),
-                        quantity=item.quantity,
-                        price=item.price,
-                    )
-                    for item in items
-                ]
-                await sync_to_async(OrderItem.objects.bulk_create)(order_items)
+            order = await Order.objects.aget(pk=id)
 
-            await sync_to_async(order.save)()  # Save the order
-
-            # Retrieve the updated items
-            updated_order_items = await sync_to_async(list)(OrderItem.objects.filter(order=order))
+            # Update the customer and apply the item changes in a single transaction
+            order_items = await sync_to_async(services.update_order)(
+                order, customer_id=customer_id, items=_items_data(items) if items else None
+            )
+            if order_items is not None:
+                updated_order_items = order_items
+            else:
+                updated_order_items = [item async for item in order.items.all()]
 
             return CreateOrderResponse(
                 success=True,
@@ -277,6 +303,13 @@ class Mutation:
                 order=None,
                 order_items=None
             )
+        except OrderItem.DoesNotExist as e:
+            return CreateOrderResponse(
+                success=False,
+                message=str(e),
+                order=None,
+                order_items=None
+            )
         except Exception as e:
             return CreateOrderResponse(
                 success=False,
@@ -291,8 +324,8 @@ class Mutation:
         self, info: Info, name: str, email: str, phone: str | None = None, company_id: strawberry.ID | None = None
     ) -> CreateCustomerResponse:
         try:
-            company = await sync_to_async(Company.objects.get)(pk=company_id) if company_id else None
-            customer = await sync_to_async(Customer.objects.create)(
+            company = await Company.objects.aget(pk=company_id) if company_id else None
+            customer = await Customer.objects.acreate(
                 name=name, email=email, phone=phone, company=company
             )
             return CreateCustomerResponse(success=True, customer=customer, message="Customer created successfully.")
@@ -315,7 +348,7 @@ class Mutation:
     ) -> CreateCustomerResponse:
         try:
             # Fetch the customer
-            customer = await sync_to_async(Customer.objects.get)(pk=id)
+            customer = await Customer.objects.aget(pk=id)
 
             # Update customer details
             if name is not None:
@@ -326,7 +359,7 @@ class Mutation:
                 customer.phone = phone
             if company_id is not None:
                 try:
-                    company = await sync_to_async(Company.objects.get)(pk=company_id)
+                    company = await Company.objects.aget(pk=company_id)
                     customer.company = company
                 except Company.DoesNotExist:
                     return CreateCustomerResponse(
@@ -334,7 +367,7 @@ class Mutation:
                     )
 
             # Save the updated customer
-            await sync_to_async(customer.save)()
+            await customer.asave()
 
             return CreateCustomerResponse(
                 success=True,
@@ -358,8 +391,8 @@ class Mutation:
     async def delete_customer(self, info: Info, id: strawberry.ID) -> GenericResponse:
         try:
             # Fetch the customer
-            customer = await sync_to_async(Customer.objects.get)(pk=id)
-            await sync_to_async(customer.delete)()  # Delete the customer
+            customer = await Customer.objects.aget(pk=id)
+            await customer.adelete()  # Delete the customer
 
             return GenericResponse(success=True, message="Customer deleted successfully.")
         except Customer.DoesNotExist:
@@ -373,7 +406,7 @@ class Mutation:
         self, info: Info, name: str, business_line: str, state: str
     ) -> CreateCompanyResponse:
         try:
-            company = await sync_to_async(Company.objects.create)(
+            company = await Company.objects.acreate(
                 name=name, business_line=business_line, state=state
             )
             return CreateCompanyResponse(
@@ -404,7 +437,7 @@ class Mutation:
     ) -> CreateCompanyResponse:
         try:
             # Fetch the company
-            company = await sync_to_async(Company.objects.get)(pk=id)
+            company = await Company.objects.aget(pk=id)
 
             # Update company details
             if name is not None:
@@ -415,7 +448,7 @@ class Mutation:
                 company.state = state
 
             # Save the updated company
-            await sync_to_async(company.save)()
+            await company.asave()
 
             return CreateCompanyResponse(
                 success=True,
@@ -445,8 +478,8 @@ class Mutation:
     async def delete_company(self, info: Info, id: strawberry.ID) -> GenericResponse:
         try:
             # Fetch the company
-            company = await sync_to_async(Company.objects.get)(pk=id)
-            await sync_to_async(company.delete)()  # Delete the company
+            company = await Company.objects.aget(pk=id)
+            await company.adelete()  # Delete the company
 
             return GenericResponse(success=True, message="Company deleted successfully.")
         except Company.DoesNotExist:
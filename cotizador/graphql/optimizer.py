@@ -0,0 +1,165 @@
+"""
+Selection-aware queryset optimization for the root queries.
+
+`optimize(queryset, info)` reads the fields requested below the current
+resolver and restricts `queryset` to them:
+
+- `only()` with the requested columns (plus the primary key and the foreign
+  keys the relation resolvers need);
+- `select_related()` for requested foreign keys, recursively;
+- `Prefetch()` for requested reverse relations (`CompanyType.customers`,
+  `CustomerType.orders`, `OrderType.items`), with their own optimized
+  querysets.
+
+The relation resolvers in `types.py` return what was joined or prefetched
+(see `loaded`) and fall back to the per-request DataLoaders otherwise, so
+fields the optimizer doesn't know about still work, just in more queries.
+"""
+from dataclasses import dataclass, field
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from strawberry.types.nodes import SelectedField
+from strawberry.utils.str_converters import to_snake_case
+
+from cotizador.models import Customer, Order, OrderItem
+
+# GraphQL fields that aren't model fields: the columns they read, or None when
+# they read the total annotated by `Order.objects.with_total_price()`.
+COMPUTED_FIELDS = {
+    Order: {"total_price": None, "resolve_total_price": None},
+    OrderItem: {"total_price": ("quantity", "price"), "resolve_total_price": ("quantity", "price")},
+}
+
+# Where the rows of a Connection (pagination.py) are selected
+CONNECTION_NODE = ("edges", "node")
+
+# GraphQL fields that resolve a relation under another name
+RELATION_ALIASES = {
+    Customer: {"resolve_orders": "orders"},
+}
+
+
+@dataclass
+class _Plan:
+    relations: bool
+    only: set = field(default_factory=set)
+    select_related: set = field(default_factory=set)
+    # lookup: (related model, its foreign key, selections), merged per lookup
+    prefetch: dict = field(default_factory=dict)
+    annotate_total: bool = False
+
+    def apply(self, queryset):
+        queryset = queryset.only(*self.only)
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch:
+            queryset = queryset.prefetch_related(*(
+                Prefetch(lookup, queryset=_related_queryset(model, selections, fk_name))
+                for lookup, (model, fk_name, selections) in self.prefetch.items()
+            ))
+        return queryset
+
+
+def _fields(selections):
+    """The selected fields in `selections`, with fragments flattened."""
+    for selection in selections:
+        if isinstance(selection, SelectedField):
+            yield selection
+        else:
+            yield from _fields(selection.selections)
+
+
+def _reads_total(model, selections):
+    computed = COMPUTED_FIELDS.get(model, {})
+    return any(
+        to_snake_case(selection.name) in computed and computed[to_snake_case(selection.name)] is None
+        for selection in _fields(selections)
+    )
+
+
+def _related_queryset(model, selections, fk_name):
+    plan = _Plan(relations=True, only={"pk", fk_name})
+    _walk(model, selections, "", plan)
+    queryset = model._default_manager.all()
+    if plan.annotate_total:
+        queryset = queryset.with_total_price()
+    # Same order as the DataLoaders
+    return plan.apply(queryset.order_by("pk"))
+
+
+def _walk(model, selections, prefix, plan):
+    """Adds what `selections` read from `model` (reached through `prefix`) to `plan`."""
+    for selection in _fields(selections):
+        name = to_snake_case(selection.name)
+        name = RELATION_ALIASES.get(model, {}).get(name, name)
+
+        computed = COMPUTED_FIELDS.get(model, {})
+        if name in computed:
+            if computed[name] is None:
+                plan.annotate_total = True
+            else:
+                plan.only.update(prefix + column for column in computed[name])
+            continue
+
+        try:
+            model_field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            continue
+
+        if model_field.many_to_one or (model_field.one_to_one and model_field.concrete):
+            plan.only.add(prefix + name)
+            related_model = model_field.related_model
+            # select_related can't carry the order total annotation, leave those to the loader
+            if plan.relations and not _reads_total(related_model, selection.selections):
+                plan.select_related.add(prefix + name)
+                plan.only.add(f"{prefix}{name}__{related_model._meta.pk.name}")
+                _walk(related_model, selection.selections, f"{prefix}{name}__", plan)
+        elif model_field.one_to_many:
+            if plan.relations:
+                _, _, merged = plan.prefetch.setdefault(
+                    prefix + name, (model_field.related_model, model_field.field.name, [])
+                )
+                merged.extend(selection.selections)
+        elif model_field.concrete:
+            plan.only.add(prefix + name)
+
+
+def _selections_at(selected_fields, path):
+    selections = [selection for field in selected_fields for selection in field.selections]
+    for name in path:
+        selections = [
+            selection
+            for field in _fields(selections) if field.name == name
+            for selection in field.selections
+        ]
+    return selections
+
+
+def optimize(queryset, info, path=(), fields=(), relations=True):
+    """
+    Restricts `queryset` to the columns and relations requested below the
+    current field, or below `path` inside it (e.g. ("edges", "node") for a
+    connection). `fields` are always loaded (e.g. the pagination keys). With
+    `relations=False` only own columns are restricted, for querysets whose
+    results are cached.
+    """
+    plan = _Plan(relations=relations, only={"pk", *fields})
+    _walk(queryset.model, _selections_at(info.selected_fields, path), "", plan)
+    if plan.annotate_total and "annotated_total_price" not in queryset.query.annotations:
+        queryset = queryset.with_total_price()
+    return plan.apply(queryset)
+
+
+def only_key(queryset):
+    """Cache key part naming the columns an optimized queryset loads."""
+    fields, defer = queryset.query.deferred_loading
+    return ",".join(sorted(fields)) if not defer else ""
+
+
+def loaded(instance, name):
+    """Whether relation `name` of `instance` was joined or prefetched by `optimize`."""
+    if name in getattr(instance, "_prefetched_objects_cache", {}):
+        return True
+    descriptor = getattr(type(instance), name)
+    return hasattr(descriptor, "is_cached") and descriptor.is_cached(instance)
@@ -0,0 +1,107 @@
+import base64
+import json
+from typing import Generic, TypeVar
+
+import strawberry
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+T = TypeVar("T")
+
+
+@strawberry.type
+class PageInfo:
+    has_next_page: bool
+    end_cursor: str | None = None
+
+
+@strawberry.type
+class Edge(Generic[T]):
+    cursor: str
+    node: T
+
+
+@strawberry.type
+class Connection(Generic[T]):
+    edges: list[Edge[T]]
+    page_info: PageInfo
+
+
+def _field_name(ordering_field: str) -> str:
+    return ordering_field.lstrip("-")
+
+
+def encode_cursor(obj, ordering: tuple[str, ...]) -> str:
+    values = []
+    for ordering_field in ordering:
+        value = getattr(obj, _field_name(ordering_field))
+        values.append(value.isoformat() if hasattr(value, "isoformat") else value)
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor: str, model, ordering: tuple[str, ...]) -> list:
+    # Cursors come from clients: anything that isn't one of ours, including
+    # values the model fields reject, is the same error
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(values, list) or len(values) != len(ordering):
+            raise ValueError
+        values = [
+            model._meta.get_field(_field_name(ordering_field)).to_python(value)
+            for ordering_field, value in zip(ordering, values)
+        ]
+        if any(value is None for value in values):
+            raise ValueError
+    except (ValueError, TypeError, ValidationError):
+        raise ValueError("Invalid cursor.") from None
+    return values
+
+
+def _keyset_condition(ordering: tuple[str, ...], values: list) -> Q:
+    """
+    Builds the "row comes after the cursor" condition for a keyset, e.g. for
+    ("-created_at", "-id"): created_at < c OR (created_at = c AND id < i).
+    """
+    condition = Q()
+    equal_so_far = Q()
+    for ordering_field, value in zip(ordering, values):
+        name = _field_name(ordering_field)
+        lookup = "lt" if ordering_field.startswith("-") else "gt"
+        condition |= equal_so_far & Q(**{f"{name}__{lookup}": value})
+        equal_so_far &= Q(**{name: value})
+    return condition
+
+
+def paginate(queryset, first: int = DEFAULT_PAGE_SIZE, after: str | None = None,
+             ordering: tuple[str, ...] = ("-created_at", "-id")) -> Connection:
+    """
+    Returns one page of `queryset` as a Connection using keyset pagination.
+
+    Runs a single query that fetches one extra row to know whether there is a
+    next page. Must be called from a sync context.
+    """
+    if first < 0:
+        raise ValueError("'first' must be a positive number.")
+    first = min(first, MAX_PAGE_SIZE)
+
+    queryset = queryset.order_by(*ordering)
+    if after:
+        queryset = queryset.filter(
+            _keyset_condition(ordering, decode_cursor(after, queryset.model, ordering))
+        )
+
+    rows = list(queryset[:first + 1])
+    has_next_page = len(rows) > first
+    rows = rows[:first]
+
+    edges = [Edge(cursor=encode_cursor(row, ordering), node=row) for row in rows]
+    return Connection(
+        edges=edges,
+        page_info=PageInfo(
+            has_next_page=has_next_page,
+            end_cursor=edges[-1].cursor if edges else None,
+        ),
+    )
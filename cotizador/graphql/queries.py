@@ -1,71 +1,256 @@
 import strawberry
+from django.db.models import Sum
+from datetime import date, datetime
+from typing import Annotated
+from strawberry.types import Info
 from asgiref.sync import sync_to_async
+from cotizador import catalog_cache, pricing, rollups, search as catalog_search
+from cotizador.filters import filter_queryset
+from cotizador.services import in_bulk_or_raise
 from cotizador.models import (
     Company, Product, Customer, CustomerTier, CustomerSpecificPrice, Order, OrderItem
 )
+from .optimizer import CONNECTION_NODE, only_key, optimize
+from .pagination import Connection, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, paginate
 from .types import (
     CompanyType, ProductType, CustomerType, CustomerTierType,
-    CustomerSpecificPriceType, OrderType, OrderItemType
+    CustomerSpecificPriceType, OrderType, OrderItemType, QuoteType, QuoteLineType,
+    SalesGroupBy, SalesSummaryType, SearchResult, SearchType
 )
 
 
+@strawberry.input
+class QuoteItemInput:
+    product: strawberry.ID
+    quantity: int = 1
+
+
+def _build_quote(customer_id, items: list[QuoteItemInput]) -> QuoteType:
+    # Three queries whatever the cart size: customer, products and prices (tiers if needed)
+    customer = Customer.objects.get(pk=customer_id)
+    products = in_bulk_or_raise(Product, [item.product for item in items])
+    prices = pricing.price_matrix([customer], products.values())
+
+    lines = []
+    for item in items:
+        product = products[Product._meta.pk.to_python(item.product)]
+        unit_price = prices[(customer.id, product.id)]
+        lines.append(QuoteLineType(
+            product=product,
+            quantity=item.quantity,
+            unit_price=unit_price,
+            line_total=unit_price * item.quantity,
+        ))
+    return QuoteType(customer=customer, lines=lines, total=sum(line.line_total for line in lines))
+
+
+def _sales_summary(group_by: SalesGroupBy, from_: date | None, to: date | None) -> list[SalesSummaryType]:
+    # Reads the daily rollups (see rollups.py), never the orders themselves
+    if group_by == SalesGroupBy.DAY:
+        model, field = rollups.DIMENSIONS["company"][:2]
+        group = ("day",)
+    else:
+        model, field = rollups.DIMENSIONS[group_by.value][:2]
+        group = (f"{field}_id", f"{field}__name")
+
+    rows = model.objects.all()
+    if from_:
+        rows = rows.filter(day__gte=from_)
+    if to:
+        rows = rows.filter(day__lte=to)
+    rows = rows.values(*group).annotate(
+        total_revenue=Sum("revenue"), total_units=Sum("units"), total_orders=Sum("order_count")
+    )
+    rows = rows.order_by("day") if group_by == SalesGroupBy.DAY else rows.order_by("-total_revenue")
+
+    return [
+        SalesSummaryType(
+            key=str(row[group[0]]),
+            label=str(row[group[-1]]),
+            revenue=row["total_revenue"],
+            units=row["total_units"],
+            order_count=row["total_orders"],
+        )
+        for row in rows
+    ]
+
+
+def _deprecated_list(connection):
+    return f"Returns at most {MAX_PAGE_SIZE} rows, use `{connection}` to page through all of them."
+
+
 @strawberry.type
 class Query:
+    # The unpaginated lists return their first MAX_PAGE_SIZE rows by id, so a
+    # growing table can't make them load it in full. All but `companies` (a
+    # small table) are deprecated in favor of their connections below.
+
     @strawberry.field
-    async def companies(self) -> list[CompanyType]:
-        return await sync_to_async(list)(Company.objects.all())  # Fix async context
+    async def companies(self, info: Info) -> list[CompanyType]:
+        # Catalog lists are served from the catalog cache (see catalog_cache.py),
+        # which only tracks their own model, so relations are left to the loaders
+        queryset = optimize(Company.objects.order_by("pk"), info, relations=False)[:MAX_PAGE_SIZE]
+        return await sync_to_async(catalog_cache.get_or_set)(
+            "companies", [Company], lambda: list(queryset), only_key(queryset)
+        )
 
     @strawberry.field
-    async def company(self, id: strawberry.ID) -> CompanyType | None:
+    async def company(self, info: Info, id: strawberry.ID) -> CompanyType | None:
         try:
-            return await sync_to_async(Company.objects.get)(pk=id)  # Fix async context
+            return await optimize(Company.objects.all(), info).aget(pk=id)
         except Company.DoesNotExist:
             return None
 
-    @strawberry.field
-    async def products(self) -> list[ProductType]:
-        return await sync_to_async(list)(Product.objects.all())
+    @strawberry.field(deprecation_reason=_deprecated_list("productsConnection"))
+    async def products(self, info: Info) -> list[ProductType]:
+        queryset = optimize(Product.objects.order_by("pk"), info, relations=False)[:MAX_PAGE_SIZE]
+        return await sync_to_async(catalog_cache.get_or_set)(
+            "products", [Product], lambda: list(queryset), only_key(queryset)
+        )
 
     @strawberry.field
-    async def product(self, sku: str) -> ProductType | None:
+    async def product(self, info: Info, sku: str) -> ProductType | None:
         try:
-            return await sync_to_async(Product.objects.get)(sku=sku)
+            return await optimize(Product.objects.all(), info).aget(sku=sku)
         except Product.DoesNotExist:
             return None
 
-    @strawberry.field
-    async def customers(self) -> list[CustomerType]:
-        return await sync_to_async(list)(Customer.objects.all())
+    @strawberry.field(deprecation_reason=_deprecated_list("customersConnection"))
+    async def customers(self, info: Info) -> list[CustomerType]:
+        return [customer async for customer in optimize(Customer.objects.order_by("pk"), info)[:MAX_PAGE_SIZE]]
 
     @strawberry.field
-    async def customer(self, id: strawberry.ID) -> CustomerType | None:
+    async def customer(self, info: Info, id: strawberry.ID) -> CustomerType | None:
         try:
-            return await sync_to_async(Customer.objects.get)(id=id)
+            return await optimize(Customer.objects.all(), info).aget(id=id)
         except Customer.DoesNotExist:
             return None
 
     @strawberry.field
-    async def customer_tiers(self) -> list[CustomerTierType]:
-        return await sync_to_async(list)(CustomerTier.objects.all())
+    async def customer_tiers(self, info: Info) -> list[CustomerTierType]:
+        queryset = optimize(CustomerTier.objects.all(), info, relations=False)
+        return await sync_to_async(catalog_cache.get_or_set)(
+            "customer_tiers", [CustomerTier], lambda: list(queryset), only_key(queryset)
+        )
 
-    @strawberry.field
-    async def customer_specific_prices(self) -> list[CustomerSpecificPriceType]:
-        return await sync_to_async(list)(CustomerSpecificPrice.objects.all())
+    @strawberry.field(deprecation_reason=_deprecated_list("customerSpecificPricesConnection"))
+    async def customer_specific_prices(self, info: Info) -> list[CustomerSpecificPriceType]:
+        queryset = optimize(CustomerSpecificPrice.objects.order_by("pk"), info)[:MAX_PAGE_SIZE]
+        return [price async for price in queryset]
 
-    @strawberry.field
-    async def orders(self) -> list[OrderType]:
-        return await sync_to_async(list)(Order.objects.all())
+    @strawberry.field(deprecation_reason=_deprecated_list("ordersConnection"))
+    async def orders(self, info: Info) -> list[OrderType]:
+        return [order async for order in optimize(Order.objects.order_by("pk"), info)[:MAX_PAGE_SIZE]]
 
     @strawberry.field
-    async def order(self, id: strawberry.ID) -> OrderType | None:
+    async def order(self, info: Info, id: strawberry.ID) -> OrderType | None:
         try:
-            return await sync_to_async(Order.objects.get)(id=id)
+            return await optimize(Order.objects.all(), info).aget(id=id)
         except Order.DoesNotExist:
             return None
 
+    @strawberry.field(deprecation_reason=_deprecated_list("orderItemsConnection"))
+    async def order_items(self, info: Info) -> list[OrderItemType]:
+        return [item async for item in optimize(OrderItem.objects.order_by("pk"), info)[:MAX_PAGE_SIZE]]
+
+    @strawberry.field
+    async def quote(self, customer_id: strawberry.ID, items: list[QuoteItemInput]) -> QuoteType | None:
+        """Prices a cart for a customer using their specific prices and tier discount."""
+        try:
+            return await sync_to_async(_build_quote)(customer_id, items)
+        except Customer.DoesNotExist:
+            return None
+        except Product.DoesNotExist as e:
+            raise ValueError(f"Product not found: {e}")
+
+    @strawberry.field
+    async def sales_summary(
+        self, group_by: SalesGroupBy,
+        from_: Annotated[date | None, strawberry.argument(name="from")] = None,
+        to: date | None = None,
+    ) -> list[SalesSummaryType]:
+        """Revenue, units and orders per product, customer, company or day between two dates (inclusive)."""
+        return await sync_to_async(_sales_summary)(group_by, from_, to)
+
+    @strawberry.field
+    async def search(
+        self, term: str, types: list[SearchType] | None = None, first: int = catalog_search.DEFAULT_FIRST
+    ) -> list[SearchResult]:
+        """Full-text and SKU prefix search over products, customers and companies (see search.py)."""
+        hits = await sync_to_async(catalog_search.search)(
+            term, types=[search_type.value for search_type in types or ()], first=first
+        )
+        return [hit.object for hit in hits]
+
+    # Paginated versions of the list queries above. They use keyset cursors on
+    # (created_at, id), so large tables are never loaded in full.
+
+    @strawberry.field
+    async def products_connection(
+        self, info: Info, first: int = DEFAULT_PAGE_SIZE, after: str | None = None,
+        created_after: datetime | None = None, created_before: datetime | None = None
+    ) -> Connection[ProductType]:
+        queryset = filter_queryset(
+            Product.objects.all(), created_after=created_after, created_before=created_before
+        )
+        queryset = optimize(queryset, info, path=CONNECTION_NODE, fields=("created_at",))
+        return await sync_to_async(paginate)(queryset, first=first, after=after)
+
+    @strawberry.field
+    async def customers_connection(
+        self, info: Info, first: int = DEFAULT_PAGE_SIZE, after: str | None = None,
+        company_id: strawberry.ID | None = None,
+        created_after: datetime | None = None, created_before: datetime | None = None
+    ) -> Connection[CustomerType]:
+        queryset = filter_queryset(
+            Customer.objects.all(), company=company_id,
+            created_after=created_after, created_before=created_before
+        )
+        queryset = optimize(queryset, info, path=CONNECTION_NODE, fields=("created_at",))
+        return await sync_to_async(paginate)(queryset, first=first, after=after)
+
+    @strawberry.field
+    async def orders_connection(
+        self, info: Info, first: int = DEFAULT_PAGE_SIZE, after: str | None = None,
+        customer_id: strawberry.ID | None = None, company_id: strawberry.ID | None = None,
+        created_after: datetime | None = None, created_before: datetime | None = None
+    ) -> Connection[OrderType]:
+        queryset = filter_queryset(
+            Order.objects.all(), customer=customer_id, company=company_id,
+            created_after=created_after, created_before=created_before
+        )
+        queryset = optimize(queryset, info, path=CONNECTION_NODE, fields=("created_at",))
+        return await sync_to_async(paginate)(queryset, first=first, after=after)
+
+    @strawberry.field
+    async def order_items_connection(
+        self, info: Info, first: int = DEFAULT_PAGE_SIZE, after: str | None = None,
+        order_id: strawberry.ID | None = None, product_id: strawberry.ID | None = None,
+        customer_id: strawberry.ID | None = None, company_id: strawberry.ID | None = None,
+        created_after: datetime | None = None, created_before: datetime | None = None
+    ) -> Connection[OrderItemType]:
+        queryset = filter_queryset(
+            OrderItem.objects.all(), order=order_id, product=product_id,
+            customer=customer_id, company=company_id,
+            created_after=created_after, created_before=created_before
+        )
+        # OrderItem has no timestamps of its own, so its keyset is the id alone.
+        queryset = optimize(queryset, info, path=CONNECTION_NODE)
+        return await sync_to_async(paginate)(queryset, first=first, after=after, ordering=("-id",))
+
     @strawberry.field
-    async def order_items(self) -> list[OrderItemType]:
-        return await sync_to_async(list)(OrderItem.objects.all())
+    async def customer_specific_prices_connection(
+        self, info: Info, first: int = DEFAULT_PAGE_SIZE, after: str | None = None,
+        customer_id: strawberry.ID | None = None, product_id: strawberry.ID | None = None,
+        company_id: strawberry.ID | None = None,
+        created_after: datetime | None = None, created_before: datetime | None = None
+    ) -> Connection[CustomerSpecificPriceType]:
+        queryset = filter_queryset(
+            CustomerSpecificPrice.objects.all(), customer=customer_id, product=product_id,
+            company=company_id, created_after=created_after, created_before=created_before
+        )
+        queryset = optimize(queryset, info, path=CONNECTION_NODE, fields=("created_at",))
+        return await sync_to_async(paginate)(queryset, first=first, after=after)
 
 
 schema = strawberry.Schema(query=Query)
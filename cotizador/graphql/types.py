@@ -1,11 +1,13 @@
 from __future__ import annotations  # Delays evaluation of type annotations (Python 3.7+)
 import strawberry
-from typing import List
-from asgiref.sync import sync_to_async
+from enum import Enum
+from typing import Annotated, List, Union
+from strawberry.types import Info
 from strawberry_django import type as strawberry_django_type
 from cotizador.models import (
     Company, Product, Customer, CustomerTier, CustomerSpecificPrice, Order, OrderItem
 )
+from .optimizer import loaded
 
 # 1. Define CompanyType first because CustomerType directly references it.
 @strawberry_django_type(Company)
@@ -20,9 +22,12 @@ class CompanyType:
     customers: List["CustomerType"] = strawberry.field()
 
     @strawberry.field
-    async def customers(self) -> List[CustomerType]:
-        # This resolver fetches the customers for the company asynchronously.
-        return await sync_to_async(list)(self.customers.all())
+    async def customers(self, info: Info) -> List[CustomerType]:
+        # Prefetched by the optimizer, or batched through the per-request DataLoader
+        # to avoid one query per company.
+        if loaded(self, "customers"):
+            return list(self.customers.all())
+        return await info.context.loaders.customers_by_company_id.load(self.id)
 
 
 # 2. Define CustomerType next.
@@ -34,13 +39,36 @@ class CustomerType:
     phone: str | None
     # CompanyType is already defined above.
     company: CompanyType | None
+    tier: "CustomerTierType | None"
     # Use a forward reference for OrderType.
     orders: List["OrderType"] = strawberry.field()
 
     @strawberry.field
-    def resolve_orders(self) -> List["OrderType"]:
+    async def company(self, info: Info) -> CompanyType | None:
+        if loaded(self, "company"):
+            return self.company
+        return await info.context.loaders.company_by_id.load(self.company_id)
+
+    @strawberry.field
+    async def tier(self, info: Info) -> CustomerTierType | None:
+        if self.tier_id is None:
+            return None
+        if loaded(self, "tier"):
+            return self.tier
+        return await info.context.loaders.tier_by_id.load(self.tier_id)
+
+    @strawberry.field
+    async def orders(self, info: Info) -> List[OrderType]:
+        if loaded(self, "orders"):
+            return list(self.orders.all())
+        return await info.context.loaders.orders_by_customer_id.load(self.id)
+
+    @strawberry.field
+    async def resolve_orders(self, info: Info) -> List["OrderType"]:
         # This resolver fetches the orders for the customer.
-        return self.orders.all()
+        if loaded(self, "orders"):
+            return list(self.orders.all())
+        return await info.context.loaders.orders_by_customer_id.load(self.id)
 
 
 # 3. Define OrderType.
@@ -54,6 +82,18 @@ class OrderType:
     items: List["OrderItemType"] = strawberry.field()
     total_price: float = strawberry.field()
 
+    @strawberry.field
+    async def customer(self, info: Info) -> CustomerType:
+        if loaded(self, "customer"):
+            return self.customer
+        return await info.context.loaders.customer_by_id.load(self.customer_id)
+
+    @strawberry.field
+    async def items(self, info: Info) -> List[OrderItemType]:
+        if loaded(self, "items"):
+            return list(self.items.all())
+        return await info.context.loaders.items_by_order_id.load(self.id)
+
     @strawberry.field
     def resolve_total_price(self) -> float:
         # Calculate total price using a model method (for example).
@@ -92,6 +132,18 @@ class CustomerSpecificPriceType:
     created_at: str
     updated_at: str
 
+    @strawberry.field
+    async def customer(self, info: Info) -> CustomerType:
+        if loaded(self, "customer"):
+            return self.customer
+        return await info.context.loaders.customer_by_id.load(self.customer_id)
+
+    @strawberry.field
+    async def product(self, info: Info) -> ProductType:
+        if loaded(self, "product"):
+            return self.product
+        return await info.context.loaders.product_by_id.load(self.product_id)
+
 
 # 7. Define OrderItemType last.
 @strawberry_django_type(OrderItem)
@@ -103,7 +155,64 @@ class OrderItemType:
     price: float
     total_price: float = strawberry.field()
 
+    @strawberry.field
+    async def order(self, info: Info) -> OrderType:
+        if loaded(self, "order"):
+            return self.order
+        return await info.context.loaders.order_by_id.load(self.order_id)
+
+    @strawberry.field
+    async def product(self, info: Info) -> ProductType:
+        if loaded(self, "product"):
+            return self.product
+        return await info.context.loaders.product_by_id.load(self.product_id)
+
     @strawberry.field
     def resolve_total_price(self) -> float:
         # Calculate the total price for this order item.
         return self.get_total_price()
+
+
+# 8. Quote types, returned by Query.quote (plain types, not backed by a model).
+@strawberry.type
+class QuoteLineType:
+    product: ProductType
+    quantity: int
+    unit_price: float
+    line_total: float
+
+
+@strawberry.type
+class QuoteType:
+    customer: CustomerType
+    lines: List[QuoteLineType]
+    total: float
+
+
+# 9. Sales summary types, returned by Query.sales_summary from the daily rollups.
+@strawberry.enum
+class SalesGroupBy(Enum):
+    PRODUCT = "product"
+    CUSTOMER = "customer"
+    COMPANY = "company"
+    DAY = "day"
+
+
+@strawberry.type
+class SalesSummaryType:
+    key: str
+    label: str
+    revenue: float
+    units: int
+    order_count: int
+
+
+# 10. Search types, returned by Query.search.
+@strawberry.enum
+class SearchType(Enum):
+    PRODUCT = "product"
+    CUSTOMER = "customer"
+    COMPANY = "company"
+
+
+SearchResult = Annotated[Union[ProductType, CustomerType, CompanyType], strawberry.union("SearchResult")]
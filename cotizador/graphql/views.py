@@ -0,0 +1,47 @@
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from strawberry.django.context import StrawberryDjangoContext
+from strawberry.django.views import AsyncGraphQLView
+from .loaders import Loaders
+
+
+@dataclass
+class CotizadorContext(StrawberryDjangoContext):
+    """
+    Strawberry context with a fresh set of DataLoaders for each request.
+    """
+    loaders: Loaders = field(default_factory=Loaders)
+
+
+def _shared(request):
+    # Responses to authenticated requests may depend on the user, keep them out of shared caches
+    return "HTTP_AUTHORIZATION" not in request.META
+
+
+class CotizadorGraphQLView(AsyncGraphQLView):
+    async def get_context(self, request, response) -> CotizadorContext:
+        return CotizadorContext(request=request, response=response)
+
+    async def process_result(self, request, result):
+        # Only successful GET queries may be cached (mutations can't be sent over GET)
+        max_age = getattr(settings, "GRAPHQL_GET_MAX_AGE", 0)
+        request.graphql_cacheable = bool(max_age) and request.method == "GET" and not result.errors
+        data = await super().process_result(request, result)
+        if request.graphql_cacheable and _shared(request):
+            # The extensions (cost and throttle state, tracing) belong to this
+            # client and this run, a shared cache would serve them to others
+            data.pop("extensions", None)
+        return data
+
+    async def dispatch(self, request, *args, **kwargs):
+        response = await super().dispatch(request, *args, **kwargs)
+        if getattr(request, "graphql_cacheable", False):
+            max_age = getattr(settings, "GRAPHQL_GET_MAX_AGE", 0)
+            if _shared(request):
+                patch_cache_control(response, public=True, max_age=max_age)
+            else:
+                patch_cache_control(response, private=True, max_age=max_age)
+            patch_vary_headers(response, ["Authorization"])
+        return response
@@ -0,0 +1,160 @@
+"""
+Cached JWT authentication for the GraphQL endpoints.
+
+gqlauth's `django_jwt_middleware` decodes the token and queries the user on
+every request. `jwt_middleware` replaces it: it only runs on `JWT_PATHS`
+(the GraphQL endpoints, the only consumers of the token), and keeps a
+verified-token cache in the Django cache named by `JWT_CACHE`. Entries are
+keyed by the token's sha256 and hold a snapshot of the user's concrete fields
+(without the password hash, which is loaded on demand) until the token
+expires.
+
+Each user has a version in the cache that is replaced when the user is saved
+or deleted, or one of their refresh tokens is revoked (`RevokeToken`,
+`PasswordChange`); see `signals.py`. Entries built under another version are
+ignored, so those take effect on the next request.
+"""
+import asyncio
+import hashlib
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db.models.base import DEFERRED
+from django.utils.decorators import sync_and_async_middleware
+
+from backend import metrics
+
+
+def _cache():
+    return caches[getattr(settings, "JWT_CACHE", "default")]
+
+
+def _user_version_key(pk):
+    return f"jwt:user:{pk}"
+
+
+def _user_version(cache, pk):
+    key = _user_version_key(pk)
+    version = cache.get(key)
+    if version is None:
+        # add() so concurrent requests agree on the first version
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_user(pk):
+    """Drops every cached token of the user with primary key `pk`."""
+    _cache().set(_user_version_key(pk), time.time_ns(), timeout=None)
+
+
+def _snapshot(user):
+    return {
+        field.attname: getattr(user, field.attname)
+        for field in user._meta.concrete_fields if field.attname != "password"
+    }
+
+
+def _restore(snapshot):
+    user_model = get_user_model()
+    values = [snapshot.get(field.attname, DEFERRED) for field in user_model._meta.concrete_fields]
+    return user_model.from_db("default", None, values)
+
+
+def _user_pk(token, user_model, payload_field):
+    """Primary key of the user `token` was issued to, raises DoesNotExist."""
+    value = getattr(token.payload, payload_field)
+    if payload_field in ("pk", user_model._meta.pk.attname):
+        return value
+    # Tokens carry the username by default
+    pk = user_model.objects.filter(**{payload_field: value}).values_list("pk", flat=True).first()
+    if pk is None:
+        raise user_model.DoesNotExist
+    return pk
+
+
+def get_user_or_error(request):
+    """Same result as gqlauth's `get_user_or_error`, using the token cache."""
+    # gqlauth's JWT modules import most of strawberry, keep them off the cold start path
+    from gqlauth.core.exceptions import TokenExpired
+    from gqlauth.core.middlewares import UserOrError
+    from gqlauth.core.types_ import GQLAuthError, GQLAuthErrors
+    from gqlauth.core.utils import app_settings, utc_now
+    from gqlauth.jwt.types_ import TokenType
+    from jwt import PyJWTError
+
+    user_or_error = UserOrError()
+    token_str = app_settings.JWT_TOKEN_FINDER(request)
+    if not token_str:
+        user_or_error.error = GQLAuthError(code=GQLAuthErrors.MISSING_TOKEN)
+        return user_or_error
+
+    cache = _cache()
+    key = f"jwt:token:{hashlib.sha256(token_str.encode()).hexdigest()}"
+    entry = cache.get(key)
+    hit = entry is not None and entry["version"] == _user_version(cache, entry["pk"])
+    metrics.cache_lookup("jwt", hits=hit, misses=not hit)
+    if hit:
+        if entry["exp"] < utc_now():
+            user_or_error.error = GQLAuthError(code=GQLAuthErrors.EXPIRED_TOKEN)
+        else:
+            user_or_error.user = _restore(entry["user"])
+        return user_or_error
+
+    user_model = get_user_model()
+    try:
+        token = TokenType.from_token(token=token_str)
+        # The version is read before the user is loaded (as pricing.py reads
+        # the price cache's), so an invalidation landing while the user is
+        # loaded leaves this entry on the older version
+        pk = _user_pk(token, user_model, app_settings.JWT_PAYLOAD_PK.python_name)
+        version = _user_version(cache, pk)
+        user = user_model.objects.get(pk=pk)
+    except PyJWTError:
+        user_or_error.error = GQLAuthError(code=GQLAuthErrors.INVALID_TOKEN)
+        return user_or_error
+    except TokenExpired:
+        user_or_error.error = GQLAuthError(code=GQLAuthErrors.EXPIRED_TOKEN)
+        return user_or_error
+    except user_model.DoesNotExist:
+        user_or_error.error = GQLAuthError(code=GQLAuthErrors.INVALID_TOKEN)
+        return user_or_error
+
+    ttl = (token.payload.exp - utc_now()).total_seconds()
+    if ttl > 0:
+        cache.set(key, {
+            "pk": user.pk,
+            "version": version,
+            "exp": token.payload.exp,
+            "user": _snapshot(user),
+        }, timeout=ttl)
+    user_or_error.user = user
+    return user_or_error
+
+
+@sync_and_async_middleware
+def jwt_middleware(get_response):
+    """Sets `request.UserOrError` (read by `JwtSchema`) on the GraphQL endpoints only."""
+    paths = set(getattr(settings, "JWT_PATHS", ("/graphql", "/gql")))
+
+    def logic(request):
+        if not hasattr(request, "UserOrError"):
+            request.UserOrError = get_user_or_error(request)
+
+    if asyncio.iscoroutinefunction(get_response):
+        async_logic = sync_to_async(logic)
+
+        async def middleware(request):
+            if request.path_info in paths:
+                await async_logic(request)
+            return await get_response(request)
+    else:
+        def middleware(request):
+            if request.path_info in paths:
+                logic(request)
+            return get_response(request)
+
+    return middleware
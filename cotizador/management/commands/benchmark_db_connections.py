@@ -0,0 +1,85 @@
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+from django.db.backends.signals import connection_created
+from django.test import Client
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends requests from several threads and reports p50/p99 latency and how many database "
+        "connections were opened, with the configured connection settings (DB_CONNECTION_PROFILE) "
+        "and with every connection closed after each request (churn, like cold serverless instances)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", default="/api/orders/?page_size=1", help="Endpoint to hit.")
+        parser.add_argument("--requests", type=int, default=200, help="Requests per thread.")
+        parser.add_argument("--threads", type=int, default=4, help="Concurrent client threads.")
+
+    def handle(self, *args, **options):
+        database = settings.DATABASES["default"]
+        self.stdout.write(json.dumps({
+            "profile": getattr(settings, "DB_CONNECTION_PROFILE", None),
+            "conn_max_age": database.get("CONN_MAX_AGE", 0),
+            "health_checks": database.get("CONN_HEALTH_CHECKS", False),
+            "pool": bool(database.get("OPTIONS", {}).get("pool")),
+            "server_side_cursors": not database.get("DISABLE_SERVER_SIDE_CURSORS", False),
+        }))
+        for churn in (False, True):
+            self.stdout.write(json.dumps(self.run_load(options["path"], options["requests"], options["threads"], churn)))
+
+    def run_load(self, path, requests, threads, churn):
+        latencies = []
+        opened = 0
+        errors = 0
+        lock = threading.Lock()
+
+        def count_connection(sender, **kwargs):
+            nonlocal opened
+            with lock:
+                opened += 1
+
+        def worker():
+            nonlocal errors
+            client = Client()
+            try:
+                for _ in range(requests):
+                    start = time.perf_counter()
+                    response = client.get(path)
+                    elapsed = (time.perf_counter() - start) * 1000
+                    with lock:
+                        latencies.append(elapsed)
+                        errors += response.status_code != 200
+                    # The test client skips the request_finished cleanup, do it as the handler would
+                    if churn:
+                        connections.close_all()
+                    else:
+                        close_old_connections()
+            finally:
+                connections.close_all()
+
+        connection_created.connect(count_connection)
+        try:
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                for future in [executor.submit(worker) for _ in range(threads)]:
+                    future.result()
+        finally:
+            connection_created.disconnect(count_connection)
+
+        latencies.sort()
+        return {
+            "mode": "churn" if churn else "configured",
+            "requests": len(latencies),
+            "errors": errors,
+            "connections_opened": opened,
+            "ms_p50": round(statistics.median(latencies), 2),
+            "ms_p99": round(latencies[int(len(latencies) * 0.99) - 1], 2),
+            "ms_max": round(latencies[-1], 2),
+        }
@@ -0,0 +1,70 @@
+import asyncio
+import json
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client
+
+
+class Command(BaseCommand):
+    help = (
+        "Streams an order export and reports rows, throughput and peak Python memory. "
+        "Run it on datasets of different sizes (see generate_dataset): peak memory should stay the same."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=["csv", "ndjson"], default="csv", help="Export format.")
+        parser.add_argument("--query", default="", help="Filters, e.g. 'customer=1&created_after=2025-01-01'.")
+        parser.add_argument("--server", choices=["wsgi", "asgi"], default="wsgi", help="Handler to stream through.")
+
+    def handle(self, *args, **options):
+        path = f"/export/orders.{options['format']}"
+        if options["query"]:
+            path = f"{path}?{options['query']}"
+
+        tracemalloc.start()
+        try:
+            start = time.perf_counter()
+            if options["server"] == "asgi":
+                lines, size = asyncio.run(self.stream_asgi(path))
+            else:
+                lines, size = self.stream_wsgi(path)
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.stdout.write(json.dumps({
+            "path": path,
+            "server": options["server"],
+            "lines": lines,
+            "mb": round(size / 1024 / 1024, 2),
+            "seconds": round(elapsed, 2),
+            "lines_per_sec": round(lines / elapsed),
+            "peak_memory_mb": round(peak / 1024 / 1024, 2),
+        }))
+
+    def failed(self, response):
+        return CommandError(f"Export failed: {response.status_code} {response.content[:200]!r}")
+
+    def stream_wsgi(self, path):
+        response = Client().get(path)
+        if response.status_code != 200:
+            raise self.failed(response)
+        lines = size = 0
+        for chunk in response.streaming_content:
+            lines += chunk.count(b"\n")
+            size += len(chunk)
+        return lines, size
+
+    async def stream_asgi(self, path):
+        response = await AsyncClient().get(path)
+        if response.status_code != 200:
+            raise self.failed(response)
+        lines = size = 0
+        # Iterated the way ASGIHandler sends it
+        async for chunk in response:
+            lines += chunk.count(b"\n")
+            size += len(chunk)
+        return lines, size
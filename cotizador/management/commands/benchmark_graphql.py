@@ -0,0 +1,52 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+DEFAULT_QUERY = """
+query {
+    orders {
+        customer { company { name } }
+        items { product { sku } }
+    }
+}
+"""
+
+
+class Command(BaseCommand):
+    help = "Runs a GraphQL query against /gql and reports SQL query count and latency."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--query", default=DEFAULT_QUERY, help="GraphQL document to run.")
+        parser.add_argument("--repeat", type=int, default=5, help="Number of timed runs.")
+        parser.add_argument("--path", default="/gql", help="GraphQL endpoint to hit.")
+
+    def handle(self, *args, **options):
+        client = Client()
+        payload = json.dumps({"query": options["query"]})
+
+        timings = []
+        query_counts = []
+        for _ in range(options["repeat"]):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = client.post(options["path"], data=payload, content_type="application/json")
+                timings.append((time.perf_counter() - start) * 1000)
+            query_counts.append(len(queries.captured_queries))
+
+            body = response.json()
+            if response.status_code != 200 or body.get("errors"):
+                self.stderr.write(self.style.ERROR(f"Query failed: {body.get('errors') or response.status_code}"))
+                return
+
+        self.stdout.write(json.dumps({
+            "path": options["path"],
+            "runs": options["repeat"],
+            "sql_queries": max(query_counts),
+            "ms_min": round(min(timings), 2),
+            "ms_avg": round(sum(timings) / len(timings), 2),
+            "ms_max": round(max(timings), 2),
+        }))
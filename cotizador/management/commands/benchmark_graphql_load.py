@@ -0,0 +1,57 @@
+import asyncio
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient
+
+from .benchmark_graphql import DEFAULT_QUERY
+
+
+class Command(BaseCommand):
+    help = "Sends concurrent GraphQL requests through the ASGI handler and reports requests/sec."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--query", default=DEFAULT_QUERY, help="GraphQL document to run.")
+        parser.add_argument("--requests", type=int, default=200, help="Total number of requests.")
+        parser.add_argument("--concurrency", type=int, default=20, help="Requests in flight at once.")
+        parser.add_argument("--path", default="/gql", help="GraphQL endpoint to hit.")
+
+    def handle(self, *args, **options):
+        result = asyncio.run(self.run_load(
+            options["path"], json.dumps({"query": options["query"]}),
+            options["requests"], options["concurrency"],
+        ))
+        self.stdout.write(json.dumps(result))
+
+    async def run_load(self, path, payload, total, concurrency):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+        errors = 0
+
+        async def send():
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(path, data=payload, content_type="application/json")
+                latencies.append((time.perf_counter() - start) * 1000)
+                if response.status_code != 200 or json.loads(response.content).get("errors"):
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(send() for _ in range(total)))
+        elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        return {
+            "path": path,
+            "requests": total,
+            "concurrency": concurrency,
+            "errors": errors,
+            "requests_per_sec": round(total / elapsed, 2),
+            "ms_p50": round(statistics.median(latencies), 2),
+            "ms_p95": round(latencies[int(len(latencies) * 0.95) - 1], 2),
+            "ms_max": round(latencies[-1], 2),
+        }
@@ -0,0 +1,86 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from cotizador import services
+from cotizador.models import Customer, OrderItem, Product
+
+
+class Rollback(Exception):
+    pass
+
+
+def _delete_and_recreate(order, items):
+    # The previous update path, for comparison
+    with transaction.atomic():
+        order.items.all().delete()
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=item["product"], quantity=item["quantity"], price=item["price"])
+            for item in items
+        ])
+        order.save()
+
+
+class Command(BaseCommand):
+    help = (
+        "Updates an order with --lines items (one quantity changed, nothing changed, a few lines "
+        "swapped) through services.update_order and through the old delete-and-recreate path, "
+        "and reports time, queries and item rows written and deleted for each. Runs in a transaction "
+        "that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lines", type=int, default=500, help="Items in the order.")
+        parser.add_argument("--swap", type=int, default=5, help="Lines removed and added in the swap scenario.")
+
+    def handle(self, *args, **options):
+        lines, swap = options["lines"], options["swap"]
+        customer = Customer.objects.first()
+        products = list(Product.objects.order_by("pk")[:lines + swap])
+        if customer is None or len(products) < lines + swap:
+            raise CommandError(f"Needs a customer and at least {lines + swap} products.")
+
+        items = [{"product": product.pk, "quantity": 1, "price": product.base_price} for product in products[:lines]]
+        one_changed = [dict(item) for item in items]
+        one_changed[lines // 2]["quantity"] += 1
+        swapped = items[swap:] + [
+            {"product": product.pk, "quantity": 1, "price": product.base_price} for product in products[lines:]
+        ]
+        scenarios = [("one_quantity", one_changed), ("unchanged", items), ("swap", swapped)]
+
+        try:
+            with transaction.atomic():
+                order, _ = services.create_order(customer.pk, items)
+                for name, new_items in scenarios:
+                    for path, update in (("diff", services.update_order), ("recreate", _delete_and_recreate)):
+                        # Start every run from the original items
+                        services.update_order(order, items=items)
+                        self.stdout.write(json.dumps({
+                            "scenario": name, "path": path, "lines": lines,
+                            **self.measure(order, lambda: update(order, items=new_items)),
+                        }))
+                raise Rollback
+        except Rollback:
+            pass
+
+    def measure(self, order, update):
+        before = set(order.items.values_list("pk", "product_id", "quantity", "price"))
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            update()
+            elapsed = time.perf_counter() - start
+        item_writes = [
+            query["sql"] for query in queries.captured_queries
+            if query["sql"].startswith(("INSERT", "UPDATE", "DELETE")) and "cotizador_orderitem" in query["sql"][:40]
+        ]
+        after = set(order.items.values_list("pk", "product_id", "quantity", "price"))
+        return {
+            "ms": round(elapsed * 1000, 1),
+            "rows_written": len(after - before),
+            "rows_deleted": len({row[0] for row in before} - {row[0] for row in after}),
+            "queries": len(queries),
+            "item_write_statements": len(item_writes),
+        }
@@ -0,0 +1,342 @@
+import asyncio
+import json
+import math
+import platform
+import queue
+import random
+import re
+import secrets
+import threading
+import time
+from collections import defaultdict, namedtuple
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client, override_settings
+from django.utils import timezone
+
+from cotizador import dataset
+
+BENCHMARK_USERNAME = "benchmark"
+
+Scenario = namedtuple("Scenario", ["name", "method", "path", "headers", "body", "content_type", "bearer_prefix"])
+
+# Server-Timing header added by backend.instrumentation
+_SQL_COUNT = re.compile(r'desc="(\d+) queries"')
+
+
+def load_scenarios(path):
+    """Builds a Scenario per request of a Thunder Client collection, named "Folder/Request"."""
+    with open(path, encoding="utf-8") as f:
+        collection = json.load(f)
+    folders = {folder["_id"]: folder["name"] for folder in collection.get("folders", ())}
+    base_url = collection.get("settings", {}).get("options", {}).get("baseUrl", "")
+
+    scenarios = []
+    for request in sorted(collection.get("requests", ()), key=lambda request: request.get("sortNum", 0)):
+        url = request["url"].replace("{{baseUrl}}", base_url.rstrip("/"))
+        parts = urlsplit(url)
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+
+        body = request.get("body") or {}
+        kind = body.get("type")
+        if kind == "graphql":
+            graphql = body.get("graphql", {})
+            variables = graphql.get("variables") or None
+            payload = {"query": graphql["query"], "variables": json.loads(variables) if variables else None}
+            body, content_type = json.dumps(payload), "application/json"
+        elif kind == "json":
+            body, content_type = body.get("raw", ""), "application/json"
+        elif kind == "formencode":
+            body, content_type = {field["name"]: field["value"] for field in body.get("form", ())}, None
+        else:
+            body, content_type = None, None
+
+        auth = request.get("auth") or {}
+        name = "/".join(filter(None, [folders.get(request.get("containerId")), request["name"]]))
+        scenarios.append(Scenario(
+            name=name,
+            method=request["method"].lower(),
+            path=path,
+            headers={header["name"]: header["value"] for header in request.get("headers", ()) if header.get("isDisabled") is not True},
+            body=body,
+            content_type=content_type,
+            bearer_prefix=auth.get("bearerPrefix", "Bearer") if auth.get("type") == "bearer" else None,
+        ))
+    return scenarios
+
+
+def _with_credentials(scenario, username, password):
+    # Login requests carry someone's credentials, use the benchmark user's instead
+    if scenario.content_type != "application/json" or not scenario.body:
+        return scenario
+    payload = json.loads(scenario.body)
+    variables = payload.get("variables") if isinstance(payload, dict) else None
+    if not isinstance(variables, dict) or not {"username", "password"} <= set(variables):
+        return scenario
+    variables.update(username=username, password=password)
+    return scenario._replace(body=json.dumps(payload))
+
+
+def _percentile(values, percent):
+    # Nearest rank, values sorted
+    return round(values[max(math.ceil(len(values) * percent / 100) - 1, 0)], 2)
+
+
+def _summary(samples, elapsed=None):
+    latencies = sorted(sample[0] for sample in samples)
+    sql_counts = [sample[1] for sample in samples if sample[1] is not None]
+    summary = {
+        "requests": len(samples),
+        "errors": sum(1 for sample in samples if sample[2]),
+    }
+    if elapsed is not None:
+        summary["requests_per_sec"] = round(len(samples) / elapsed, 2)
+    summary.update({
+        "ms_p50": _percentile(latencies, 50),
+        "ms_p95": _percentile(latencies, 95),
+        "ms_p99": _percentile(latencies, 99),
+        "ms_max": round(latencies[-1], 2),
+        "sql_per_request": round(sum(sql_counts) / len(sql_counts), 2) if sql_counts else None,
+        "sql_max": max(sql_counts) if sql_counts else None,
+    })
+    return summary
+
+
+class Command(BaseCommand):
+    help = (
+        "Replays the requests of a Thunder Client collection as a weighted mix through the "
+        "in-process WSGI and/or ASGI handlers at the given concurrency, and reports latency "
+        "percentiles, requests/sec and SQL queries per request as JSON, overall and per request. "
+        "Runs against the configured database; --companies/--customers/--products/--orders add "
+        "synthetic rows first. Requests with bearer auth get a token for a '%s' user, and login "
+        "variables get its credentials." % BENCHMARK_USERNAME
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--collection", default=str(Path(settings.BASE_DIR) / "thunderclient-collection.json"),
+            help="Thunder Client collection to replay.",
+        )
+        parser.add_argument(
+            "--weight", action="append", default=[], metavar="NAME=WEIGHT",
+            help='Relative weight of a request, e.g. "Companies/List=5" (default 1, 0 leaves it out).',
+        )
+        parser.add_argument("--requests", type=int, default=500, help="Requests per run.")
+        parser.add_argument(
+            "--concurrency", default="1,10", help="Comma separated requests in flight, one run for each.",
+        )
+        parser.add_argument(
+            "--server", choices=["wsgi", "asgi", "both"], default="both", help="Handler(s) to run through.",
+        )
+        parser.add_argument("--warmup", type=int, default=2, help="Unmeasured requests per scenario first.")
+        parser.add_argument("--seed", type=int, default=0, help="Seed for the request mix and the dataset.")
+        parser.add_argument(
+            "--throttle", action="store_true",
+            help="Keep GRAPHQL_QUERY_COST_RATE, which a long run can exhaust (off by default).",
+        )
+        parser.add_argument("--output", help="Also write the report to this file.")
+        parser.add_argument("--baseline", help="Earlier report to compare each run with.")
+        for model in ("companies", "customers", "products", "orders"):
+            parser.add_argument(f"--{model}", type=int, default=0, help=f"Synthetic {model} to add first.")
+        parser.add_argument(
+            "--items-per-order", default=dataset.DEFAULT_ITEMS_PER_ORDER,
+            help="Distribution of items per synthetic order, see generate_dataset.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            scenarios = load_scenarios(options["collection"])
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f"Can't read the collection: {e}")
+        weights = self.weights(scenarios, options["weight"])
+        scenarios = [scenario for scenario in scenarios if weights[scenario.name] > 0]
+        if not scenarios:
+            raise CommandError("No requests to replay.")
+        try:
+            concurrencies = [int(value) for value in options["concurrency"].split(",")]
+        except ValueError:
+            raise CommandError("--concurrency must be comma separated numbers.")
+        if options["requests"] < 1 or min(concurrencies) < 1:
+            raise CommandError("--requests and --concurrency must be positive.")
+
+        generated = None
+        if any(options[model] for model in ("companies", "customers", "products", "orders")):
+            try:
+                generated = dataset.generate(
+                    companies=options["companies"], customers=options["customers"],
+                    products=options["products"], orders=options["orders"],
+                    items_per_order=options["items_per_order"], seed=options["seed"],
+                )
+            except ValueError as e:
+                raise CommandError(str(e))
+
+        password = secrets.token_urlsafe(16)
+        user = self.benchmark_user(password)
+        scenarios = [_with_credentials(scenario, user.username, password) for scenario in scenarios]
+        mix = random.Random(options["seed"]).choices(
+            scenarios, [weights[scenario.name] for scenario in scenarios], k=options["requests"]
+        )
+
+        report = {
+            "started_at": timezone.now().isoformat(),
+            "collection": options["collection"],
+            "database": connection.vendor,
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "generated": generated,
+            "dataset": self.dataset_size(),
+            "weights": {scenario.name: weights[scenario.name] for scenario in scenarios},
+            "runs": [],
+        }
+        servers = ["wsgi", "asgi"] if options["server"] == "both" else [options["server"]]
+        throttle = {} if options["throttle"] else {"GRAPHQL_QUERY_COST_RATE": None}
+        with override_settings(**throttle):
+            for server in servers:
+                for concurrency in concurrencies:
+                    # Fresh token per run, gqlauth tokens expire after a few minutes
+                    token = self.token(user)
+                    warmup = [scenario for scenario in scenarios for _ in range(options["warmup"])]
+                    run = self.run_wsgi if server == "wsgi" else self.run_asgi
+                    run(warmup, concurrency, token)
+                    start = time.perf_counter()
+                    samples = run(mix, concurrency, token)
+                    elapsed = time.perf_counter() - start
+
+                    by_scenario = defaultdict(list)
+                    for scenario, sample in zip(mix, samples):
+                        by_scenario[scenario.name].append(sample)
+                    report["runs"].append({
+                        "server": server,
+                        "concurrency": concurrency,
+                        **_summary(samples, elapsed),
+                        "scenarios": {name: _summary(by_scenario[name]) for name in sorted(by_scenario)},
+                    })
+
+        if options["baseline"]:
+            self.compare(report, options["baseline"])
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            Path(options["output"]).write_text(output + "\n", encoding="utf-8")
+        self.stdout.write(output)
+
+    def weights(self, scenarios, values):
+        weights = {scenario.name: 1.0 for scenario in scenarios}
+        for value in values:
+            name, _, weight = value.rpartition("=")
+            if name not in weights:
+                raise CommandError(f"Unknown request {name!r}, the collection has: {', '.join(weights)}.")
+            try:
+                weights[name] = float(weight)
+            except ValueError:
+                raise CommandError(f"Invalid weight in {value!r}.")
+        return weights
+
+    def benchmark_user(self, password):
+        from gqlauth.models import UserStatus
+
+        user, _ = get_user_model().objects.get_or_create(
+            username=BENCHMARK_USERNAME, defaults={"email": f"{BENCHMARK_USERNAME}@bench.example.com"},
+        )
+        user.set_password(password)
+        user.save()
+        UserStatus.objects.update_or_create(user=user, defaults={"verified": True})
+        return user
+
+    def token(self, user):
+        from gqlauth.jwt.types_ import TokenType
+
+        return TokenType.from_user(user).token
+
+    def dataset_size(self):
+        from cotizador.models import Company, Customer, Order, OrderItem, Product
+
+        return {
+            model._meta.model_name: model.objects.count()
+            for model in (Company, Customer, Product, Order, OrderItem)
+        }
+
+    def request_kwargs(self, scenario, token):
+        headers = dict(scenario.headers)
+        if scenario.bearer_prefix is not None:
+            headers["Authorization"] = f"{scenario.bearer_prefix} {token}"
+        kwargs = {"headers": headers}
+        if scenario.body is not None:
+            kwargs["data"] = scenario.body
+        if scenario.content_type is not None:
+            kwargs["content_type"] = scenario.content_type
+        return kwargs
+
+    def sample(self, response, elapsed_ms):
+        match = _SQL_COUNT.search(response.get("Server-Timing", ""))
+        error = response.status_code >= 400
+        if not error and response.get("Content-Type", "").startswith("application/json"):
+            body = json.loads(response.content)
+            error = isinstance(body, dict) and bool(body.get("errors"))
+        return elapsed_ms, int(match.group(1)) if match else None, error
+
+    def run_wsgi(self, mix, concurrency, token):
+        """Runs `mix` on `concurrency` threads, each with its own client and database connection."""
+        pending = queue.Queue()
+        for index, scenario in enumerate(mix):
+            pending.put((index, scenario))
+        samples = [None] * len(mix)
+
+        def worker():
+            client = Client(raise_request_exception=False)
+            try:
+                while True:
+                    try:
+                        index, scenario = pending.get_nowait()
+                    except queue.Empty:
+                        return
+                    start = time.perf_counter()
+                    response = getattr(client, scenario.method)(scenario.path, **self.request_kwargs(scenario, token))
+                    samples[index] = self.sample(response, (time.perf_counter() - start) * 1000)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return samples
+
+    def run_asgi(self, mix, concurrency, token):
+        async def run():
+            client = AsyncClient(raise_request_exception=False)
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def send(scenario):
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await getattr(client, scenario.method)(
+                        scenario.path, **self.request_kwargs(scenario, token)
+                    )
+                    return self.sample(response, (time.perf_counter() - start) * 1000)
+
+            return await asyncio.gather(*(send(scenario) for scenario in mix))
+
+        return list(asyncio.run(run()))
+
+    def compare(self, report, path):
+        try:
+            baseline = json.loads(Path(path).read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Can't read the baseline: {e}")
+        previous = {(run["server"], run["concurrency"]): run for run in baseline.get("runs", ())}
+        for run in report["runs"]:
+            before = previous.get((run["server"], run["concurrency"]))
+            if before is None:
+                continue
+            run["change"] = {
+                key: round(run[key] - before[key], 2)
+                for key in ("requests_per_sec", "ms_p50", "ms_p95", "ms_p99", "sql_per_request")
+                if run.get(key) is not None and before.get(key) is not None
+            }
@@ -0,0 +1,72 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from cotizador.models import Company, Product, Customer, CustomerSpecificPrice, Order, OrderItem
+
+
+def list_queries(search):
+    """The hot list queries of the admin, REST and GraphQL views, by label."""
+    customer = Customer.objects.order_by("pk").first()
+    company = Company.objects.order_by("pk").first()
+    product = Product.objects.order_by("pk").first()
+    order_ids = list(Order.objects.order_by("-created_at", "-id").values_list("pk", flat=True)[:50])
+    return {
+        "orders (newest first)": Order.objects.order_by("-created_at", "-id")[:50],
+        "orders with totals": Order.objects.with_total_price().order_by("-created_at", "-id")[:50],
+        "orders of a customer": Order.objects.filter(customer=customer).order_by("-created_at", "-id")[:50],
+        "items of a page of orders": OrderItem.objects.filter(order_id__in=order_ids),
+        "customers of a company": Customer.objects.filter(company=company).order_by("name"),
+        "specific prices of a product": CustomerSpecificPrice.objects.filter(product=product),
+        "products (newest first)": Product.objects.order_by("-created_at", "-id")[:50],
+        "admin product search": Product.objects.filter(name__icontains=search) | Product.objects.filter(sku__icontains=search),
+        "admin customer search": Customer.objects.filter(name__icontains=search),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Prints the query plans (EXPLAIN ANALYZE on PostgreSQL) of the main list queries. "
+        "With --compare it also plans them with the cotizador indexes dropped inside a "
+        "rolled back transaction. That locks the tables while it runs, so use a copy of production."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--compare", action="store_true", help="Also show the plans without the cotizador indexes.")
+        parser.add_argument("--search", default="A", help="Term used for the admin search queries.")
+
+    def handle(self, *args, **options):
+        queries = list_queries(options["search"])
+
+        before = None
+        if options["compare"]:
+            with transaction.atomic():
+                self._drop_indexes()
+                before = {label: self._explain(queryset) for label, queryset in queries.items()}
+                transaction.set_rollback(True)
+        after = {label: self._explain(queryset) for label, queryset in queries.items()}
+
+        for label, queryset in queries.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+            self.stdout.write(str(queryset.query))
+            if before is not None:
+                self.stdout.write(self.style.WARNING("-- without indexes"))
+                self.stdout.write(before[label])
+                self.stdout.write(self.style.SUCCESS("-- with indexes"))
+            self.stdout.write(after[label])
+            self.stdout.write("")
+
+    def _explain(self, queryset):
+        if connection.vendor == "postgresql":
+            return queryset.explain(analyze=True, buffers=True)
+        return queryset.explain()
+
+    def _drop_indexes(self):
+        # Only the indexes declared in Meta.indexes (the ones added for these queries).
+        # Plain DROP INDEX because the SQLite schema editor refuses to run inside a transaction.
+        with connection.cursor() as cursor:
+            for model in apps.get_app_config("cotizador").get_models():
+                existing = connection.introspection.get_constraints(cursor, model._meta.db_table)
+                for index in model._meta.indexes:
+                    if index.name in existing:
+                        cursor.execute(f"DROP INDEX {connection.ops.quote_name(index.name)}")
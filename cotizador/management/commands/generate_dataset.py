@@ -0,0 +1,82 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from cotizador import dataset
+
+
+class Command(BaseCommand):
+    help = (
+        "Adds synthetic companies, customers, products and orders with Zipf product popularity and "
+        "heavy-tailed customer activity, deterministically for a given --seed. Writes with multi-row "
+        "inserts, or COPY on PostgreSQL, in one transaction, and reports rows and rows/sec."
+    )
+
+    def add_arguments(self, parser):
+        for model in ("companies", "customers", "products", "orders"):
+            parser.add_argument(f"--{model}", type=int, default=0, help=f"{model.capitalize()} to add.")
+        parser.add_argument(
+            "--items-per-order", default=dataset.DEFAULT_ITEMS_PER_ORDER,
+            help='N, "uniform:A-B", "poisson:MEAN" or "geometric:MEAN" (default %(default)s).',
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--product-skew", type=float, default=dataset.DEFAULT_PRODUCT_SKEW,
+            help="Zipf exponent of product popularity, 0 for uniform (default %(default)s).",
+        )
+        parser.add_argument(
+            "--customer-skew", type=float, default=dataset.DEFAULT_CUSTOMER_SKEW,
+            help="Pareto shape of customer activity, lower is more skewed (default %(default)s).",
+        )
+        parser.add_argument(
+            "--days", type=int, default=dataset.DEFAULT_DAYS, help="Orders are spread over this many past days.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=dataset.DEFAULT_CHUNK_SIZE)
+        parser.add_argument(
+            "--no-copy", action="store_true", help="Use multi-row inserts even on PostgreSQL instead of COPY.",
+        )
+        parser.add_argument(
+            "--skip-rollups", action="store_true",
+            help="Don't rebuild the daily sales rollups (run rebuild_rollups later).",
+        )
+
+    def handle(self, *args, **options):
+        last_reported = {}
+
+        def progress(model_name, written):
+            # Every ~100k rows, on stderr so stdout stays JSON
+            if written // 100_000 != last_reported.get(model_name, 0) // 100_000:
+                self.stderr.write(f"{model_name}: {written}")
+            last_reported[model_name] = written
+
+        start = time.perf_counter()
+        try:
+            written = dataset.generate(
+                companies=options["companies"],
+                customers=options["customers"],
+                products=options["products"],
+                orders=options["orders"],
+                items_per_order=options["items_per_order"],
+                seed=options["seed"],
+                product_skew=options["product_skew"],
+                customer_skew=options["customer_skew"],
+                days=options["days"],
+                chunk_size=options["chunk_size"],
+                use_copy=False if options["no_copy"] else None,
+                rebuild_rollups=not options["skip_rollups"],
+                progress=progress,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        except DatabaseError as e:
+            raise CommandError(f"Generation failed, nothing was written: {e}")
+        elapsed = time.perf_counter() - start
+
+        rows = sum(written.values())
+        self.stdout.write(json.dumps({
+            **written,
+            "seconds": round(elapsed, 2),
+            "rows_per_sec": round(rows / elapsed) if elapsed else None,
+        }))
@@ -0,0 +1,69 @@
+import csv
+import json
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from cotizador import catalog_import
+
+IMPORTERS = {
+    # Expected CSV columns in the header row
+    "products": (catalog_import.upsert_products, ("sku", "name", "base_price")),
+    "prices": (catalog_import.upsert_customer_prices, ("customer", "sku", "custom_price")),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Upserts products (by sku) or customer specific prices (by customer and sku) from a CSV "
+        "with a header row, and reports rows/sec. Products need sku, name, base_price and "
+        "optionally description; prices need customer, sku and custom_price."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV file to import.")
+        parser.add_argument("--kind", choices=IMPORTERS, default="products", help="What the CSV contains.")
+        parser.add_argument("--chunk-size", type=int, default=catalog_import.DEFAULT_CHUNK_SIZE)
+        parser.add_argument(
+            "--no-copy", action="store_true",
+            help="Use bulk_create upserts even on PostgreSQL instead of COPY.",
+        )
+
+    def handle(self, *args, **options):
+        upsert, columns = IMPORTERS[options["kind"]]
+        read = 0
+
+        def counted(rows):
+            nonlocal read
+            for row in rows:
+                read += 1
+                yield row
+
+        with open(options["path"], newline="", encoding="utf-8-sig") as f:
+            reader = csv.DictReader(f)
+            missing = set(columns) - set(reader.fieldnames or ())
+            if missing:
+                raise CommandError(f"Missing columns: {', '.join(sorted(missing))}")
+
+            start = time.perf_counter()
+            try:
+                written = upsert(
+                    counted(reader),
+                    chunk_size=options["chunk_size"],
+                    use_copy=False if options["no_copy"] else None,
+                )
+            except ValidationError as e:
+                raise CommandError(f"Invalid value near row {read}, nothing was written: {' '.join(e.messages)}")
+            except DatabaseError as e:
+                raise CommandError(f"Import failed after {read} rows, nothing was written: {e}")
+            elapsed = time.perf_counter() - start
+
+        self.stdout.write(json.dumps({
+            "kind": options["kind"],
+            "rows": read,
+            "written": written,
+            "seconds": round(elapsed, 2),
+            "rows_per_sec": round(read / elapsed) if elapsed else None,
+        }))
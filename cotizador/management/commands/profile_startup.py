@@ -0,0 +1,100 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter: loads the WSGI app like a cold lambda, then
+# serves one request without importing the test client.
+COLD_START_SCRIPT = """
+import io, json, sys, time
+start = time.perf_counter()
+from backend.wsgi import application
+loaded = time.perf_counter()
+path, _, query = sys.argv[1].partition("?")
+environ = {
+    "REQUEST_METHOD": "GET", "PATH_INFO": path, "QUERY_STRING": query,
+    "SERVER_NAME": "localhost", "SERVER_PORT": "80", "HTTP_HOST": "localhost",
+    "wsgi.input": io.BytesIO(), "wsgi.url_scheme": "http", "wsgi.errors": sys.stderr,
+}
+status = []
+b"".join(application(environ, lambda s, headers, exc_info=None: status.append(s)))
+done = time.perf_counter()
+print(json.dumps({
+    "status": status[0],
+    "wsgi_ms": (loaded - start) * 1000,
+    "first_request_ms": (done - loaded) * 1000,
+}))
+"""
+
+
+def parse_importtime(output):
+    """(module, self_us, cumulative_us) rows from `python -X importtime` output."""
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        rows.append((module.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures cold start (loading backend.wsgi and serving a first request) in fresh "
+        "interpreters, reports import time per module and package, and fails when the median "
+        "cold start is over COLD_START_BUDGET_MS."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", default="/", help="URL of the first request, e.g. /api/products/.")
+        parser.add_argument("--runs", type=int, default=5, help="Cold starts to measure.")
+        parser.add_argument("--top", type=int, default=15, help="Modules and packages to list.")
+        parser.add_argument("--budget-ms", type=float, default=None, help="Overrides COLD_START_BUDGET_MS.")
+
+    def handle(self, *args, **options):
+        runs = [self.cold_start(options["path"]) for _ in range(options["runs"])]
+        result, importtime = runs[-1]
+        modules = parse_importtime(importtime)
+
+        packages = defaultdict(int)
+        for module, self_us, _ in modules:
+            packages[module.split(".")[0]] += self_us
+
+        total_ms = [run["wsgi_ms"] + run["first_request_ms"] for run, _ in runs]
+        report = {
+            "path": options["path"],
+            "status": result["status"],
+            "runs": len(runs),
+            "wsgi_ms": round(statistics.median(run["wsgi_ms"] for run, _ in runs), 1),
+            "first_request_ms": round(statistics.median(run["first_request_ms"] for run, _ in runs), 1),
+            "cold_start_ms": round(statistics.median(total_ms), 1),
+            "modules_imported": len(modules),
+            "slowest_modules": [
+                {"module": module, "self_ms": round(self_us / 1000, 1), "cumulative_ms": round(cumulative_us / 1000, 1)}
+                for module, self_us, cumulative_us in sorted(modules, key=lambda row: row[1], reverse=True)[:options["top"]]
+            ],
+            "slowest_packages": [
+                {"package": package, "self_ms": round(self_us / 1000, 1)}
+                for package, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:options["top"]]
+            ],
+        }
+        self.stdout.write(json.dumps(report, indent=2))
+
+        budget = options["budget_ms"] or getattr(settings, "COLD_START_BUDGET_MS", None)
+        if budget and report["cold_start_ms"] > budget:
+            raise CommandError(f"Cold start {report['cold_start_ms']} ms is over the {budget} ms budget.")
+
+    def cold_start(self, path):
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", COLD_START_SCRIPT, path],
+            cwd=settings.BASE_DIR, env=os.environ.copy(), capture_output=True, text=True,
+        )
+        if process.returncode != 0:
+            raise CommandError(f"Cold start failed:\n{process.stderr[-2000:]}")
+        # The request log and timing lines also go to stderr, keep the JSON from stdout
+        return json.loads(process.stdout.strip().splitlines()[-1]), process.stderr
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from backend import profiling
+
+
+class Command(BaseCommand):
+    help = (
+        "Prints a signed X-Profile header value. A request sent with it is profiled and its report "
+        "listed at /admin/profiles/. Valid for PROFILING_TOKEN_MAX_AGE seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--mode", choices=profiling.MODES, default="cprofile")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"X-Profile: {profiling.make_token(options['mode'])}")
+        self.stderr.write(f"Valid for {getattr(settings, 'PROFILING_TOKEN_MAX_AGE', 3600)} seconds.")
@@ -0,0 +1,22 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from cotizador import rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the daily sales rollups (per product, customer and company) from the orders. "
+        "They are kept up to date as orders change; run this after loading data without signals "
+        "or moving customers between companies."
+    )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        written = rollups.rebuild()
+        self.stdout.write(json.dumps({
+            "rows": written,
+            "seconds": round(time.perf_counter() - start, 2),
+        }))
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.5 on 2026-10-18 16:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cotizador', '0003_customuser_dark_mode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='tier',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='customers', to='cotizador.customertier'),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.1.5 on 2026-10-18 16:10
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+from ._operations import AddIndexConcurrently, AddPostgresIndex
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run in a transaction
+    atomic = False
+
+    dependencies = [
+        ('cotizador', '0004_customer_tier'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        AddIndexConcurrently(
+            model_name='customer',
+            index=models.Index(fields=['-created_at', '-id'], name='customer_created_at_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='customer',
+            index=models.Index(fields=['company', 'name'], name='customer_company_name_idx'),
+        ),
+        AddPostgresIndex(
+            model_name='customer',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('name'), name='gin_trgm_ops'), name='customer_name_trgm_idx'),
+        ),
+        AddPostgresIndex(
+            model_name='customer',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('email'), name='gin_trgm_ops'), name='customer_email_trgm_idx'),
+        ),
+        AddPostgresIndex(
+            model_name='customer',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('phone'), name='gin_trgm_ops'), name='customer_phone_trgm_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='customerspecificprice',
+            index=models.Index(fields=['product', 'customer'], include=('custom_price',), name='csp_product_customer_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='order',
+            index=models.Index(fields=['-created_at', '-id'], name='order_created_at_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='order',
+            index=models.Index(fields=['customer', '-created_at', '-id'], name='order_customer_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='orderitem',
+            index=models.Index(fields=['order', 'product'], include=('quantity', 'price'), name='orderitem_order_product_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='product',
+            index=models.Index(fields=['-created_at', '-id'], name='product_created_at_idx'),
+        ),
+        AddPostgresIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('name'), name='gin_trgm_ops'), name='product_name_trgm_idx'),
+        ),
+        AddPostgresIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('sku'), name='gin_trgm_ops'), name='product_sku_trgm_idx'),
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.1.5 on 2026-10-18 16:25
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.functions.text
+from django.db import migrations, models
+
+from ._operations import AddPostgresIndex
+
+
+# SQLite fallback: FTS5 tables over the same columns, kept in sync by triggers
+FTS_TABLES = {
+    'cotizador_company': ('name', 'business_line'),
+    'cotizador_product': ('name', 'sku', 'description'),
+    'cotizador_customer': ('name', 'email'),
+}
+
+
+def create_fts_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, columns in FTS_TABLES.items():
+        fts = f'{table}_fts'
+        names = ', '.join(columns)
+        new = ', '.join(f'new.{column}' for column in columns)
+        old = ', '.join(f'old.{column}' for column in columns)
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {fts} USING fts5({names}, content='{table}', content_rowid='id', "
+            f"prefix='2 3')"
+        )
+        schema_editor.execute(
+            f'CREATE TRIGGER {fts}_insert AFTER INSERT ON {table} BEGIN '
+            f'INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new}); END'
+        )
+        schema_editor.execute(
+            f'CREATE TRIGGER {fts}_delete AFTER DELETE ON {table} BEGIN '
+            f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old}); END"
+        )
+        schema_editor.execute(
+            f'CREATE TRIGGER {fts}_update AFTER UPDATE ON {table} BEGIN '
+            f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old}); "
+            f'INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new}); END'
+        )
+        schema_editor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def drop_fts_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table in FTS_TABLES:
+        for trigger in ('insert', 'delete', 'update'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {table}_fts_{trigger}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {table}_fts')
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run in a transaction
+    atomic = False
+
+    dependencies = [
+        ('cotizador', '0006_daily_sales_rollups'),
+    ]
+
+    operations = [
+        AddPostgresIndex(
+            model_name='company',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.SearchVector('name', config='simple', weight='A'), '||', django.contrib.postgres.search.SearchVector('business_line', config='simple', weight='B'), django.contrib.postgres.search.SearchConfig('simple')), name='company_search_idx'),
+        ),
+        AddPostgresIndex(
+            model_name='customer',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.SearchVector('name', config='simple', weight='A'), '||', django.contrib.postgres.search.SearchVector('email', config='simple', weight='A'), django.contrib.postgres.search.SearchConfig('simple')), name='customer_search_idx'),
+        ),
+        AddPostgresIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.SearchVector('name', config='simple', weight='A'), '||', django.contrib.postgres.search.SearchVector('sku', config='simple', weight='A'), django.contrib.postgres.search.SearchConfig('simple')), '||', django.contrib.postgres.search.SearchVector('description', config='simple', weight='B'), django.contrib.postgres.search.SearchConfig('simple')), name='product_search_idx'),
+        ),
+        AddPostgresIndex(
+            model_name='product',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('sku'), name='text_pattern_ops'), name='product_sku_prefix_idx'),
+        ),
+        migrations.RunPython(create_fts_tables, drop_fts_tables),
+    ]
@@ -0,0 +1,38 @@
+"""
+Index operations shared by the migrations. The leading underscore keeps the
+migration loader from reading this module as a migration.
+
+Both build indexes with CREATE INDEX CONCURRENTLY on PostgreSQL, which
+doesn't block writes to the table while the index is built, so migrations
+using them must set `atomic = False`.
+"""
+from django.contrib.postgres.operations import AddIndexConcurrently as PostgresAddIndexConcurrently
+from django.db import migrations
+
+
+class AddIndexConcurrently(PostgresAddIndexConcurrently):
+    """AddIndexConcurrently on PostgreSQL, a plain AddIndex on other databases (SQLite locally)."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_forwards(self, app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_backwards(self, app_label, schema_editor, from_state, to_state)
+
+
+class AddPostgresIndex(PostgresAddIndexConcurrently):
+    """AddIndexConcurrently that only touches the database on PostgreSQL (trigram, full-text and opclass indexes)."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
@@ -1,7 +1,45 @@
 from django.db import models
+from django.db.models import F, Sum, Value, DecimalField
+from django.db.models.functions import Coalesce, Upper
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector
 from django.contrib.auth.models import AbstractUser
 import uuid
 
+
+def trigram_index(field, name):
+    """
+    GIN trigram index on UPPER(field), which is what `icontains` (and so the
+    admin `search_fields`) compares against on PostgreSQL.
+    """
+    return GinIndex(OpClass(Upper(field), name="gin_trgm_ops"), name=name)
+
+
+def search_vector(fields):
+    """
+    Weighted full-text vector over `fields`, (field, weight) pairs. Uses the
+    "simple" configuration (no stemming, no stop words), which suits names,
+    SKUs and emails in any language. `search.py` builds the same expression,
+    so PostgreSQL can answer it from the `search_index`.
+    """
+    vector = None
+    for field, weight in fields:
+        part = SearchVector(field, weight=weight, config="simple")
+        vector = part if vector is None else vector + part
+    return vector
+
+
+def search_index(fields, name):
+    """GIN index on `search_vector(fields)`, used by `search.py` on PostgreSQL."""
+    return GinIndex(search_vector(fields), name=name)
+
+
+# Fields searched by `search.py` for each model, with their weight
+COMPANY_SEARCH_FIELDS = (("name", "A"), ("business_line", "B"))
+PRODUCT_SEARCH_FIELDS = (("name", "A"), ("sku", "A"), ("description", "B"))
+CUSTOMER_SEARCH_FIELDS = (("name", "A"), ("email", "A"))
+
+
 # Create your models here.
 class CustomUser(AbstractUser):
     email = models.EmailField(
@@ -24,6 +62,11 @@ class Company(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            search_index(COMPANY_SEARCH_FIELDS, "company_search_idx"),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -38,6 +81,16 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["-created_at", "-id"], name="product_created_at_idx"),
+            trigram_index("name", "product_name_trgm_idx"),
+            trigram_index("sku", "product_sku_trgm_idx"),
+            search_index(PRODUCT_SEARCH_FIELDS, "product_search_idx"),
+            # SKU autocomplete: UPPER(sku) LIKE 'PREFIX%' (istartswith)
+            models.Index(OpClass(Upper("sku"), name="text_pattern_ops"), name="product_sku_prefix_idx"),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -47,9 +100,20 @@ class Customer(models.Model):
     email = models.EmailField(unique=True, blank=True, null=True)
     phone = models.CharField(max_length=15, blank=True, null=True)
     company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name="customers", null=False, default = "ff02cbc6-f5b1-49c3-b7f2-500252cb0ad8")
+    tier = models.ForeignKey('CustomerTier', on_delete=models.SET_NULL, related_name="customers", null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["-created_at", "-id"], name="customer_created_at_idx"),
+            models.Index(fields=["company", "name"], name="customer_company_name_idx"),
+            trigram_index("name", "customer_name_trgm_idx"),
+            trigram_index("email", "customer_email_trgm_idx"),
+            trigram_index("phone", "customer_phone_trgm_idx"),
+            search_index(CUSTOMER_SEARCH_FIELDS, "customer_search_idx"),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -82,6 +146,10 @@ class CustomerSpecificPrice(models.Model):
 
     class Meta:
         unique_together = ("customer", "product")
+        indexes = [
+            # unique_together only serves lookups starting with the customer
+            models.Index(fields=["product", "customer"], include=["custom_price"], name="csp_product_customer_idx"),
+        ]
         verbose_name = "Customer Specific Price"
         verbose_name_plural = "Customer Specific Prices"
 
@@ -89,12 +157,47 @@ class CustomerSpecificPrice(models.Model):
         return f"{self.customer.name} - {self.product.name} @ {self.custom_price}"
 
 
+class OrderQuerySet(models.QuerySet):
+    def with_total_price(self):
+        """
+        Annotates each order with the sum of its items computed by the database,
+        so list endpoints don't load every OrderItem just to add them up.
+        """
+        total_field = DecimalField(max_digits=12, decimal_places=2)
+        return self.annotate(
+            annotated_total_price=Coalesce(
+                Sum(F("items__quantity") * F("items__price"), output_field=total_field),
+                Value(0),
+                output_field=total_field,
+            )
+        )
+
+
 class Order(models.Model):
     customer = models.ForeignKey('Customer', on_delete=models.CASCADE, related_name="orders")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = OrderQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        order = super().from_db(db, field_names, values)
+        # Compared on save to move the rollups (signals.update_order_rollups)
+        order._loaded_customer_id = order.__dict__.get("customer_id")
+        return order
+
+    class Meta:
+        indexes = [
+            # Match the keyset pagination and admin ordering (-created_at, -id)
+            models.Index(fields=["-created_at", "-id"], name="order_created_at_idx"),
+            models.Index(fields=["customer", "-created_at", "-id"], name="order_customer_created_idx"),
+        ]
+
     def get_total_price(self):
+        # Reuse the total computed by OrderQuerySet.with_total_price() when available
+        if hasattr(self, "annotated_total_price"):
+            return self.annotated_total_price
         total = sum(item.quantity * item.price for item in self.items.all())
         return total
     @property
@@ -111,8 +214,63 @@ class OrderItem(models.Model):
     quantity = models.PositiveIntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        item = super().from_db(db, field_names, values)
+        # Compared on save to move the rollups (signals.update_item_rollups)
+        item._loaded_product_id = item.__dict__.get("product_id")
+        return item
+
+    class Meta:
+        indexes = [
+            # Covers Order.objects.with_total_price() without reading the table
+            models.Index(fields=["order", "product"], include=["quantity", "price"], name="orderitem_order_product_idx"),
+        ]
+
     def get_total_price(self):
         return self.quantity * self.price
 
     def __str__(self):
         return f"{self.quantity} x {self.product.name} @ {self.price} each"
+
+
+class DailySales(models.Model):
+    """
+    Revenue, units and orders for one day, maintained from Order/OrderItem
+    changes by `rollups.py` (and fully rebuilt by `manage.py rebuild_rollups`).
+    """
+    day = models.DateField()
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units = models.PositiveBigIntegerField(default=0)
+    order_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+
+class DailyProductSales(DailySales):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="daily_sales")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["day", "product"], name="daily_product_sales_unique"),
+        ]
+
+
+class DailyCustomerSales(DailySales):
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name="daily_sales")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["day", "customer"], name="daily_customer_sales_unique"),
+        ]
+
+
+class DailyCompanySales(DailySales):
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name="daily_sales")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["day", "company"], name="daily_company_sales_unique"),
+        ]
@@ -0,0 +1,14 @@
+from rest_framework.pagination import CursorPagination
+
+
+class CreatedAtCursorPagination(CursorPagination):
+    """
+    Cursor pagination for the API ViewSets, newest rows first.
+
+    Rows are located by their position in (created_at, id) order instead of an
+    OFFSET, so deep pages cost the same as the first one.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
@@ -0,0 +1,126 @@
+"""
+Effective price resolution for customer/product pairs.
+
+A customer's price for a product is, in order of precedence:
+    1. their CustomerSpecificPrice for that product,
+    2. the product's base price minus their CustomerTier discount,
+    3. the product's base price.
+
+Resolved prices are kept in an in-process LRU cache. The cache is versioned:
+`invalidate()` (wired to model signals in `signals.py`) bumps the version, and
+values computed under an older version are dropped instead of stored, so a
+lookup racing with an invalidation can't put a stale price back in the cache.
+The cache is per process, and `bulk_create`/`update()` don't send signals, so
+callers that write prices that way must call `invalidate()` themselves.
+"""
+from collections import OrderedDict
+from decimal import Decimal, ROUND_HALF_UP
+from threading import Lock
+
+from backend import metrics
+
+from .models import CustomerTier, CustomerSpecificPrice
+
+CENT = Decimal("0.01")
+
+
+class VersionedLRUCache:
+    def __init__(self, maxsize=100_000):
+        self.maxsize = maxsize
+        self.version = 0
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get_many(self, keys):
+        """Returns a dict with the cached values for `keys` that are present."""
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._data:
+                    self._data.move_to_end(key)
+                    found[key] = self._data[key]
+        return found
+
+    def set_many(self, values, version):
+        """Stores `values` unless the cache was invalidated after `version` was read."""
+        with self._lock:
+            if version != self.version:
+                return
+            self._data.update(values)
+            for key in values:
+                self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+price_cache = VersionedLRUCache()
+
+
+def invalidate():
+    price_cache.invalidate()
+
+
+def _discounted(base_price, discount_percentage):
+    price = base_price * (Decimal(100) - discount_percentage) / Decimal(100)
+    return price.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def price_pairs(pairs):
+    """
+    Resolves the effective price of each `(customer, product)` pair.
+
+    Returns a dict keyed by `(customer.id, product.id)`. Whatever isn't cached
+    costs at most two queries in total (specific prices and tiers), however
+    many pairs are requested.
+    """
+    pairs = {(customer.id, product.id): (customer, product) for customer, product in pairs}
+    prices = price_cache.get_many(pairs.keys())
+    missing = {key: pair for key, pair in pairs.items() if key not in prices}
+    metrics.cache_lookup("price", hits=len(prices), misses=len(missing))
+    if not missing:
+        return prices
+
+    version = price_cache.version
+    customer_ids = {customer_id for customer_id, _ in missing}
+    product_ids = {product_id for _, product_id in missing}
+    specific_prices = {
+        (customer_id, product_id): custom_price
+        for customer_id, product_id, custom_price in CustomerSpecificPrice.objects.filter(
+            customer_id__in=customer_ids, product_id__in=product_ids
+        ).values_list("customer_id", "product_id", "custom_price")
+    }
+    tier_ids = {customer.tier_id for customer, _ in missing.values() if customer.tier_id}
+    discounts = dict(
+        CustomerTier.objects.filter(pk__in=tier_ids).values_list("pk", "discount_percentage")
+    ) if tier_ids else {}
+
+    resolved = {}
+    for key, (customer, product) in missing.items():
+        if key in specific_prices:
+            resolved[key] = specific_prices[key]
+        elif customer.tier_id in discounts:
+            resolved[key] = _discounted(product.base_price, discounts[customer.tier_id])
+        else:
+            resolved[key] = product.base_price
+
+    price_cache.set_many(resolved, version)
+    prices.update(resolved)
+    return prices
+
+
+def price_matrix(customers, products):
+    """Effective prices for every customer/product combination, keyed by `(customer_id, product_id)`."""
+    return price_pairs((customer, product) for customer in customers for product in products)
+
+
+def effective_price(customer, product):
+    """The price `customer` pays for one unit of `product`."""
+    return price_pairs([(customer, product)])[(customer.id, product.id)]
@@ -0,0 +1,198 @@
+"""
+Daily sales rollups per product, customer and company (see `DailySales`).
+
+Changes to orders and items mark (dimension, day, id) keys as dirty; when the
+transaction commits those rows are recomputed from OrderItem, with one
+aggregate query per dimension however many orders, items and days were
+touched. Recomputing instead of applying deltas keeps the rollups correct
+under updates, retries and rolled back transactions, since a key marked more
+often than needed is just recomputed again.
+
+The order services (`services.py`) mark what they change themselves, since
+`bulk_create` and `bulk_update` send no signals. Model signals
+(`signals.py`) cover saves and deletes of single objects: orders and items
+remember the customer and product they were loaded with (`from_db`), so
+finding what an update moved away from costs no query. Moving a customer to
+another company isn't tracked: run `manage.py rebuild_rollups` after that.
+"""
+import operator
+import threading
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from functools import reduce
+
+from django.db import connection, transaction
+from django.db.models import Count, DateField, F, Q, Sum
+from django.db.models.functions import Cast, TruncDate
+from django.utils import timezone
+
+from .models import Customer, DailyCompanySales, DailyCustomerSales, DailyProductSales, Order, OrderItem
+
+# dimension: (rollup model, rollup field, OrderItem lookup)
+DIMENSIONS = {
+    "product": (DailyProductSales, "product", "product_id"),
+    "customer": (DailyCustomerSales, "customer", "order__customer_id"),
+    "company": (DailyCompanySales, "company", "order__customer__company_id"),
+}
+
+_pending = threading.local()
+
+
+def _totals(items, *group_by):
+    return items.values(*group_by).annotate(
+        revenue=Sum(F("quantity") * F("price")),
+        units=Sum("quantity"),
+        order_count=Count("order", distinct=True),
+    )
+
+
+def _day_range(day):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+def _refresh(dimension, keys):
+    """Recomputes the rollup rows of `keys` ((day, id) pairs) from OrderItem."""
+    model, field, lookup = DIMENSIONS[dimension]
+    days = {day for day, _ in keys}
+    items = OrderItem.objects.filter(
+        order__created_at__gte=_day_range(min(days))[0],
+        order__created_at__lt=_day_range(max(days))[1],
+        **{f"{lookup}__in": {pk for _, pk in keys}},
+    ).annotate(day=_day("order__created_at"), key=F(lookup))
+    # The query covers every day in between for every id, keep the marked pairs
+    rows = [
+        model(day=row["day"], revenue=row["revenue"], units=row["units"], order_count=row["order_count"],
+              **{f"{field}_id": row["key"]})
+        for row in _totals(items, "day", "key") if (row["day"], row["key"]) in keys
+    ]
+    if rows:
+        model.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=["day", field],
+            update_fields=["revenue", "units", "order_count", "updated_at"],
+        )
+    # Keys left without items (deleted or moved away) lose their row
+    stale = defaultdict(list)
+    for day, pk in keys - {(row.day, getattr(row, f"{field}_id")) for row in rows}:
+        stale[day].append(pk)
+    if stale:
+        model.objects.filter(reduce(operator.or_, (
+            Q(day=day, **{f"{field}_id__in": ids}) for day, ids in stale.items()
+        ))).delete()
+
+
+def _flush():
+    keys = getattr(_pending, "keys", None)
+    _pending.keys = None
+    _pending.orders = {}
+    if not keys:
+        return
+    grouped = defaultdict(set)
+    for dimension, day, key in keys:
+        grouped[dimension].add((day, key))
+    with transaction.atomic():
+        for dimension, dimension_keys in grouped.items():
+            _refresh(dimension, dimension_keys)
+
+
+def _mark(day, product_ids=(), customer_ids=(), company_ids=()):
+    if getattr(_pending, "keys", None) is None:
+        _pending.keys = set()
+    keys = _pending.keys
+    keys.update(("product", day, pk) for pk in product_ids)
+    keys.update(("customer", day, pk) for pk in customer_ids)
+    keys.update(("company", day, pk) for pk in company_ids)
+    # Runs right away outside a transaction. If this transaction rolls back
+    # the keys stay pending and are recomputed on the next commit.
+    transaction.on_commit(_flush)
+
+
+def _orders():
+    orders = getattr(_pending, "orders", None)
+    if orders is None:
+        orders = _pending.orders = {}
+    return orders
+
+
+def order_items_changed(order, product_ids):
+    """Marks the rollups touched by items of `order` (an in-memory instance) for recomputation."""
+    info = _orders()[order.pk] = {
+        "created_at": order.created_at,
+        "customer_id": order.customer_id,
+        "customer__company_id": order.customer.company_id,
+    }
+    _mark(
+        timezone.localdate(info["created_at"]),
+        product_ids=product_ids,
+        customer_ids=[info["customer_id"]],
+        company_ids=[info["customer__company_id"]],
+    )
+
+
+def items_changed(order_id, product_ids):
+    """Same as `order_items_changed` when only the order id is at hand."""
+    # Deleting an order's items sends one signal per item, look the order up
+    # once (not at all after `order_items_changed` saw it)
+    orders = _orders()
+    if order_id not in orders:
+        orders[order_id] = Order.objects.filter(pk=order_id).values(
+            "created_at", "customer_id", "customer__company_id"
+        ).first()
+    order = orders[order_id]
+    if order is None:
+        return
+    _mark(
+        timezone.localdate(order["created_at"]),
+        product_ids=product_ids,
+        customer_ids=[order["customer_id"]],
+        company_ids=[order["customer__company_id"]],
+    )
+
+
+def order_customer_changed(order, previous_customer_id):
+    """Moves an order's totals from its previous customer (and company) to the current one."""
+    previous_company_id = Customer.objects.filter(pk=previous_customer_id).values_list(
+        "company_id", flat=True
+    ).first()
+    order_items_changed(order, ())
+    _mark(
+        timezone.localdate(order.created_at),
+        customer_ids=[previous_customer_id],
+        company_ids=[previous_company_id] if previous_company_id else [],
+    )
+
+
+def _day(field):
+    # In UTC the day is a plain cast, which SQLite runs natively instead of
+    # through Django's Python timezone conversion function
+    if timezone.get_current_timezone_name() == "UTC":
+        return Cast(field, DateField())
+    return TruncDate(field)
+
+
+def rebuild():
+    """
+    Recomputes every rollup table from scratch with one INSERT ... SELECT per
+    dimension, so nothing goes through Python. Returns the rows written per
+    dimension.
+    """
+    quote = connection.ops.quote_name
+    written = {}
+    with transaction.atomic(), connection.cursor() as cursor:
+        for dimension, (model, field, lookup) in DIMENSIONS.items():
+            model.objects.all().delete()
+            totals = _totals(
+                OrderItem.objects.annotate(day=_day("order__created_at"), key=F(lookup)), "day", "key"
+            )
+            select, params = totals.query.sql_with_params()
+            columns = ("day", f"{field}_id", "revenue", "units", "order_count", "updated_at")
+            selected = ", ".join(f"totals.{quote(column)}" for column in ("day", "key", "revenue", "units", "order_count"))
+            cursor.execute(
+                f"INSERT INTO {quote(model._meta.db_table)} ({', '.join(quote(column) for column in columns)}) "
+                f"SELECT {selected}, %s FROM ({select}) totals",
+                [connection.ops.adapt_datetimefield_value(timezone.now()), *params],
+            )
+            written[dimension] = cursor.rowcount
+    return written
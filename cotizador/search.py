@@ -0,0 +1,141 @@
+"""
+Full-text and prefix search over products, customers and companies.
+
+Every word of the term has to match a word of the fields in
+`*_SEARCH_FIELDS` (models.py), the last one as a prefix so results can be
+shown while typing ("blue wid" finds "Blue Widget"). On PostgreSQL that is a
+`to_tsvector @@ to_tsquery` answered by the GIN `search_index` of each model,
+ranked with `ts_rank`. On SQLite (local runs) the FTS5 tables created by
+migration 0007 are queried instead, ranked with bm25. Products whose SKU
+starts with the term (autocomplete) come first, from the UPPER(sku) prefix
+index.
+
+The FTS5 tables are kept in sync by triggers on the model tables. A later
+migration that makes SQLite rebuild one of those tables drops its triggers,
+so it has to create them again.
+"""
+import re
+from collections import namedtuple
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import Q
+from django.db.models.functions import Upper
+
+from .models import (
+    Company, Customer, Product,
+    COMPANY_SEARCH_FIELDS, CUSTOMER_SEARCH_FIELDS, PRODUCT_SEARCH_FIELDS, search_vector,
+)
+
+SEARCH_TYPES = {
+    "product": (Product, PRODUCT_SEARCH_FIELDS),
+    "customer": (Customer, CUSTOMER_SEARCH_FIELDS),
+    "company": (Company, COMPANY_SEARCH_FIELDS),
+}
+DEFAULT_FIRST = 20
+MAX_FIRST = 100
+MAX_WORDS = 8
+# Matches ranked per type. Terms matching more rows than this (e.g. "pump" in
+# a catalog of pumps) are ranked among the first ones found instead of all of
+# them, which keeps every search to a bounded amount of work.
+RANK_CANDIDATES = 200
+
+# Same relative weights as PostgreSQL's ts_rank defaults, for bm25 on SQLite
+FTS5_WEIGHTS = {"A": 1.0, "B": 0.4, "C": 0.2, "D": 0.1}
+
+SearchHit = namedtuple("SearchHit", ["type", "object", "rank"])
+
+_WORD = re.compile(r"\w+")
+
+
+def _postgres_candidates(model, fields, words):
+    vector = search_vector(fields)
+    terms = [f"{word}" for word in words[:-1]] + [f"{words[-1]}:*"]
+    query = SearchQuery(" & ".join(terms), search_type="raw", config="simple")
+    return list(
+        model.objects.annotate(document=vector, rank=SearchRank(vector, query))
+        .filter(document=query)
+        .values_list("pk", "rank")[:RANK_CANDIDATES]
+    )
+
+
+def _sqlite_candidates(model, fields, words):
+    table = f"{model._meta.db_table}_fts"
+    weights = ", ".join(str(FTS5_WEIGHTS[weight]) for _, weight in fields)
+    match = " ".join([f'"{word}"' for word in words[:-1]] + [f'"{words[-1]}"*'])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid, -bm25({table}, {weights}) FROM {table} WHERE {table} MATCH %s LIMIT %s",
+            [match, RANK_CANDIDATES],
+        )
+        return cursor.fetchall()
+
+
+def _scan_candidates(model, fields, words):
+    # Other databases: unindexed, every word must appear in some field
+    condition = Q()
+    for word in words:
+        condition &= Q.create([(f"{field}__icontains", word) for field, _ in fields], connector=Q.OR)
+    return [(pk, 0.0) for pk in model.objects.filter(condition).values_list("pk", flat=True)[:RANK_CANDIDATES]]
+
+
+def _sku_prefix_matches(term, first):
+    if connection.vendor == "sqlite":
+        # SQLite can't use an index for a case-insensitive LIKE, compare with
+        # the sku index instead (SKUs are upper case)
+        prefix = term.upper()
+        products = Product.objects.filter(sku__gte=prefix, sku__lt=prefix + "\U0010ffff").order_by("sku")
+    else:
+        # Same expression as the UPPER(sku) prefix index
+        products = Product.objects.filter(sku__istartswith=term).order_by(Upper("sku"))
+    return list(products[:first])
+
+
+def _matches(model, fields, words, first):
+    """The `first` best (object, rank) matches among the first RANK_CANDIDATES found."""
+    if connection.vendor == "postgresql":
+        candidates = _postgres_candidates(model, fields, words)
+    elif connection.vendor == "sqlite":
+        candidates = _sqlite_candidates(model, fields, words)
+    else:
+        candidates = _scan_candidates(model, fields, words)
+    best = sorted(candidates, key=lambda candidate: candidate[1], reverse=True)[:first]
+    objects = model.objects.in_bulk([pk for pk, _ in best])
+    return [(objects[pk], rank) for pk, rank in best if pk in objects]
+
+
+def search(term, types=None, first=DEFAULT_FIRST):
+    """
+    Returns up to `first` SearchHits for `term` among `types` (names from
+    SEARCH_TYPES, all by default): SKU prefix matches first, then the best
+    ranked full-text matches. Raises ValueError for unknown types or a bad
+    `first`. Must be called from a sync context.
+    """
+    types = list(types or SEARCH_TYPES)
+    unknown = set(types) - set(SEARCH_TYPES)
+    if unknown:
+        raise ValueError(f"Unknown search types: {', '.join(sorted(unknown))}.")
+    if first < 1:
+        raise ValueError("'first' must be a positive number.")
+    first = min(first, MAX_FIRST)
+
+    term = term.strip()
+    words = _WORD.findall(term.lower())[:MAX_WORDS]
+    if not words:
+        return []
+
+    hits = []
+    if "product" in types:
+        hits += [
+            SearchHit("product", product, None) for product in _sku_prefix_matches(term, first)
+        ]
+
+    ranked = []
+    for name in types:
+        model, fields = SEARCH_TYPES[name]
+        ranked += [SearchHit(name, row, rank) for row, rank in _matches(model, fields, words, first)]
+    ranked.sort(key=lambda hit: hit.rank, reverse=True)
+
+    seen = {("product", hit.object.pk) for hit in hits}
+    hits += [hit for hit in ranked if (hit.type, hit.object.pk) not in seen]
+    return hits[:first]
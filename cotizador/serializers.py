@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from . import services
 from .models import Product, Customer, CustomerTier, CustomerSpecificPrice, Order, OrderItem, Company
 
 # Product Serializer
@@ -40,6 +41,8 @@ class CustomerSpecificPriceSerializer(serializers.ModelSerializer):
 
 # Order Item Serializer
 class OrderItemSerializer(serializers.ModelSerializer):
+    # Writable so updates can name the item they change (see services.update_order)
+    id = serializers.IntegerField(required=False)
     total_price = serializers.SerializerMethodField()
 
     class Meta:
@@ -61,25 +64,39 @@ class OrderSerializer(serializers.ModelSerializer):
         fields = ['id', 'customer', 'created_at', 'updated_at', 'items', 'total_price']
 
     def get_total_price(self, obj):
-        return sum(item.quantity * item.price for item in obj.items.all())
+        return obj.get_total_price()
 
     def create(self, validated_data):
         items_data = validated_data.pop('items')  # Extract nested items
         order = Order.objects.create(**validated_data)
         for item_data in items_data:
+            item_data.pop('id', None)
             OrderItem.objects.create(order=order, **item_data)
         return order
 
     def update(self, instance, validated_data):
         items_data = validated_data.pop('items', None)
-        instance.customer = validated_data.get('customer', instance.customer)
-        instance.save()
-
-        if items_data:
-            # Clear existing items and create new ones
-            instance.items.all().delete()
-            for item_data in items_data:
-                OrderItem.objects.create(order=instance, **item_data)
-
+        customer = validated_data.get('customer')
+
+        # Only the items that changed are written (see services.update_order)
+        try:
+            order_items = services.update_order(
+                instance,
+                customer_id=customer.pk if customer else None,
+                items=[
+                    {
+                        'id': item_data.get('id'),
+                        'product': item_data['product'].pk,
+                        'quantity': item_data['quantity'],
+                        'price': item_data['price'],
+                    }
+                    for item_data in items_data
+                ] if items_data else None,
+            )
+        except OrderItem.DoesNotExist as e:
+            raise serializers.ValidationError({'items': str(e)})
+        if order_items is not None and hasattr(instance, 'annotated_total_price'):
+            # The total annotated by the viewset's queryset predates the update
+            instance.annotated_total_price = sum(item.quantity * item.price for item in order_items)
         return instance
 
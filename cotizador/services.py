@@ -0,0 +1,185 @@
+from django.db import transaction
+
+from . import pricing, rollups
+from .models import Product, Customer, Order, OrderItem
+
+
+def in_bulk_or_raise(model, ids):
+    """
+    Fetches all `ids` of `model` in a single query.
+    Raises `model.DoesNotExist` listing the ids that were not found.
+    """
+    pk_field = model._meta.pk
+    ids = {pk_field.to_python(pk) for pk in ids}
+    objects = model.objects.in_bulk(ids)
+    missing = ids - objects.keys()
+    if missing:
+        raise model.DoesNotExist(", ".join(str(pk) for pk in sorted(missing)))
+    return objects
+
+
+def _product_for(item, products):
+    return products[Product._meta.pk.to_python(item["product"])]
+
+
+def _missing_prices(order, items, products):
+    """(customer, product) pairs for the items of `order` sent without a price."""
+    return [
+        (order.customer, _product_for(item, products))
+        for item in items if item.get("price") is None
+    ]
+
+
+def _build_items(order, items, products, prices):
+    # Items sent without a price get the customer's effective price (see pricing.py)
+    order_items = []
+    for item in items:
+        product = _product_for(item, products)
+        price = item.get("price")
+        if price is None:
+            price = prices[(order.customer_id, product.id)]
+        order_items.append(OrderItem(order=order, product=product, quantity=item["quantity"], price=price))
+    return order_items
+
+
+def create_orders(orders_data):
+    """
+    Creates several orders with their items.
+
+    `orders_data` is a list of dicts shaped like
+    `{"customer": <id>, "items": [{"product": <id>, "quantity": <int>, "price": <number>}]}`.
+    `price` is optional; when missing the customer's effective price is used.
+
+    Customers and products for every order are resolved with one `in_bulk`
+    query each, and orders and items are written with `bulk_create` inside a
+    single transaction, so the query count doesn't grow with the number of
+    orders or items. Returns a list of `(order, items)` tuples in input order.
+    """
+    customers = in_bulk_or_raise(Customer, [data["customer"] for data in orders_data])
+    products = in_bulk_or_raise(
+        Product, [item["product"] for data in orders_data for item in data["items"]]
+    )
+    orders = [
+        Order(customer=customers[Customer._meta.pk.to_python(data["customer"])])
+        for data in orders_data
+    ]
+    prices = pricing.price_pairs([
+        pair for order, data in zip(orders, orders_data)
+        for pair in _missing_prices(order, data["items"], products)
+    ])
+
+    with transaction.atomic():
+        Order.objects.bulk_create(orders)
+        items_per_order = [
+            _build_items(order, data["items"], products, prices)
+            for order, data in zip(orders, orders_data)
+        ]
+        OrderItem.objects.bulk_create([item for items in items_per_order for item in items])
+        # bulk_create sends no signals
+        for order, items in zip(orders, items_per_order):
+            rollups.order_items_changed(order, {item.product_id for item in items})
+
+    return list(zip(orders, items_per_order))
+
+
+def create_order(customer_id, items):
+    """Creates a single order. See `create_orders`."""
+    [(order, order_items)] = create_orders([{"customer": customer_id, "items": items}])
+    return order, order_items
+
+
+def _diff_items(order, items, products, prices):
+    """
+    Matches `items` against the current items of `order`: by "id" when given,
+    otherwise by product. Returns `(items in input order, created, changed,
+    removed)`, where only `changed` items had a field modified.
+    """
+    existing = {item.pk: item for item in order.items.all()}
+    by_product = {}
+    for item in existing.values():
+        by_product.setdefault(item.product_id, []).append(item)
+
+    wanted = _build_items(order, items, products, prices)
+    # Explicit ids first, so matching by product can't take an item claimed by id
+    matched = {}
+    for index, data in enumerate(items):
+        if data.get("id") is not None:
+            pk = OrderItem._meta.pk.to_python(data["id"])
+            if pk not in existing:
+                raise OrderItem.DoesNotExist(f"Item {pk} is not part of order {order.pk}.")
+            matched[index] = existing.pop(pk)
+    for index, item in enumerate(wanted):
+        if index not in matched:
+            candidates = [current for current in by_product.get(item.product_id, ()) if current.pk in existing]
+            if candidates:
+                matched[index] = existing.pop(candidates[0].pk)
+
+    price_field = OrderItem._meta.get_field("price")
+    result, created, changed = [], [], []
+    for index, item in enumerate(wanted):
+        current = matched.get(index)
+        if current is None:
+            created.append(item)
+            result.append(item)
+            continue
+        price = price_field.to_python(item.price)
+        if (current.product_id, current.quantity, current.price) != (item.product_id, item.quantity, price):
+            changed.append((current.product_id, current))
+            current.product, current.quantity, current.price = item.product, item.quantity, price
+        result.append(current)
+    return result, created, changed, list(existing.values())
+
+
+def update_order(order, customer_id=None, items=None):
+    """
+    Updates the customer and/or the items of `order` in one transaction.
+    Returns the order items when they were given (None leaves them as they
+    are, an empty list removes them all), otherwise None.
+
+    `items` is the complete new list of items (shaped as in `create_orders`,
+    plus an optional "id"). It is diffed against the current items: matching
+    ones are kept, and only the changed ones are written with one
+    `bulk_update`. New ones are inserted with `bulk_create` and missing ones
+    are deleted, so an edit touches only the rows it changes.
+    """
+    if customer_id:
+        order.customer = Customer.objects.get(pk=customer_id)
+
+    order_items = None
+    if items is not None:
+        products = in_bulk_or_raise(Product, [item["product"] for item in items])
+        prices = pricing.price_pairs(_missing_prices(order, items, products))
+
+    with transaction.atomic():
+        if items is not None:
+            order_items, created, changed, removed = _diff_items(order, items, products, prices)
+            # bulk_update and bulk_create send no signals. Marked before the
+            # delete, whose signals then find the order without a query.
+            if changed or created or removed:
+                rollups.order_items_changed(order, {
+                    product_id
+                    for previous_product_id, item in changed
+                    for product_id in (previous_product_id, item.product_id)
+                } | {item.product_id for item in created + removed})
+            if removed:
+                OrderItem.objects.filter(pk__in=[item.pk for item in removed]).delete()
+            if changed:
+                OrderItem.objects.bulk_update([item for _, item in changed], ["product", "quantity", "price"])
+            if created:
+                OrderItem.objects.bulk_create(created)
+        order.save()
+
+    return order_items
+
+
+def duplicate_order(order):
+    """Copies `order` and its items in one transaction. Returns `(new_order, items)`."""
+    with transaction.atomic():
+        new_order = Order.objects.create(customer_id=order.customer_id)
+        order_items = OrderItem.objects.bulk_create([
+            OrderItem(order=new_order, product_id=item.product_id, quantity=item.quantity, price=item.price)
+            for item in order.items.all()
+        ])
+        new_order.customer = order.customer
+        rollups.order_items_changed(new_order, {item.product_id for item in order_items})
+    return new_order, order_items
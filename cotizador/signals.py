@@ -0,0 +1,59 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from gqlauth.models import RefreshToken
+
+from . import catalog_cache, jwt_cache, pricing, rollups
+from .models import (
+    CustomUser, Company, Product, Customer, CustomerTier, CustomerSpecificPrice, Order, OrderItem
+)
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Customer)
+@receiver([post_save, post_delete], sender=CustomerTier)
+@receiver([post_save, post_delete], sender=CustomerSpecificPrice)
+def invalidate_prices(sender, **kwargs):
+    # Any of these can change an effective price (Customer via its tier)
+    pricing.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Company)
+@receiver([post_save, post_delete], sender=CustomerTier)
+def invalidate_catalog(sender, **kwargs):
+    catalog_cache.invalidate(sender)
+
+
+@receiver([post_save, post_delete], sender=CustomUser)
+def invalidate_user_tokens(sender, instance, **kwargs):
+    # Also covers PasswordChange, which saves the user
+    jwt_cache.invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=RefreshToken)
+def invalidate_revoked_tokens(sender, instance, **kwargs):
+    # RevokeToken (and PasswordChange) revoke the user's refresh tokens
+    if instance.revoked:
+        jwt_cache.invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender=Order)
+def update_order_rollups(sender, instance, **kwargs):
+    # New orders have no items yet, their items update the rollups
+    previous_customer_id = getattr(instance, "_loaded_customer_id", None)
+    if previous_customer_id is not None and previous_customer_id != instance.customer_id:
+        rollups.order_customer_changed(instance, previous_customer_id)
+    instance._loaded_customer_id = instance.customer_id
+
+
+@receiver([post_save, post_delete], sender=OrderItem)
+def update_item_rollups(sender, instance, **kwargs):
+    product_ids = {instance.product_id}
+    if getattr(instance, "_loaded_product_id", None):
+        product_ids.add(instance._loaded_product_id)
+    instance._loaded_product_id = instance.product_id
+    order_field = OrderItem._meta.get_field("order")
+    if order_field.is_cached(instance) and Order._meta.get_field("customer").is_cached(instance.order):
+        rollups.order_items_changed(instance.order, product_ids)
+    else:
+        rollups.items_changed(instance.order_id, product_ids)
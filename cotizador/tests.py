@@ -1,3 +1,1605 @@
-from django.test import TestCase
+import base64
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.models import F
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from gqlauth.core.types_ import GQLAuthErrors
+from gqlauth.jwt.types_ import TokenType
+from gqlauth.models import RefreshToken
+from strawberry.utils.str_converters import to_camel_case
+
+from backend import metrics, profiling
+
+from . import dataset, exports, jwt_cache, pricing, rollups, services
+from .graphql.pagination import MAX_PAGE_SIZE
+from .management.commands import benchmark_graphql, benchmark_replay
+from .models import Company, CustomUser, Customer, CustomerSpecificPrice, CustomerTier, Order, OrderItem, Product
+
+
+class GraphQLTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        companies = [Company.objects.create(name=f"Company {i}", business_line="Retail", state="CDMX") for i in range(2)]
+        cls.customers = [
+            Customer.objects.create(name=f"Customer {i}", email=f"customer{i}@example.com", company=companies[i % 2])
+            for i in range(4)
+        ]
+        cls.products = [
+            Product.objects.create(name=f"Product {i}", sku=f"SKU-{i}", base_price=10 + i, description="x" * 500)
+            for i in range(3)
+        ]
+        for customer in cls.customers:
+            cls.create_order(customer)
+
+    @classmethod
+    def create_order(cls, customer):
+        order = Order.objects.create(customer=customer)
+        for product in cls.products[:2]:
+            OrderItem.objects.create(order=order, product=product, quantity=2, price=product.base_price)
+        return order
+
+    def setUp(self):
+        cache.clear()
+
+    def graphql(self, query):
+        response = self.client.post("/gql", data=json.dumps({"query": query}), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertIsNone(result.get("errors"))
+        return result["data"]
+
+    def graphql_queries(self, query):
+        """Runs `query` and returns its data and the SQL statements it ran."""
+        with CaptureQueriesContext(connection) as queries:
+            data = self.graphql(query)
+        return data, [query["sql"] for query in queries.captured_queries]
+
+
+class QueryOptimizerTests(GraphQLTestCase):
+    NESTED = """{
+        customers {
+            name
+            company { name }
+            orders { resolveTotalPrice items { quantity product { sku } } }
+        }
+    }"""
+
+    def test_only_requested_columns_are_loaded(self):
+        data, queries = self.graphql_queries("{ products { sku name } }")
+        self.assertEqual(len(data["products"]), 3)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("description", queries[0])
+        self.assertNotIn("base_price", queries[0])
+        self.assertLess(len(queries[0]), len(str(Product.objects.all().query)))
+
+    def test_nested_selection_runs_a_fixed_number_of_queries(self):
+        # customers + company join, orders with totals, items + product join
+        data, queries = self.graphql_queries(self.NESTED)
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(data["customers"][0]["orders"][0]["resolveTotalPrice"], 42.0)
+
+        for customer in self.customers:
+            self.create_order(customer)
+        data, queries = self.graphql_queries(self.NESTED)
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(sum(len(customer["orders"]) for customer in data["customers"]), 8)
+
+    def test_connection_nodes_are_optimized(self):
+        data, queries = self.graphql_queries("""{
+            ordersConnection(first: 2) {
+                edges { cursor node { id customer { name company { name } } items { product { name } } } }
+            }
+        }""")
+        self.assertEqual(len(data["ordersConnection"]["edges"]), 2)
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn("annotated_total_price", queries[0])
+
+    def test_fragments_are_followed(self):
+        data, queries = self.graphql_queries("""
+            query { customers { ...CustomerFields } }
+            fragment CustomerFields on CustomerType { email company { name } }
+        """)
+        self.assertEqual(data["customers"][0]["company"]["name"], "Company 0")
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("phone", queries[0])
+
+
+class QueryCostTests(GraphQLTestCase):
+    """The shipped GRAPHQL_LIST_SIZES and limits against the queries clients really send."""
+
+    CLIENT_QUERIES = [
+        benchmark_graphql.DEFAULT_QUERY,
+        QueryOptimizerTests.NESTED,
+        "{ orders { id resolveTotalPrice items { quantity product { sku } } customer { name } } }",
+        "{ customers { id name orders { id } } }",
+    ]
+
+    def cost(self, query=None, body=None, headers=None):
+        body = body or json.dumps({"query": query})
+        response = self.client.post("/gql", data=body, content_type="application/json", headers=headers)
+        result = response.json()
+        codes = {error.get("extensions", {}).get("code") for error in result.get("errors") or ()}
+        return result["extensions"]["cost"], codes
+
+    def test_client_queries_are_within_the_limits(self):
+        bodies = [json.dumps({"query": query}) for query in self.CLIENT_QUERIES] + [
+            scenario.body
+            for scenario in benchmark_replay.load_scenarios(os.path.join(settings.BASE_DIR, "thunderclient-collection.json"))
+            if scenario.path == "/gql" and scenario.content_type == "application/json"
+        ]
+        for body in bodies:
+            with self.subTest(body=body):
+                cost, codes = self.cost(body=body)
+                self.assertLessEqual(cost["estimated"], settings.GRAPHQL_MAX_QUERY_COST)
+                self.assertFalse(codes & {"QUERY_TOO_DEEP", "QUERY_TOO_COMPLEX", "QUERY_COST_THROTTLED"})
+
+    def test_benchmark_runs(self):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command("benchmark_graphql", repeat=1, stdout=stdout, stderr=stderr)
+        self.assertEqual(stderr.getvalue(), "")
+        self.assertEqual(json.loads(stdout.getvalue())["runs"], 1)
+
+    def test_runaway_queries_are_rejected(self):
+        cost, codes = self.cost("{ companies { customers { orders { items { product { sku } } } } } }")
+        self.assertEqual(codes, {"QUERY_TOO_COMPLEX"})
+        self.assertGreater(cost["estimated"], cost["max"])
+
+    @override_settings(GRAPHQL_QUERY_COST_RATE=(20_000, 60))
+    def test_throttle(self):
+        query = benchmark_graphql.DEFAULT_QUERY
+        self.assertEqual(self.cost(query)[1], set())
+        cost, codes = self.cost(query)
+        self.assertEqual(codes, {"QUERY_COST_THROTTLED"})
+        self.assertEqual(cost["throttle"]["limit"], 20_000)
+        # The rejected operation didn't spend
+        tiers = self.cost("{ customerTiers { name } }")[0]
+        self.assertEqual(tiers["throttle"]["remaining"], cost["throttle"]["remaining"] - tiers["estimated"])
+
+    @override_settings(GRAPHQL_QUERY_COST_RATE=(20_000, 60), GRAPHQL_QUERY_COST_CLIENT_IP_HEADER="HTTP_X_REAL_IP")
+    def test_throttle_per_forwarded_client(self):
+        query = benchmark_graphql.DEFAULT_QUERY
+        self.assertEqual(self.cost(query, headers={"X-Real-IP": "203.0.113.1"})[1], set())
+        self.assertEqual(self.cost(query, headers={"X-Real-IP": "203.0.113.1"})[1], {"QUERY_COST_THROTTLED"})
+        self.assertEqual(self.cost(query, headers={"X-Real-IP": "203.0.113.2"})[1], set())
+
+
+class OrderApiTests(GraphQLTestCase):
+    def test_update_returns_the_new_total(self):
+        order = Order.objects.order_by("pk").first()
+        item = order.items.order_by("pk").first()
+        response = self.client.put(f"/api/orders/{order.pk}/", data={
+            "customer": order.customer_id,
+            "items": [{"id": item.pk, "product": item.product_id, "quantity": 5, "price": "10.00"}],
+        }, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(float(response.json()["total_price"]), 50.0)
+        self.assertEqual([row["quantity"] for row in response.json()["items"]], [5])
+        self.assertEqual(float(self.client.get(f"/api/orders/{order.pk}/").json()["total_price"]), 50.0)
+
+
+class CatalogCacheTests(GraphQLTestCase):
+    def test_product_list_not_modified(self):
+        response = self.client.get("/api/products/")
+        with self.assertNumQueries(0):
+            cached = self.client.get("/api/products/", headers={"If-None-Match": response["ETag"]})
+        self.assertEqual(cached.status_code, 304)
+        Product.objects.get(sku="SKU-0").save()
+        self.assertEqual(self.client.get("/api/products/", headers={"If-None-Match": response["ETag"]}).status_code, 200)
+
+    def test_product_list_links_follow_the_host(self):
+        for host in ("a.example.com", "b.example.com"):
+            response = self.client.get("/api/products/?page_size=1", headers={"Host": host})
+            self.assertTrue(response.json()["next"].startswith(f"http://{host}/api/products/"))
+
+    def test_product_list_invalidated_by_product_save(self):
+        self.client.get("/api/products/")
+        product = Product.objects.get(sku="SKU-0")
+        product.name = "Renamed"
+        product.save()
+        self.assertIn("Renamed", [row["name"] for row in self.client.get("/api/products/").json()["results"]])
+
+    def test_companies_invalidated_by_company_save(self):
+        self.graphql("{ companies { name } }")
+        company = Company.objects.get(name="Company 0")
+        company.name = "Renamed"
+        company.save()
+        self.assertIn({"name": "Renamed"}, self.graphql("{ companies { name } }")["companies"])
+
+    def test_customer_tiers_invalidated_by_tier_save(self):
+        tier = CustomerTier.objects.create(name="Gold", discount_percentage=10)
+        self.graphql("{ customerTiers { name } }")
+        tier.name = "Platinum"
+        tier.save()
+        self.assertEqual(self.graphql("{ customerTiers { name } }")["customerTiers"], [{"name": "Platinum"}])
+
+
+class ExportTests(GraphQLTestCase):
+    def test_asgi_streams_an_async_iterator(self):
+        async def export():
+            response = await self.async_client.get("/export/orders.csv")
+            self.assertTrue(response.is_async)
+            return b"".join([chunk async for chunk in response])
+
+        content = async_to_sync(export)().decode()
+        self.assertEqual(content, self.client.get("/export/orders.csv").getvalue().decode())
+        self.assertEqual(len(content.splitlines()), 1 + OrderItem.objects.count())
+
+    def test_pages_cover_every_row_once(self):
+        Order.objects.create(customer=self.customers[0])
+        order = self.create_order(self.customers[1])
+        OrderItem.objects.bulk_create([OrderItem(order=order, product=self.products[2], quantity=1, price=1)] * 3)
+        expected = list(Order.objects.order_by("id", "items__id").values_list(*(lookup for _, lookup in exports.COLUMNS)))
+        for chunk_size in (1, 2, 3, 5, 100):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(list(exports.export_rows(chunk_size=chunk_size)), expected)
+        self.assertEqual(list(exports.export_rows(customer=self.customers[1].pk)), [
+            row for row in expected if row[2] == self.customers[1].pk
+        ])
+
+
+class PersistedQueryTests(GraphQLTestCase):
+    QUERY = "{ products { sku } }"
+
+    def get(self, **params):
+        return self.client.get("/gql", params, headers={"Accept": "application/json"})
+
+    def test_get_is_publicly_cacheable_without_per_client_extensions(self):
+        response = self.get(query=self.QUERY)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("public", response["Cache-Control"])
+        self.assertEqual(response.json(), {"data": {"products": [{"sku": f"SKU-{i}"} for i in range(3)]}})
+        # POST responses aren't cached and keep them
+        response = self.client.post("/gql", data=json.dumps({"query": self.QUERY}), content_type="application/json")
+        self.assertIn("cost", response.json()["extensions"])
+
+    def test_automatic_persisted_query(self):
+        extensions = json.dumps({"persistedQuery": {"version": 1, "sha256Hash": hashlib.sha256(self.QUERY.encode()).hexdigest()}})
+        response = self.get(extensions=extensions)
+        self.assertEqual(response.json()["errors"][0]["message"], "PersistedQueryNotFound")
+        self.assertEqual(self.get(query=self.QUERY, extensions=extensions).status_code, 200)
+        self.assertEqual(len(self.get(extensions=extensions).json()["data"]["products"]), 3)
+
+
+class PaginationTests(GraphQLTestCase):
+    def page(self, after):
+        query = "query ($after: String) { ordersConnection(first: 2, after: $after) { edges { cursor } } }"
+        response = self.client.post(
+            "/gql", data=json.dumps({"query": query, "variables": {"after": after}}), content_type="application/json"
+        )
+        return response.json()
+
+    def test_pages_follow_the_cursor(self):
+        first = self.page(None)["data"]["ordersConnection"]["edges"]
+        second = self.page(first[-1]["cursor"])["data"]["ordersConnection"]["edges"]
+        self.assertEqual(len(first + second), 4)
+        self.assertFalse({edge["cursor"] for edge in first} & {edge["cursor"] for edge in second})
+
+    def test_invalid_cursors(self):
+        def encode(values):
+            return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+        for cursor in ("not a cursor", encode({"id": 1}), encode(["2025-01-01T00:00:00+00:00"]),
+                       encode(["2025-01-01T00:00:00+00:00", "abc"]), encode(["yesterday", 1]),
+                       encode([None, 1]), encode([["2025"], 1])):
+            with self.subTest(cursor=cursor):
+                self.assertEqual([error["message"] for error in self.page(cursor)["errors"]], ["Invalid cursor."])
+
+    def test_unpaginated_lists_are_capped(self):
+        order = Order.objects.order_by("pk").first()
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=self.products[2], quantity=1, price=1) for _ in range(MAX_PAGE_SIZE)
+        ])
+        items = self.graphql("{ orderItems { id } }")["orderItems"]
+        self.assertEqual([int(item["id"]) for item in items], sorted(OrderItem.objects.values_list("pk", flat=True))[:MAX_PAGE_SIZE])
+
+
+class ImportCatalogTests(GraphQLTestCase):
+    def import_prices(self, *rows):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as f:
+            f.write("customer,sku,custom_price\n" + "".join(f"{row}\n" for row in rows))
+        self.addCleanup(os.remove, f.name)
+        call_command("import_catalog", f.name, kind="prices", stdout=io.StringIO())
+
+    def test_prices(self):
+        customer = self.customers[0]
+        self.import_prices(f"{customer.pk},SKU-0,7.50", f"{customer.pk},SKU-0,8.00", "999999,SKU-0,1")
+        self.assertEqual(
+            list(CustomerSpecificPrice.objects.values_list("customer", "product__sku", "custom_price")),
+            [(customer.pk, "SKU-0", 8)],
+        )
+
+    def test_invalid_customer_id(self):
+        with self.assertRaisesMessage(CommandError, "Invalid value near row 2, nothing was written"):
+            self.import_prices(f"{self.customers[0].pk},SKU-0,7.50", "abc,SKU-1,1")
+        self.assertFalse(CustomerSpecificPrice.objects.exists())
+
+
+class DatasetTests(TestCase):
+    @skipUnless(connection.vendor == "sqlite", "PRAGMA cache_size is SQLite's")
+    def test_page_cache_restored_after_an_error(self):
+        def cache_size():
+            with connection.cursor() as cursor:
+                cursor.execute("PRAGMA cache_size")
+                return cursor.fetchone()[0]
+
+        before = cache_size()
+        with self.assertRaisesMessage(ValueError, "Customers need at least one company."):
+            dataset.generate(customers=1)
+        self.assertEqual(cache_size(), before)
+
+
+class JwtCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user("alice", "alice@example.com", "secret")
+        self.token = TokenType.from_user(self.user).token
+
+    def authenticate(self):
+        """Runs `get_user_or_error` and returns its result and SQL statement count."""
+        request = RequestFactory().post("/gql", HTTP_AUTHORIZATION=f"JWT {self.token}")
+        with CaptureQueriesContext(connection) as queries:
+            user_or_error = jwt_cache.get_user_or_error(request)
+        return user_or_error, len(queries)
+
+    def test_hit(self):
+        first, first_queries = self.authenticate()
+        second, second_queries = self.authenticate()
+        self.assertEqual((first.user.pk, second.user.pk), (self.user.pk, self.user.pk))
+        self.assertGreater(first_queries, 0)
+        self.assertEqual(second_queries, 0)
+        self.assertEqual(second.user.email, "alice@example.com")
+
+    def test_expired_entry(self):
+        self.authenticate()
+        key = f"jwt:token:{hashlib.sha256(self.token.encode()).hexdigest()}"
+        entry = cache.get(key)
+        entry["exp"] -= timedelta(days=365)
+        cache.set(key, entry)
+        user_or_error, _ = self.authenticate()
+        self.assertFalse(user_or_error.user.is_authenticated)
+        self.assertEqual(user_or_error.error.message, GQLAuthErrors.EXPIRED_TOKEN.value)
+
+    def test_user_saved(self):
+        self.authenticate()
+        self.user.email = "bob@example.com"
+        self.user.save()
+        user_or_error, queries = self.authenticate()
+        self.assertGreater(queries, 0)
+        self.assertEqual(user_or_error.user.email, "bob@example.com")
+
+    def test_user_deactivated(self):
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save(update_fields=["is_active"])
+        user_or_error, _ = self.authenticate()
+        self.assertFalse(user_or_error.user.is_active)
+
+    def test_refresh_token_revoked(self):
+        self.authenticate()
+        RefreshToken.from_user(self.user).revoke()
+        _, queries = self.authenticate()
+        self.assertGreater(queries, 0)
+
+    def test_user_deleted(self):
+        self.authenticate()
+        self.user.delete()
+        user_or_error, _ = self.authenticate()
+        self.assertFalse(user_or_error.user.is_authenticated)
+        self.assertEqual(user_or_error.error.message, GQLAuthErrors.INVALID_TOKEN.value)
+
+    def test_invalidated_while_loading(self):
+        def invalidate(execute, sql, params, many, context):
+            if '"cotizador_customuser"."id" =' in sql:
+                jwt_cache.invalidate_user(self.user.pk)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(invalidate):
+            self.authenticate()
+        # The entry was built under the version read before the user was loaded
+        _, queries = self.authenticate()
+        self.assertGreater(queries, 0)
+
+
+class RollupTests(GraphQLTestCase):
+    def setUp(self):
+        super().setUp()
+        rollups.rebuild()
+        rollups._flush()
+
+    def change(self, apply):
+        with self.captureOnCommitCallbacks(execute=True):
+            apply()
+        # Every row matches an aggregate of OrderItem from scratch
+        for dimension, (model, field, lookup) in rollups.DIMENSIONS.items():
+            items = OrderItem.objects.annotate(day=rollups._day("order__created_at"), key=F(lookup))
+            expected = {
+                (row["day"], row["key"], row["revenue"], row["units"], row["order_count"])
+                for row in rollups._totals(items, "day", "key")
+            }
+            actual = set(model.objects.values_list("day", f"{field}_id", "revenue", "units", "order_count"))
+            self.assertEqual(actual, expected, dimension)
+
+    def test_create(self):
+        self.change(lambda: services.create_order(self.customers[0].pk, [
+            {"product": self.products[2].pk, "quantity": 3},
+            {"product": self.products[0].pk, "quantity": 1, "price": "4.50"},
+        ]))
+
+    def test_update(self):
+        order = Order.objects.filter(customer=self.customers[0]).first()
+        self.change(lambda: services.update_order(order, items=[
+            {"product": self.products[0].pk, "quantity": 5, "price": "10.00"},
+            {"product": self.products[2].pk, "quantity": 1},
+        ]))
+
+    def test_item_saved_with_another_product(self):
+        item = OrderItem.objects.filter(product=self.products[0]).first()
+        item.product = self.products[2]
+        self.change(item.save)
+
+    def test_item_deleted(self):
+        self.change(OrderItem.objects.filter(product=self.products[1]).first().delete)
+        order = Order.objects.filter(customer=self.customers[1]).first()
+        self.change(lambda: services.update_order(order, items=[]))
+
+    def test_customer_changed(self):
+        # customers[0] and customers[1] belong to different companies
+        order = Order.objects.filter(customer=self.customers[0]).first()
+        order.customer = self.customers[1]
+        self.change(order.save)
+        order = Order.objects.filter(customer=self.customers[2]).first()
+        self.change(lambda: services.update_order(order, customer_id=self.customers[3].pk))
+
+    def test_day_boundary(self):
+        for zone in ("UTC", "America/Mexico_City"):
+            with self.subTest(zone), timezone.override(zone):
+                first, second = Order.objects.filter(customer__in=self.customers[:2]).order_by("pk")
+                midnight = timezone.make_aware(datetime.combine(date(2025, 3, 1), time.min))
+                Order.objects.filter(pk=first.pk).update(created_at=midnight - timedelta(microseconds=1))
+                Order.objects.filter(pk=second.pk).update(created_at=midnight)
+                rollups.rebuild()
+                first.refresh_from_db()
+                second.refresh_from_db()
+
+                def apply():
+                    with transaction.atomic():
+                        for order in (first, second):
+                            services.update_order(order, items=[{"product": self.products[2].pk, "quantity": 4}])
+
+                self.change(apply)
+
+
+class PricingTests(GraphQLTestCase):
+    def setUp(self):
+        super().setUp()
+        pricing.invalidate()
+        self.customer, self.product = self.customers[0], self.products[0]
+        self.tier = CustomerTier.objects.create(name="Silver", discount_percentage=10)
+
+    def price(self):
+        # Fresh instances, as a request would load them
+        return pricing.effective_price(Customer.objects.get(pk=self.customer.pk), Product.objects.get(pk=self.product.pk))
+
+    def test_precedence(self):
+        self.assertEqual(self.price(), Decimal("10.00"))
+        Customer.objects.filter(pk=self.customer.pk).update(tier=self.tier)
+        pricing.invalidate()
+        self.assertEqual(self.price(), Decimal("9.00"))
+        CustomerSpecificPrice.objects.create(customer=self.customer, product=self.product, custom_price="9.50")
+        self.assertEqual(self.price(), Decimal("9.50"))
+        # Other customers and products keep theirs
+        customers = Customer.objects.filter(pk__in=[customer.pk for customer in self.customers[:2]])
+        self.assertEqual(pricing.price_matrix(customers, self.products[:2]), {
+            (self.customers[0].pk, self.products[0].pk): Decimal("9.50"),
+            (self.customers[0].pk, self.products[1].pk): Decimal("9.90"),
+            (self.customers[1].pk, self.products[0].pk): Decimal("10.00"),
+            (self.customers[1].pk, self.products[1].pk): Decimal("11.00"),
+        })
+
+    def test_cached(self):
+        self.price()
+        with self.assertNumQueries(0):
+            self.assertEqual(pricing.effective_price(self.customer, self.product), Decimal("10.00"))
+
+    def test_invalidated_by_product(self):
+        self.price()
+        # update() sends no signal, so the cached price stays
+        Product.objects.filter(pk=self.product.pk).update(base_price=20)
+        self.assertEqual(self.price(), Decimal("10.00"))
+        self.product.refresh_from_db()
+        self.product.save()
+        self.assertEqual(self.price(), Decimal("20.00"))
+
+    def test_invalidated_by_customer(self):
+        self.price()
+        self.customer.tier = self.tier
+        self.customer.save()
+        self.assertEqual(self.price(), Decimal("9.00"))
+
+    def test_invalidated_by_tier(self):
+        self.customer.tier = self.tier
+        self.customer.save()
+        self.price()
+        self.tier.discount_percentage = 25
+        self.tier.save()
+        self.assertEqual(self.price(), Decimal("7.50"))
+
+    def test_invalidated_by_specific_price(self):
+        self.price()
+        specific = CustomerSpecificPrice.objects.create(customer=self.customer, product=self.product, custom_price="8.00")
+        self.assertEqual(self.price(), Decimal("8.00"))
+        specific.custom_price = "7.00"
+        specific.save()
+        self.assertEqual(self.price(), Decimal("7.00"))
+        specific.delete()
+        self.assertEqual(self.price(), Decimal("10.00"))
+
+
+class UpdateOrderTests(GraphQLTestCase):
+    def setUp(self):
+        super().setUp()
+        self.order = Order.objects.filter(customer=self.customers[0]).first()
+        self.first, self.second = self.order.items.order_by("pk")
+
+    def item(self, product, quantity=2, price="10.00", **extra):
+        return {"product": product.pk, "quantity": quantity, "price": price, **extra}
+
+    def diff(self, items):
+        products = {product.pk: product for product in self.products}
+        return services._diff_items(self.order, items, products, {})
+
+    def test_matches_by_id_then_by_product(self):
+        # The second input claims the first item by id, so matching the first
+        # input by product can only take the second item
+        result, created, changed, removed = self.diff([
+            self.item(self.products[1], price=self.second.price),
+            self.item(self.products[1], quantity=3, id=self.first.pk),
+        ])
+        self.assertEqual([item.pk for item in result], [self.second.pk, self.first.pk])
+        self.assertEqual((created, removed), ([], []))
+        self.assertEqual([(previous, item.pk) for previous, item in changed], [(self.products[0].pk, self.first.pk)])
+
+    def test_unknown_id(self):
+        other = OrderItem.objects.exclude(order=self.order).first()
+        with self.assertRaisesMessage(OrderItem.DoesNotExist, f"Item {other.pk} is not part of order {self.order.pk}."):
+            self.diff([self.item(self.products[0], id=other.pk)])
+
+    def test_changed_created_and_removed(self):
+        items = services.update_order(self.order, items=[
+            self.item(self.products[0], quantity=5, price=self.first.price),
+            self.item(self.products[2], price="1.50"),
+        ])
+        self.assertEqual(items[0].pk, self.first.pk)
+        self.assertEqual(
+            list(self.order.items.order_by("pk").values_list("product", "quantity", "price")),
+            [(self.products[0].pk, 5, self.first.price), (self.products[2].pk, 2, Decimal("1.50"))],
+        )
+        self.assertFalse(OrderItem.objects.filter(pk=self.second.pk).exists())
+
+    def test_untouched_items_are_not_written(self):
+        unchanged = [
+            self.item(self.products[0], price=self.first.price),
+            self.item(self.products[1], price=self.second.price),
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            services.update_order(self.order, items=unchanged)
+        self.assertFalse([query for query in queries if "cotizador_orderitem" in query["sql"] and not query["sql"].startswith("SELECT")])
+
+        unchanged[1]["quantity"] = 7
+        with CaptureQueriesContext(connection) as queries:
+            services.update_order(self.order, items=unchanged)
+        [update] = [query["sql"] for query in queries if query["sql"].startswith("UPDATE \"cotizador_orderitem\"")]
+        self.assertIn(f"WHEN (\"cotizador_orderitem\".\"id\" = {self.second.pk})", update)
+        self.assertNotIn(f"= {self.first.pk})", update)
+
+    def test_rollups_marked_for_affected_products(self):
+        rollups._flush()
+        with self.captureOnCommitCallbacks():
+            services.update_order(self.order, items=[self.item(self.products[2], id=self.first.pk)])
+        marked = {key for dimension, day, key in rollups._pending.keys if dimension == "product"}
+        rollups._flush()
+        # The first item moved from product 0 to 2, the second (product 1) was removed
+        self.assertEqual(marked, {product.pk for product in self.products})
+
+
+# Query budgets
+#
+# Every GraphQL operation of cotizador.graphql and every /api/ and HTML route
+# runs against a generated dataset (cotizador/dataset.py) with an upper bound
+# on the SQL statements it runs and the rows its SELECTs return. Each case
+# then runs again after the dataset doubles: the statement count must not
+# grow (that's an N+1), and the rows may only grow with the data for the
+# unpaginated lists marked `grows` and must stay about the same for everything
+# else. Caches start cold and on_commit work (the rollup refresh) counts
+# towards the request that caused it.
+#
+# Set QUERY_BUDGET_REPORT=path/to/report.json to save what each case measured;
+# a later run with the same path prints the cases whose numbers changed.
+#
+# After a deliberate change, update the numbers in BUDGETS below.
+
+Budget = namedtuple("Budget", ["queries", "rows", "grows"], defaults=[False])
+
+BUDGETS = {
+    # GraphQL queries
+    "query:companies": Budget(2, 26, grows=True),
+    "query:company": Budget(2, 4),
+    "query:products": Budget(1, 27, grows=True),
+    "query:product": Budget(1, 1),
+    "query:customers": Budget(3, 167, grows=True),
+    "query:customer": Budget(2, 2),
+    "query:customerTiers": Budget(1, 1),
+    "query:customerSpecificPrices": Budget(1, 25, grows=True),
+    "query:orders": Budget(2, 147, grows=True),
+    "query:order": Budget(2, 3),
+    "query:orderItems": Budget(1, 103, grows=True),
+    "query:quote": Budget(4, 6),
+    "query:salesSummary": Budget(1, 6, grows=True),
+    "query:search": Budget(5, 32, grows=True),
+    "query:productsConnection": Budget(1, 11),
+    "query:customersConnection": Budget(1, 11),
+    "query:ordersConnection": Budget(2, 41),
+    "query:orderItemsConnection": Budget(1, 11),
+    "query:customerSpecificPricesConnection": Budget(1, 11),
+    # GraphQL mutations
+    "mutation:createProduct": Budget(1, 0),
+    "mutation:updateProduct": Budget(2, 1),
+    "mutation:bulkUpsertProducts": Budget(3, 0),
+    "mutation:deleteProduct": Budget(5, 1),
+    "mutation:createOrder": Budget(16, 10),
+    "mutation:createOrders": Budget(16, 13),
+    "mutation:deleteOrder": Budget(13, 8),
+    "mutation:duplicateOrder": Budget(15, 8),
+    "mutation:updateOrder": Budget(21, 15),
+    "mutation:createCustomer": Budget(2, 1),
+    "mutation:updateCustomer": Budget(2, 1),
+    "mutation:deleteCustomer": Budget(18, 9),
+    "mutation:createCompany": Budget(1, 0),
+    "mutation:updateCompany": Budget(2, 1),
+    "mutation:deleteCompany": Budget(21, 9),
+    # REST API
+    "api:api-root": Budget(0, 0),
+    "api:product-list": Budget(1, 11),
+    "api:product-list:post": Budget(3, 0),
+    "api:product-detail": Budget(1, 1),
+    "api:product-detail:patch": Budget(3, 1),
+    "api:product-detail:delete": Budget(5, 1),
+    "api:customer-list": Budget(1, 11),
+    "api:customer-list:post": Budget(3, 1),
+    "api:customer-detail": Budget(1, 1),
+    "api:customer-detail:put": Budget(4, 2),
+    "api:customer-detail:delete": Budget(18, 9),
+    "api:order-list": Budget(2, 41),
+    "api:order-list:post": Budget(16, 11),
+    "api:order-detail": Budget(2, 3),
+    "api:order-detail:put": Budget(20, 15),
+    "api:order-detail:delete": Budget(14, 10),
+    "api:create_order:post": Budget(16, 7),
+    "api:search": Budget(5, 32, grows=True),
+    # HTML views
+    "html:home": Budget(0, 0),
+    "html:product_list": Budget(1, 27, grows=True),
+    "html:add_product": Budget(0, 0),
+    "html:add_product:post": Budget(3, 0),
+    "html:product_detail": Budget(1, 1),
+    "html:product_detail:json": Budget(1, 1),
+    "html:update_product": Budget(1, 1),
+    "html:update_product:post": Budget(4, 1),
+    "html:duplicate_product": Budget(1, 1),
+    "html:duplicate_product:post": Budget(2, 1),
+    "html:delete_product": Budget(1, 1),
+    "html:delete_product:post": Budget(5, 1),
+    "html:customer_list": Budget(1, 20, grows=True),
+    "html:add_customer": Budget(3, 13, grows=True),
+    "html:add_customer:post": Budget(4, 2),
+    "html:customer_detail": Budget(1, 1),
+    "html:update_customer": Budget(4, 14, grows=True),
+    "html:update_customer:post": Budget(5, 3),
+    "html:duplicate_customer": Budget(1, 1),
+    "html:duplicate_customer:post": Budget(2, 1),
+    "html:delete_customer": Budget(1, 1),
+    "html:delete_customer:post": Budget(18, 9),
+    "html:order_list": Budget(3, 172, grows=True),
+    "html:add_order": Budget(4, 101, grows=True),
+    "html:add_order:post": Budget(16, 7),
+    "html:order_detail": Budget(5, 6),
+    "html:duplicate_order": Budget(1, 1),
+    "html:duplicate_order:post": Budget(16, 10),
+    "html:update_order": Budget(6, 104, grows=True),
+    "html:update_order:post": Budget(28, 26),
+    "html:delete_order": Budget(1, 1),
+    "html:delete_order:post": Budget(13, 8),
+    "html:export_orders_csv": Budget(1, 103, grows=True),
+    "html:export_orders_ndjson": Budget(1, 219, grows=True),
+    "html:customer_price_list": Budget(1, 25, grows=True),
+    "html:customer_price_detail": Budget(1, 1),
+    "html:company_list": Budget(1, 6, grows=True),
+    "html:add_company": Budget(0, 0),
+    "html:add_company:post": Budget(2, 0),
+    "html:update_company": Budget(1, 1),
+    "html:update_company:post": Budget(3, 1),
+    "html:delete_company": Budget(1, 1),
+    "html:delete_company:post": Budget(21, 9),
+    "html:company_detail": Budget(1, 1),
+}
+
+# Rows generated before each case, doubled by `QueryBudgetTestCase.double`
+DATASET = {"companies": 4, "customers": 16, "products": 24, "orders": 40}
+
+_measured = {}
+
+
+class QueryCounter:
+    """
+    Execute wrapper counting the statements run and the rows returned by
+    SELECTs, the latter with a COUNT(*) over the same statement on a bare
+    cursor (not seen by the wrappers or connection.queries).
+    """
+
+    def __init__(self):
+        self.statements = []
+        self.rows = 0
+
+    @property
+    def queries(self):
+        return len(self.statements)
+
+    def __call__(self, execute, sql, params, many, context):
+        result = execute(sql, params, many, context)
+        self.statements.append(sql)
+        if not many and sql.lstrip()[:6].upper() == "SELECT":
+            cursor = context["connection"].create_cursor()
+            try:
+                cursor.execute(f"SELECT COUNT(*) FROM ({sql}) counted", params)
+                self.rows += cursor.fetchone()[0]
+            finally:
+                cursor.close()
+        return result
+
+
+def tearDownModule():
+    path = os.environ.get("QUERY_BUDGET_REPORT")
+    if not path or not _measured:
+        return
+    try:
+        with open(path, encoding="utf-8") as f:
+            previous = json.load(f)
+    except FileNotFoundError:
+        previous = {}
+    changes = [
+        f"  {name}: " + ", ".join(
+            f"{key} {previous[name].get(key)} -> {value}"
+            for key, value in measured.items() if previous[name].get(key) != value
+        )
+        for name, measured in sorted(_measured.items())
+        if name in previous and previous[name] != measured
+    ]
+    if changes:
+        sys.stderr.write("\nQuery budget changes since the last run:\n" + "\n".join(changes) + "\n")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({**previous, **_measured}, f, indent=2, sort_keys=True)
+
+
+class QueryBudgetTestCase(GraphQLTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        dataset.generate(seed=1, **DATASET)
+        cls.add_prices()
+
+    @classmethod
+    def add_prices(cls):
+        tier, _ = CustomerTier.objects.get_or_create(name="Gold", defaults={"discount_percentage": 10})
+        customer_ids = list(Customer.objects.order_by("pk").values_list("pk", flat=True))
+        Customer.objects.filter(tier=None, pk__in=customer_ids[::3]).update(tier=tier)
+        products = list(Product.objects.order_by("pk")[:5])
+        CustomerSpecificPrice.objects.bulk_create(
+            [
+                CustomerSpecificPrice(customer=customer, product=product, custom_price=product.base_price - 1)
+                for customer in Customer.objects.filter(pk__in=customer_ids[::4])
+                for product in products
+            ],
+            ignore_conflicts=True,
+        )
+
+    def double(self):
+        dataset.generate(
+            seed=2,
+            companies=Company.objects.count(),
+            customers=Customer.objects.count(),
+            products=Product.objects.count(),
+            orders=Order.objects.count(),
+        )
+        self.add_prices()
+
+    def measure(self, request, setup):
+        # Always measure cold caches
+        cache.clear()
+        pricing.invalidate()
+        # Test transactions never commit, so on_commit work (the rollup
+        # refresh) would pile up between requests: run it like a commit would,
+        # after dropping whatever earlier rolled back tests left pending
+        rollups._flush()
+        with self.captureOnCommitCallbacks(execute=True):
+            target = setup() if setup else None
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter), self.captureOnCommitCallbacks(execute=True):
+            response = request(target) if setup else request()
+            # Streaming responses run their queries while being consumed
+            content = b"".join(response.streaming_content) if response.streaming else response.content
+        self.assertLess(response.status_code, 400, content[:500])
+        if response.get("Content-Type", "").startswith("application/json"):
+            self.assertNotIn("errors", json.loads(content), content[:500])
+        return counter
+
+    def assertWithinBudget(self, name, request, setup=None):
+        """
+        Runs `request()` (or `request(setup())`, setup not measured) at the
+        dataset size and at twice it, and checks both against BUDGETS[name].
+        """
+        budget = BUDGETS[name]
+        measured = self.measure(request, setup)
+        self.double()
+        doubled = self.measure(request, setup)
+        queries, rows = measured.queries, measured.rows
+        _measured[name] = {
+            "queries": queries, "rows": rows, "doubled_queries": doubled.queries, "doubled_rows": doubled.rows,
+        }
+
+        statements = "\n".join(measured.statements)
+        self.assertLessEqual(queries, budget.queries, f"{name}: {queries} queries, budget {budget.queries}\n{statements}")
+        self.assertLessEqual(rows, budget.rows, f"{name}: {rows} rows, budget {budget.rows}")
+        self.assertLessEqual(
+            doubled.queries, queries,
+            f"{name}: {queries} queries grew to {doubled.queries} with twice the data\n"
+            + "\n".join(sql for sql in doubled.statements if sql not in measured.statements),
+        )
+        # The generated data is random, allow some noise: bounded results stay
+        # well under 2x, results proportional to the data well under 4x
+        self.assertLessEqual(
+            doubled.rows, rows * (3 if budget.grows else 1.5),
+            f"{name}: {rows} rows grew to {doubled.rows} with twice the data",
+        )
+
+    def new_customer(self, company=None):
+        """A customer with one order and one specific price, so deleting it cascades the same way every time."""
+        number = Customer.objects.count()
+        customer = Customer.objects.create(
+            name=f"New customer {number}", email=f"new{number}@example.com", company=company or self.customers[0].company
+        )
+        self.create_order(customer)
+        CustomerSpecificPrice.objects.create(customer=customer, product=self.products[0], custom_price=1)
+        return customer
+
+    def new_company(self):
+        company = Company.objects.create(name=f"New company {Company.objects.count()}", business_line="Retail", state="CDMX")
+        self.new_customer(company)
+        return company
+
+    def post_graphql(self, query):
+        return self.client.post("/gql", data=json.dumps({"query": query}), content_type="application/json")
+
+    def post_json(self, path, data):
+        return self.client.post(path, data=json.dumps(data), content_type="application/json")
+
+
+class BudgetCoverageTests(TestCase):
+    def test_every_operation_and_route_has_a_budget(self):
+        from . import api_urls, urls
+        from .graphql.mutations import Mutation
+        from .graphql.queries import Query
+
+        expected = {
+            f"{kind}:{to_camel_case(field.python_name)}"
+            for kind, operations in (("query", Query), ("mutation", Mutation))
+            for field in operations.__strawberry_definition__.fields
+        }
+        expected |= {f"html:{pattern.name}" for pattern in urls.urlpatterns}
+        expected |= {f"api:{pattern.name}" for pattern in api_urls.urlpatterns if getattr(pattern, "name", None)}
+        expected |= {f"api:{pattern.name}" for pattern in api_urls.router.urls}
+        covered = {":".join(name.split(":")[:2]) for name in BUDGETS}
+        self.assertEqual(expected - covered, set(), "Operations and routes without a query budget")
+
+
+class GraphQLQueryBudgetTests(QueryBudgetTestCase):
+    def query(self, name, query):
+        self.assertWithinBudget(f"query:{name}", lambda: self.post_graphql(query))
+
+    def test_companies(self):
+        self.query("companies", "{ companies { name businessLine customers { name email } } }")
+
+    def test_company(self):
+        self.assertWithinBudget(
+            "query:company",
+            lambda company: self.post_graphql('{ company(id: "%s") { name customers { name } } }' % company.pk),
+            setup=lambda: Company.objects.order_by("pk").first(),
+        )
+
+    def test_products(self):
+        self.query("products", "{ products { sku name basePrice } }")
+
+    def test_product(self):
+        self.query("product", '{ product(sku: "SKU-1") { name basePrice } }')
+
+    def test_customers(self):
+        self.query("customers", QueryOptimizerTests.NESTED)
+
+    def test_customer(self):
+        self.assertWithinBudget(
+            "query:customer",
+            lambda customer: self.post_graphql(
+                '{ customer(id: "%s") { name company { name } orders { resolveTotalPrice } } }' % customer.pk
+            ),
+            setup=lambda: Customer.objects.order_by("pk").first(),
+        )
+
+    def test_customer_tiers(self):
+        self.query("customerTiers", "{ customerTiers { name discountPercentage } }")
+
+    def test_customer_specific_prices(self):
+        self.query(
+            "customerSpecificPrices",
+            "{ customerSpecificPrices { customPrice customer { name } product { sku } } }",
+        )
+
+    def test_orders(self):
+        self.query("orders", "{ orders { resolveTotalPrice customer { name } items { quantity product { sku } } } }")
+
+    def test_order(self):
+        self.assertWithinBudget(
+            "query:order",
+            lambda order: self.post_graphql(
+                '{ order(id: "%s") { resolveTotalPrice items { quantity product { sku } } } }' % order.pk
+            ),
+            setup=lambda: Order.objects.order_by("pk").first(),
+        )
+
+    def test_order_items(self):
+        self.query("orderItems", "{ orderItems { quantity price resolveTotalPrice } }")
+
+    def test_quote(self):
+        self.assertWithinBudget(
+            "query:quote",
+            lambda customer: self.post_graphql(
+                '{ quote(customerId: "%s", items: [{product: "%s", quantity: 2}, {product: "%s", quantity: 1}]) '
+                '{ total lines { unitPrice lineTotal product { sku } } } }'
+                % (customer.pk, self.products[0].pk, self.products[1].pk)
+            ),
+            setup=lambda: Customer.objects.exclude(tier=None).order_by("pk").first(),
+        )
+
+    def test_sales_summary(self):
+        self.query("salesSummary", "{ salesSummary(groupBy: COMPANY) { key label revenue units orderCount } }")
+
+    def test_search(self):
+        self.query("search", '{ search(term: "dog") { ... on ProductType { sku } ... on CustomerType { name } } }')
+
+    def test_products_connection(self):
+        self.query("productsConnection", "{ productsConnection(first: 10) { edges { node { sku name } } } }")
+
+    def test_customers_connection(self):
+        self.query(
+            "customersConnection", "{ customersConnection(first: 10) { edges { node { name company { name } } } } }"
+        )
+
+    def test_orders_connection(self):
+        self.query(
+            "ordersConnection",
+            "{ ordersConnection(first: 10) { edges { node { customer { name } items { quantity product { sku } } } } } }",
+        )
+
+    def test_order_items_connection(self):
+        self.query(
+            "orderItemsConnection",
+            "{ orderItemsConnection(first: 10) { edges { node { quantity product { sku } order { id } } } } }",
+        )
+
+    def test_customer_specific_prices_connection(self):
+        self.query(
+            "customerSpecificPricesConnection",
+            "{ customerSpecificPricesConnection(first: 10) "
+            "{ edges { node { customPrice customer { name } product { sku } } } } }",
+        )
+
+
+class GraphQLMutationBudgetTests(QueryBudgetTestCase):
+    def mutation(self, name, mutation, setup=None):
+        def request(*target):
+            response = self.post_graphql(mutation(*target) if setup else mutation)
+            result = response.json()["data"][name]
+            self.assertTrue(result["success"], result)
+            return response
+
+        self.assertWithinBudget(f"mutation:{name}", request, setup=setup)
+
+    def new_product(self):
+        number = Product.objects.count()
+        return Product.objects.create(name=f"New product {number}", sku=f"NEW-{number}", base_price=10)
+
+    def new_order(self):
+        return self.create_order(self.customers[0])
+
+    def test_create_product(self):
+        self.mutation(
+            "createProduct",
+            lambda number: 'mutation { createProduct(name: "P%d", sku: "NEW-%d", basePrice: 5) { success product { id } } }'
+            % (number, number),
+            setup=Product.objects.count,
+        )
+
+    def test_update_product(self):
+        self.mutation(
+            "updateProduct",
+            lambda product: 'mutation { updateProduct(id: "%s", name: "Renamed %s") { success } }' % (product.pk, product.pk),
+            setup=self.new_product,
+        )
+
+    def test_bulk_upsert_products(self):
+        self.mutation(
+            "bulkUpsertProducts",
+            'mutation { bulkUpsertProducts(products: [{sku: "SKU-1", name: "Product 1", basePrice: 12}, '
+            '{sku: "UPSERT-1", name: "Upserted", basePrice: 3}]) { success count } }',
+        )
+
+    def test_delete_product(self):
+        self.mutation(
+            "deleteProduct",
+            lambda product: 'mutation { deleteProduct(id: "%s") { success } }' % product.pk,
+            setup=self.new_product,
+        )
+
+    def test_create_order(self):
+        self.mutation(
+            "createOrder",
+            'mutation { createOrder(customerId: "%s", items: [{product: "%s", quantity: 2}, {product: "%s", quantity: 1}]) '
+            '{ success order { id } orderItems { id } } }' % (self.customers[0].pk, self.products[0].pk, self.products[1].pk),
+        )
+
+    def test_create_orders(self):
+        items = '[{product: "%s", quantity: 2}, {product: "%s", quantity: 1}]' % (self.products[0].pk, self.products[1].pk)
+        self.mutation(
+            "createOrders",
+            'mutation { createOrders(orders: [{customerId: "%s", items: %s}, {customerId: "%s", items: %s}]) '
+            '{ success orders { id } } }' % (self.customers[0].pk, items, self.customers[1].pk, items),
+        )
+
+    def test_delete_order(self):
+        self.mutation(
+            "deleteOrder",
+            lambda order: 'mutation { deleteOrder(id: "%s") { success } }' % order.pk,
+            setup=self.new_order,
+        )
+
+    def test_duplicate_order(self):
+        self.mutation(
+            "duplicateOrder",
+            lambda order: 'mutation { duplicateOrder(id: "%s") { success order { id } orderItems { id } } }' % order.pk,
+            setup=self.new_order,
+        )
+
+    def test_update_order(self):
+        self.mutation(
+            "updateOrder",
+            lambda order: 'mutation { updateOrder(id: "%s", items: [{product: "%s", quantity: 5}, {product: "%s", quantity: 1}]) '
+            '{ success } }' % (order.pk, self.products[0].pk, self.products[2].pk),
+            setup=self.new_order,
+        )
+
+    def test_create_customer(self):
+        self.mutation(
+            "createCustomer",
+            lambda number: 'mutation { createCustomer(name: "C%d", email: "new%d@example.com", companyId: "%s") '
+            '{ success customer { id } } }' % (number, number, self.customers[0].company_id),
+            setup=Customer.objects.count,
+        )
+
+    def test_update_customer(self):
+        self.mutation(
+            "updateCustomer",
+            lambda customer: 'mutation { updateCustomer(id: "%s", name: "Renamed") { success } }' % customer.pk,
+            setup=lambda: self.customers[0],
+        )
+
+    def test_delete_customer(self):
+        self.mutation(
+            "deleteCustomer",
+            lambda customer: 'mutation { deleteCustomer(id: "%s") { success } }' % customer.pk,
+            setup=self.new_customer,
+        )
+
+    def test_create_company(self):
+        self.mutation(
+            "createCompany",
+            lambda number: 'mutation { createCompany(name: "New company %d", businessLine: "Retail", state: "CDMX") '
+            '{ success company { id } } }' % number,
+            setup=Company.objects.count,
+        )
+
+    def test_update_company(self):
+        self.mutation(
+            "updateCompany",
+            lambda company: 'mutation { updateCompany(id: "%s", state: "Jalisco") { success } }' % company.pk,
+            setup=lambda: Company.objects.order_by("pk").first(),
+        )
+
+    def test_delete_company(self):
+        self.mutation(
+            "deleteCompany",
+            lambda company: 'mutation { deleteCompany(id: "%s") { success } }' % company.pk,
+            setup=self.new_company,
+        )
+
+
+class RestBudgetTests(QueryBudgetTestCase):
+    def order_payload(self, quantity=2):
+        return {
+            "customer": self.customers[0].pk,
+            "items": [
+                {"product": self.products[0].pk, "quantity": quantity, "price": "10.00"},
+                {"product": self.products[1].pk, "quantity": 1, "price": "11.00"},
+            ],
+        }
+
+    def test_api_root(self):
+        self.assertWithinBudget("api:api-root", lambda: self.client.get("/api/"))
+
+    def test_product_list(self):
+        self.assertWithinBudget("api:product-list", lambda: self.client.get("/api/products/", {"page_size": 10}))
+
+    def test_product_create(self):
+        self.assertWithinBudget(
+            "api:product-list:post",
+            lambda number: self.post_json("/api/products/", {"name": f"P{number}", "sku": f"NEW-{number}", "base_price": "5.00"}),
+            setup=Product.objects.count,
+        )
+
+    def test_product_detail(self):
+        self.assertWithinBudget("api:product-detail", lambda: self.client.get("/api/products/SKU-1/"))
+
+    def test_product_update(self):
+        self.assertWithinBudget(
+            "api:product-detail:patch",
+            lambda: self.client.patch("/api/products/SKU-1/", data={"name": "Renamed"}, content_type="application/json"),
+        )
+
+    def test_product_delete(self):
+        self.assertWithinBudget(
+            "api:product-detail:delete",
+            lambda product: self.client.delete(f"/api/products/{product.sku}/"),
+            setup=lambda: Product.objects.create(name=f"Doomed {Product.objects.count()}", sku=f"DOOMED-{Product.objects.count()}", base_price=1),
+        )
+
+    def test_customer_list(self):
+        self.assertWithinBudget("api:customer-list", lambda: self.client.get("/api/customers/", {"page_size": 10}))
+
+    def test_customer_create(self):
+        self.assertWithinBudget(
+            "api:customer-list:post",
+            lambda number: self.post_json(
+                "/api/customers/", {"name": f"C{number}", "email": f"new{number}@example.com", "company": self.customers[0].company_id}
+            ),
+            setup=Customer.objects.count,
+        )
+
+    def test_customer_detail(self):
+        self.assertWithinBudget("api:customer-detail", lambda: self.client.get(f"/api/customers/{self.customers[0].pk}/"))
+
+    def test_customer_update(self):
+        customer = self.customers[0]
+        self.assertWithinBudget(
+            "api:customer-detail:put",
+            lambda: self.client.put(
+                f"/api/customers/{customer.pk}/",
+                data={"name": "Renamed", "email": customer.email, "company": customer.company_id},
+                content_type="application/json",
+            ),
+        )
+
+    def test_customer_delete(self):
+        self.assertWithinBudget(
+            "api:customer-detail:delete",
+            lambda customer: self.client.delete(f"/api/customers/{customer.pk}/"),
+            setup=self.new_customer,
+        )
+
+    def test_order_list(self):
+        self.assertWithinBudget("api:order-list", lambda: self.client.get("/api/orders/", {"page_size": 10}))
+
+    def test_order_create(self):
+        self.assertWithinBudget("api:order-list:post", lambda: self.post_json("/api/orders/", self.order_payload()))
+
+    def test_order_detail(self):
+        order = Order.objects.order_by("pk").first()
+        self.assertWithinBudget("api:order-detail", lambda: self.client.get(f"/api/orders/{order.pk}/"))
+
+    def test_order_update(self):
+        self.assertWithinBudget(
+            "api:order-detail:put",
+            lambda order: self.client.put(
+                f"/api/orders/{order.pk}/", data=self.order_payload(quantity=5), content_type="application/json"
+            ),
+            setup=lambda: self.create_order(self.customers[0]),
+        )
+
+    def test_order_delete(self):
+        self.assertWithinBudget(
+            "api:order-detail:delete",
+            lambda order: self.client.delete(f"/api/orders/{order.pk}/"),
+            setup=lambda: self.create_order(self.customers[0]),
+        )
+
+    def test_create_order_view(self):
+        payload = {"customer": self.customers[0].pk, "items": [{"product": self.products[0].pk, "quantity": 2}]}
+        self.assertWithinBudget("api:create_order:post", lambda: self.post_json("/api/orders/create/", payload))
+
+    def test_search(self):
+        self.assertWithinBudget("api:search", lambda: self.client.get("/api/search/", {"q": "dog"}))
+
+
+class HtmlBudgetTests(QueryBudgetTestCase):
+    def get(self, name, *args, setup=None):
+        """GETs `name` with `args`, or with the primary key `setup()` returns."""
+        self.assertWithinBudget(
+            f"html:{name}", lambda *target: self.client.get(reverse(name, args=target or args)), setup=setup
+        )
+
+    def post(self, name, data=None, args=(), setup=None):
+        """
+        POSTs `data` to `name`. With `setup`, its result is passed to `args`
+        and `data` when they are callables.
+        """
+        self.assertWithinBudget(
+            f"html:{name}:post",
+            lambda *target: self.client.post(
+                reverse(name, args=args(*target) if callable(args) else args),
+                (data(*target) if callable(data) else data) or {},
+            ),
+            setup=setup,
+        )
+
+    def order_formset(self, order=None, items=()):
+        data = {
+            "customer": self.customers[1].pk,
+            "items-TOTAL_FORMS": str(len(items) + 1),
+            "items-INITIAL_FORMS": str(len(items)),
+            "items-MIN_NUM_FORMS": "0",
+            "items-MAX_NUM_FORMS": "1000",
+        }
+        for index, item in enumerate(items):
+            data.update({
+                f"items-{index}-id": item.pk, f"items-{index}-order": order.pk, f"items-{index}-product": item.product_id,
+                f"items-{index}-quantity": item.quantity + 1, f"items-{index}-price": item.price,
+            })
+        index = len(items)
+        data.update({
+            f"items-{index}-product": self.products[2].pk, f"items-{index}-quantity": "1", f"items-{index}-price": "12.00",
+        })
+        return data
+
+    def edit_order_formset(self, order):
+        return order.pk, self.order_formset(order, list(order.items.order_by("pk")))
+
+    def new_product(self):
+        number = Product.objects.count()
+        return Product.objects.create(name=f"New product {number}", sku=f"NEW-{number}", base_price=10)
+
+    def test_home(self):
+        self.get("home")
+
+    def test_product_list(self):
+        self.get("product_list")
+
+    def test_add_product(self):
+        self.get("add_product")
+        self.post(
+            "add_product",
+            data=lambda number: {"name": f"P{number}", "sku": f"NEW-{number}", "base_price": "5.00"},
+            setup=Product.objects.count,
+        )
+
+    def test_product_detail(self):
+        self.get("product_detail", "SKU-1")
+        self.assertWithinBudget(
+            "html:product_detail:json",
+            lambda: self.client.get(reverse("product_detail", args=["SKU-1"]), headers={"Accept": "application/json"}),
+        )
+
+    def test_update_product(self):
+        self.get("update_product", "SKU-1")
+        self.post(
+            "update_product",
+            data={"name": "Renamed", "sku": "SKU-1", "base_price": "12.00"},
+            args=["SKU-1"],
+        )
+
+    def test_duplicate_product(self):
+        self.get("duplicate_product", "SKU-1")
+        self.post("duplicate_product", args=lambda sku: [sku], setup=lambda: self.new_product().sku)
+
+    def test_delete_product(self):
+        self.get("delete_product", "SKU-1")
+        self.post("delete_product", args=lambda sku: [sku], setup=lambda: self.new_product().sku)
+
+    def test_customer_list(self):
+        self.get("customer_list")
+
+    def test_add_customer(self):
+        self.get("add_customer")
+        self.post(
+            "add_customer",
+            data=lambda number: {"name": f"C{number}", "email": f"new{number}@example.com", "company": self.customers[0].company_id},
+            setup=Customer.objects.count,
+        )
+
+    def test_customer_detail(self):
+        self.get("customer_detail", self.customers[0].pk)
+
+    def test_update_customer(self):
+        customer = self.customers[0]
+        self.get("update_customer", customer.pk)
+        self.post(
+            "update_customer",
+            data={"name": "Renamed", "email": customer.email, "company": customer.company_id},
+            args=[customer.pk],
+        )
+
+    def test_duplicate_customer(self):
+        customer = Customer.objects.get(pk=self.customers[0].pk)
+        self.get("duplicate_customer", customer.pk)
+        self.post("duplicate_customer", args=[customer.pk])
+        # Once per dataset size
+        copies = Customer.objects.filter(name=f"Copy of {customer.name}")
+        self.assertEqual(
+            [(copy.company_id, copy.tier_id, copy.email) for copy in copies], [(customer.company_id, customer.tier_id, None)] * 2
+        )
+
+    def test_delete_customer(self):
+        self.get("delete_customer", self.customers[0].pk)
+        self.post(
+            "delete_customer",
+            args=lambda pk: [pk],
+            setup=lambda: self.new_customer().pk,
+        )
+
+    def test_order_list(self):
+        self.get("order_list")
+
+    def test_add_order(self):
+        self.get("add_order")
+        self.post("add_order", data=self.order_formset())
+
+    def test_order_detail(self):
+        self.get("order_detail", setup=lambda: self.create_order(self.customers[0]).pk)
+
+    def test_duplicate_order(self):
+        self.get("duplicate_order", setup=lambda: self.create_order(self.customers[0]).pk)
+        self.post("duplicate_order", args=lambda pk: [pk], setup=lambda: self.create_order(self.customers[0]).pk)
+
+    def test_update_order(self):
+        self.get("update_order", setup=lambda: self.create_order(self.customers[0]).pk)
+        self.post(
+            "update_order",
+            # The form data is built in setup, outside the measured request
+            data=lambda target: target[1],
+            args=lambda target: [target[0]],
+            setup=lambda: self.edit_order_formset(self.create_order(self.customers[0])),
+        )
+
+    def test_delete_order(self):
+        self.get("delete_order", setup=lambda: self.create_order(self.customers[0]).pk)
+        self.post("delete_order", args=lambda pk: [pk], setup=lambda: self.create_order(self.customers[0]).pk)
+
+    def test_export_orders(self):
+        self.get("export_orders_csv")
+        self.get("export_orders_ndjson")
+
+    def test_customer_price_list(self):
+        self.get("customer_price_list")
+
+    def test_customer_price_detail(self):
+        self.get("customer_price_detail", CustomerSpecificPrice.objects.order_by("pk").first().pk)
+
+    def test_company_list(self):
+        self.get("company_list")
+
+    def test_add_company(self):
+        self.get("add_company")
+        self.post(
+            "add_company",
+            data=lambda number: {"name": f"New company {number}", "business_line": "Retail", "state": "CDMX"},
+            setup=Company.objects.count,
+        )
+
+    def test_company_detail(self):
+        self.get("company_detail", self.customers[0].company_id)
+
+    def test_update_company(self):
+        company_id = self.customers[0].company_id
+        self.get("update_company", company_id)
+        self.post(
+            "update_company", data={"name": "Renamed", "business_line": "Retail", "state": "CDMX"}, args=[company_id]
+        )
+
+    def test_delete_company(self):
+        self.get("delete_company", self.customers[0].company_id)
+        self.post("delete_company", args=lambda pk: [pk], setup=lambda: self.new_company().pk)
+
+
+class InstrumentationTests(GraphQLTestCase):
+    @override_settings(INSTRUMENTATION_TRACING_IN_RESPONSE=True)
+    def test_only_resolvers_are_timed(self):
+        query = "{ orders { id items { quantity resolveTotalPrice } } }"
+        response = self.client.post("/gql", data=json.dumps({"query": query}), content_type="application/json")
+        tracing = response.json()["extensions"]["tracing"]
+        timed = {resolver["field"]: resolver["count"] for resolver in tracing["resolvers"]}
+        self.assertEqual(timed, {"Query.orders": 1, "OrderType.items": 4, "OrderItemType.resolveTotalPrice": 8})
+
+
+class ProfilingTests(GraphQLTestCase):
+    def setUp(self):
+        super().setUp()
+        reports = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, reports, ignore_errors=True)
+        settings_override = override_settings(PROFILING_DIR=Path(reports) / "profiles")
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.staff = CustomUser.objects.create(username="staff", email="staff@example.com", is_staff=True)
+
+    def report(self, response):
+        name = response["X-Profile-Report"]
+        return json.loads((profiling.report_dir() / f"{name}.json").read_text()), name
+
+    def test_signed_header_profiles_the_request(self):
+        response = self.client.get("/api/products/", headers={"X-Profile": profiling.make_token()})
+        report, name = self.report(response)
+        self.assertEqual((report["mode"], report["route"], report["status"]), ("cprofile", "product-list", 200))
+        self.assertEqual(report["sql_count"], len(report["sql"]))
+        self.assertIn("cotizador_product", report["sql"][-1]["sql"])
+        self.assertTrue((profiling.report_dir() / f"{name}.prof").exists())
+        stacks = (profiling.report_dir() / f"{name}.collapsed.txt").read_text().splitlines()
+        self.assertTrue(stacks)
+        self.assertEqual([line for line in stacks if not line.startswith("_call (backend/profiling.py")], [])
+
+    def test_sampling_graphql(self):
+        response = self.client.post(
+            "/gql",
+            data=json.dumps({"query": "query Products { products { sku } }", "operationName": "Products"}),
+            content_type="application/json",
+            headers={"X-Profile": profiling.make_token("sampling")},
+        )
+        report, name = self.report(response)
+        self.assertEqual((report["mode"], report["operation"]), ("sampling", "Products"))
+        self.assertFalse((profiling.report_dir() / f"{name}.prof").exists())
+
+    def test_not_profiled_without_a_valid_trigger(self):
+        bad_signature = profiling.make_token()[:-1] + "x"
+        self.assertNotIn("X-Profile-Report", self.client.get("/api/products/", headers={"X-Profile": bad_signature}))
+        # The query flag is for staff only
+        self.assertNotIn("X-Profile-Report", self.client.get("/api/products/?__profile"))
+        self.client.force_login(CustomUser.objects.create(username="user", email="user@example.com"))
+        self.assertNotIn("X-Profile-Report", self.client.get("/api/products/?__profile"))
+        self.assertFalse(profiling.report_dir().exists())
+
+    def test_unwritable_report_dir(self):
+        # A file where the directory should be, like a read-only filesystem
+        profiling.report_dir().parent.mkdir(parents=True, exist_ok=True)
+        profiling.report_dir().touch()
+        with self.assertLogs("backend.profiling", "ERROR"):
+            response = self.client.get("/api/products/", headers={"X-Profile": profiling.make_token()})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("X-Profile-Report", response)
+
+    def test_staff_flag_and_admin_pages(self):
+        self.client.force_login(self.staff)
+        report, name = self.report(self.client.get(reverse("product_list") + "?__profile=sampling"))
+        self.assertEqual((report["mode"], report["user"]), ("sampling", "staff"))
+
+        self.assertContains(self.client.get("/admin/profiles/"), name)
+        self.assertContains(self.client.get(f"/admin/profiles/{name}/"), "Hottest functions")
+        response = self.client.get(f"/admin/profiles/{name}/collapsed.txt")
+        self.assertEqual(response["Content-Disposition"], f'attachment; filename="{name}.collapsed.txt"')
+        self.assertEqual(self.client.get(f"/admin/profiles/{name}/prof").status_code, 404)
+        self.assertEqual(self.client.get("/admin/profiles/not-a-report/").status_code, 404)
+
+        self.client.logout()
+        self.assertEqual(self.client.get("/admin/profiles/").status_code, 302)
+
+
+class MetricsTests(GraphQLTestCase):
+    def setUp(self):
+        super().setUp()
+        self.staff = CustomUser.objects.create(username="staff", email="staff@example.com", is_staff=True)
+
+    def value(self, name, labels, field=""):
+        return metrics.snapshot().get((name, labels, field), 0)
+
+    def scrape(self):
+        self.client.force_login(self.staff)
+        response = self.client.get("/metrics")
+        self.client.logout()
+        return response
+
+    def test_routes_and_operations(self):
+        requests = self.value("http_requests_total", ("product-list", "GET", "200"))
+        operations = self.value("graphql_operations_total", ("Products", "query", "success"))
+        errors = self.value("graphql_operations_total", ("anonymous", "unknown", "error"))
+        self.client.get("/api/products/")
+        self.client.post(
+            "/gql",
+            data=json.dumps({"query": "query Products { products { sku } }", "operationName": "Products"}),
+            content_type="application/json",
+        )
+        self.client.post("/gql", data=json.dumps({"query": "{"}), content_type="application/json")
+        self.assertEqual(self.value("http_requests_total", ("product-list", "GET", "200")), requests + 1)
+        self.assertEqual(self.value("graphql_operations_total", ("Products", "query", "success")), operations + 1)
+        self.assertEqual(self.value("graphql_operations_total", ("anonymous", "unknown", "error")), errors + 1)
+
+        response = self.scrape()
+        self.assertEqual(response["Content-Type"], "text/plain; version=0.0.4; charset=utf-8")
+        text = response.content.decode()
+        self.assertIn("# TYPE http_request_duration_seconds histogram", text)
+        self.assertIn('http_request_duration_seconds_bucket{route="product-list",method="GET",le="+Inf"}', text)
+        self.assertIn('graphql_operation_db_queries_count{operation="Products"}', text)
+        self.assertIn('cache_requests_total{cache="graphql_document",result="miss"}', text)
+        self.assertIn("http_requests_in_flight 1", text)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+        self.assertEqual(self.client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code, 401)
+        self.assertEqual(self.client.get("/metrics", headers={"Authorization": "Bearer secret"}).status_code, 200)
+        # Staff sessions don't replace the token
+        self.assertEqual(self.scrape().status_code, 401)
+
+    def test_staff_only_without_a_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 404)
+        self.client.force_login(CustomUser.objects.create(username="user", email="user@example.com"))
+        self.assertEqual(self.client.get("/metrics").status_code, 404)
+        self.assertEqual(self.scrape().status_code, 200)
+        with override_settings(DEBUG=True):
+            self.assertEqual(self.client.get("/metrics").status_code, 200)
+
+    def test_exited_threads_are_retired(self):
+        hits = self.value("cache_requests_total", ("test", "hit"))
+        threads = [threading.Thread(target=metrics.cache_lookup, args=("test",), kwargs={"hits": 2}) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+            thread.join()
+        self.assertEqual(self.value("cache_requests_total", ("test", "hit")), hits + 10)
+        self.assertFalse(any(("cache_requests_total", ("test", "hit"), "") in values for values in metrics._shards.values()))
+
+    def test_multiprocess(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        # A worker that exited: its counters are kept, its gauges dropped
+        with open(os.path.join(directory, "999999999.json"), "w") as file:
+            json.dump({"pid": 999999999, "values": [
+                ["http_requests_total", ["product-list", "GET", "200"], "", 1000],
+                ["http_requests_in_flight", [], "", 7],
+            ]}, file)
+        requests = self.value("http_requests_total", ("product-list", "GET", "200"))
+        with override_settings(METRICS_MULTIPROCESS_DIR=directory):
+            text = self.scrape().content.decode()
+        self.assertTrue(os.path.exists(os.path.join(directory, f"{os.getpid()}.json")))
+        self.assertIn(f'http_requests_total{{route="product-list",method="GET",status="200"}} {requests + 1000:g}', text)
+        self.assertIn("http_requests_in_flight 1\n", text)
@@ -1,19 +1,11 @@
 from django.contrib import admin
 from django.urls import path, include
-from rest_framework.routers import DefaultRouter
-from cotizador.views import ProductViewSet, CustomerViewSet, OrderViewSet, home
+from cotizador.views import home
 from . import views
 
-# DRF Router for ViewSets
-router = DefaultRouter()
-router.register(r'products', ProductViewSet, basename='product')
-router.register(r'customers', CustomerViewSet, basename='customer')
-router.register(r'orders', OrderViewSet, basename='order')
+# API routes (api/) live in api_urls.py and are included lazily by backend/urls.py
 
 urlpatterns = [
-    # API routes
-    path('api/', include(router.urls)),  
-
     # Home route
     path('', home, name='home'),  
     
@@ -40,8 +32,10 @@ urlpatterns = [
     path('orders/<int:pk>/duplicate/', views.duplicate_order, name='duplicate_order'),
     path('orders/<int:pk>/update/', views.update_order, name='update_order'),
     path('orders/<int:pk>/delete/', views.delete_order, name='delete_order'), 
-    #API Order URLS
-    path('api/orders/create/', views.create_order, name='create_order'),  
+
+    # Export URLs
+    path('export/orders.csv', views.export_orders_csv, name='export_orders_csv'),
+    path('export/orders.ndjson', views.export_orders_ndjson, name='export_orders_ndjson'),
 
     # Customer Specific Price URLs
     path('customer-prices/', views.customer_price_list, name='customer_price_list'),
@@ -50,7 +44,7 @@ urlpatterns = [
     #Company URLs
     path('companies/', views.company_list, name='company_list'),
     path('companies/add/', views.add_company, name='add_company'),
-    path('companies/<uuid:pk>/update/', views.update_company, name='update_company'),
-    path('companies/<uuid:pk>/delete/', views.delete_company, name='delete_company'),
-    path('companies/<uuid:pk>/', views.company_detail, name='company_detail'),
+    path('companies/<int:pk>/update/', views.update_company, name='update_company'),
+    path('companies/<int:pk>/delete/', views.delete_company, name='delete_company'),
+    path('companies/<int:pk>/', views.company_detail, name='company_detail'),
 ]
@@ -1,51 +1,21 @@
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_headers
 from django.utils.decorators import method_decorator
-from rest_framework.viewsets import ModelViewSet
-from rest_framework.response import Response
 from django.shortcuts import render, get_object_or_404, redirect, HttpResponse
 from django.forms import inlineformset_factory
-import uuid, json
+from django.db import transaction
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.handlers.asgi import ASGIRequest
+import json
 
 from .models import Product, Customer, Order, OrderItem, CustomerSpecificPrice, Company
-from .serializers import ProductSerializer, CustomerSerializer, OrderSerializer
+from . import catalog_cache, exports, services
 from .forms import CustomerForm, ProductForm, OrderForm, OrderItemForm, CompanyForm
-from rest_framework.exceptions import NotFound
 
 
 
-# Product API ViewSet
-
-class ProductViewSet(ModelViewSet):
-    """
-    A ViewSet for viewing and editing product instances.
-    """
-    queryset = Product.objects.all()
-    serializer_class = ProductSerializer
-    lookup_field = 'sku'  # Use SKU instead of the default ID for lookups
-
-    def retrieve(self, request, *args, **kwargs):
-        # Override to fetch by SKU
-        sku = kwargs.get(self.lookup_field)  # DRF uses `lookup_field` here
-        # print(f"Retrieve called with SKU: {sku}")
-        try:
-            product = Product.objects.get(sku=sku)
-        except Product.DoesNotExist:
-            raise NotFound(f"Product with SKU '{sku}' not found.")
-        serializer = self.get_serializer(product)
-        # print(f"Retrieved Product Data: {serializer.data}")
-        return Response(serializer.data)
-
-# Customer API ViewSet
-class CustomerViewSet(ModelViewSet):
-    queryset = Customer.objects.all()
-    serializer_class = CustomerSerializer
-
-# Order API ViewSet
-class OrderViewSet(ModelViewSet):
-    queryset = Order.objects.prefetch_related('items')  # Optimize queries
-    serializer_class = OrderSerializer
-
 def home(request):
     return render(request, "home.html")
 
@@ -55,15 +25,27 @@ def product_list(request):
     return render(request, "products_list.html", {"products": products})
 
 
+def _product_detail_etag(request, sku):
+    # Only the JSON branch is cached and revalidated
+    if request.headers.get('accept') == 'application/json':
+        return catalog_cache.etag(request, Product)
+    return None
+
+
+@vary_on_headers('Accept')
+@condition(etag_func=_product_detail_etag)
 def product_detail(request, sku):
-    product = get_object_or_404(Product, sku=sku)
     if request.headers.get('accept') == 'application/json':
-        return JsonResponse({
-            "sku": product.sku,
-            "name": product.name,
-            "description": product.description,
-            "base_price": str(product.base_price),
-        })
+        def compute():
+            product = get_object_or_404(Product, sku=sku)
+            return {
+                "sku": product.sku,
+                "name": product.name,
+                "description": product.description,
+                "base_price": str(product.base_price),
+            }
+        return JsonResponse(catalog_cache.get_or_set("product_detail", [Product], compute, sku))
+    product = get_object_or_404(Product, sku=sku)
     return render(request, "product_detail.html", {"product": product})
 
 
@@ -85,7 +67,7 @@ def customer_detail(request, pk):
 #order
 def order_list(request):
     # Fetch all orders and their associated items and products
-    orders = Order.objects.all().select_related('customer').prefetch_related('items__product')  # Optimize the query
+    orders = Order.objects.with_total_price().select_related('customer').prefetch_related('items__product')  # Optimize the query
     
     order_data = []
     for order in orders:
@@ -101,6 +83,7 @@ def order_list(request):
         order_data.append({
             'id': order.id,
             'customer': order.customer.name,
+            'total_price': order.total_price,
             'order_items': items
         })
 
@@ -110,19 +93,50 @@ def order_list(request):
 
 
 
+def _export_orders(request, lines, content_type, filename):
+    """
+    Streams the orders matching the `customer`, `company`, `created_after` and
+    `created_before` query params, see `exports.py`.
+    """
+    filters = {
+        name: request.GET.get(name)
+        for name in ('customer', 'company', 'created_after', 'created_before')
+    }
+    try:
+        rows = exports.export_rows(**filters)
+    except DjangoValidationError as e:
+        return JsonResponse({"error": f"Invalid filter: {' '.join(e.messages)}"}, status=400)
+    except ValueError as e:
+        return JsonResponse({"error": f"Invalid filter: {e}"}, status=400)
+    content = lines(rows)
+    if isinstance(request, ASGIRequest):
+        content = exports.async_lines(content)
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def export_orders_csv(request):
+    return _export_orders(request, exports.csv_lines, 'text/csv', 'orders.csv')
+
+
+def export_orders_ndjson(request):
+    return _export_orders(request, exports.ndjson_lines, 'application/x-ndjson', 'orders.ndjson')
+
+
 def order_detail(request, pk):
-    order = get_object_or_404(Order, pk=pk)
+    order = get_object_or_404(Order.objects.with_total_price(), pk=pk)
     return render(request, "order_detail.html", {"order": order})
 
 
 # Customer Specific Price Views
 def customer_price_list(request):
-    customer_prices = CustomerSpecificPrice.objects.all()
+    customer_prices = CustomerSpecificPrice.objects.select_related('customer', 'product')
     return render(request, "customer_price_list.html", {"customer_prices": customer_prices})
 
 # Customer Price Detail
 def customer_price_detail(request, pk):
-    customer_price = get_object_or_404(CustomerSpecificPrice, pk=pk)
+    customer_price = get_object_or_404(CustomerSpecificPrice.objects.select_related('customer', 'product'), pk=pk)
     return render(request, "customer_price_detail.html", {"customer_price": customer_price})
 
 #Add Customer
@@ -165,9 +179,10 @@ def add_order(request):
         item_formset = OrderItemFormSet(request.POST)
 
         if order_form.is_valid() and item_formset.is_valid():
-            order = order_form.save()  # Save the order
-            item_formset.instance = order
-            item_formset.save()  # Save the associated order items
+            with transaction.atomic():
+                order = order_form.save()  # Save the order
+                item_formset.instance = order
+                item_formset.save()  # Save the associated order items
             return redirect('order_list')
 
     else:
@@ -181,60 +196,49 @@ def add_order(request):
     
 ##Create Order Nextjs
 
+def _validate_order_payload(data):
+    """Returns an error message for an invalid order payload, or None."""
+    if not data.get("customer"):
+        return "Customer is required."
+    items = data.get("items", [])
+    if not items:
+        return "At least one order item is required."
+    for item in items:
+        if not item.get("product") or not item.get("quantity"):
+            return "Each order item must include product and quantity."
+    return None
+
+
 @csrf_exempt
 def create_order(request):
+    """
+    Creates one order from `{"customer": ..., "items": [...]}`, or several at
+    once from `{"orders": [{"customer": ..., "items": [...]}, ...]}`.
+    Items without a "price" get the customer's effective price.
+    """
     if request.method == 'POST':
         try:
             # Parse the incoming JSON payload
             data = json.loads(request.body)
+            orders_data = data["orders"] if "orders" in data else [data]
+
+            for order_data in orders_data:
+                error = _validate_order_payload(order_data)
+                if error:
+                    return JsonResponse({"error": error}, status=400)
 
-            # Validate and retrieve the customer
-            customer_id = data.get("customer")
-            if not customer_id:
-                return JsonResponse({"error": "Customer is required."}, status=400)
+            # Resolve customers/products in bulk and write everything in one transaction
             try:
-                customer = Customer.objects.get(id=customer_id)
-            except Customer.DoesNotExist:
-                return JsonResponse({"error": "Invalid customer ID."}, status=400)
-
-            # Validate order items
-            items = data.get("items", [])
-            if not items:
-                return JsonResponse({"error": "At least one order item is required."}, status=400)
-
-            order_items = []
-            for item in items:
-                product_id = item.get("product")
-                quantity = item.get("quantity")
-                price = item.get("price")
-
-                if not product_id or not quantity or not price:
-                    return JsonResponse({"error": "Each order item must include product, quantity, and price."}, status=400)
-
-                try:
-                    product = Product.objects.get(id=product_id)
-                except Product.DoesNotExist:
-                    return JsonResponse({"error": f"Invalid product ID: {product_id}"}, status=400)
-
-                # Prepare the OrderItem instance
-                order_items.append(OrderItem(
-                    product=product,
-                    quantity=quantity,
-                    price=price
-                ))
-
-            # Create the Order
-            order = Order.objects.create(customer=customer)
-
-            # Associate order items with the order
-            for item in order_items:
-                item.order = order
-
-            # Bulk create order items
-            OrderItem.objects.bulk_create(order_items)
+                created = services.create_orders(orders_data)
+            except Customer.DoesNotExist as e:
+                return JsonResponse({"error": f"Invalid customer ID: {e}"}, status=400)
+            except Product.DoesNotExist as e:
+                return JsonResponse({"error": f"Invalid product ID: {e}"}, status=400)
 
             # Return a success response
-            return JsonResponse({"order_id": order.id}, status=201)
+            if "orders" in data:
+                return JsonResponse({"order_ids": [order.id for order, _ in created]}, status=201)
+            return JsonResponse({"order_id": created[0][0].id}, status=201)
 
         except json.JSONDecodeError:
             return JsonResponse({"error": "Invalid JSON payload."}, status=400)
@@ -285,8 +289,19 @@ def update_order(request, pk):
         formset = OrderItemFormSet(request.POST, instance=order)
 
         if order_form.is_valid() and formset.is_valid():
-            order = order_form.save()
-            formset.save()
+            # The formset describes the complete list of items; only the rows
+            # that changed are written (see services.update_order)
+            items = [
+                {
+                    'id': form.instance.pk,
+                    'product': form.cleaned_data['product'].pk,
+                    'quantity': form.cleaned_data['quantity'],
+                    'price': form.cleaned_data['price'],
+                }
+                for form in formset.forms
+                if form.cleaned_data and not form.cleaned_data.get('DELETE')
+            ]
+            services.update_order(order_form.save(commit=False), items=items)
             return redirect('order_list')
         else:
             print("Order form errors:", order_form.errors)
@@ -337,10 +352,11 @@ def duplicate_customer(request, pk):
         try:
             # Duplicate the customer
             new_customer = Customer.objects.create(
-                id=str(uuid.uuid4()),  # Ensure a unique ID
                 name=f"Copy of {original_customer.name}",
                 email=None,  # Avoid conflicts
                 phone=original_customer.phone,
+                company_id=original_customer.company_id,
+                tier_id=original_customer.tier_id,
             )
             return redirect('update_customer', pk=new_customer.pk)
         except Exception as e: